@@ -0,0 +1,91 @@
+"""Per-guess cost of checking a word against the round, before and after the answer index.
+
+"before" is the old check: a membership test on the revealed set, then
+words_to_hide.count(word) over the title words. "after" looks the guess up
+in the round's AnswerIndex, which also accepts plural and unaccented forms.
+The guesses mix exact hits, plural/singular variants, already revealed words
+and misses.
+
+    python -m benchmarks.answer_index
+    python -m benchmarks.answer_index --rounds 2000 --guesses 50
+"""
+import argparse
+import random
+import time
+
+from src.answers import AnswerIndex
+from src.tokenizer import extract_words
+
+from .fake_shutterstock import DESCRIPTIONS
+
+MISSES = ['zebra', 'violin', 'castle', 'rocket', 'pumpkin', 'glacier', 'lantern', 'bicycle']
+
+
+def legacy_check(words_to_hide, revealed, word):
+    found_count = 0 if word in revealed else words_to_hide.count(word)
+    return found_count
+
+
+def indexed_check(answers, revealed, word):
+    answer = answers.match(word)
+    return 0 if answer is None or answer in revealed else answers.counts[answer]
+
+
+def build_rounds(count, guesses, seed):
+    rng = random.Random(seed)
+    rounds = []
+    for _ in range(count):
+        title_words = extract_words(rng.choice(DESCRIPTIONS))
+        revealed = set(rng.sample(title_words, len(title_words) // 3))
+        round_guesses = []
+        for _ in range(guesses):
+            word = rng.choice(title_words + MISSES)
+            if rng.random() < 0.3:
+                word = word[:-1] if word.endswith('s') else word + 's'
+            round_guesses.append(word)
+        rounds.append((title_words, revealed, round_guesses))
+    return rounds
+
+
+def per_guess(rounds, repeat, prepare, check):
+    best = float('inf')
+    total = sum(len(round_guesses) for _, _, round_guesses in rounds)
+    for _ in range(repeat):
+        prepared = [(prepare(title_words), revealed, round_guesses) for title_words, revealed, round_guesses in rounds]
+        started = time.perf_counter()
+        for hidden, revealed, round_guesses in prepared:
+            for word in round_guesses:
+                check(hidden, revealed, word)
+        best = min(best, time.perf_counter() - started)
+    return best / total * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=1000)
+    parser.add_argument('--guesses', type=int, default=40, help='guesses per round')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rounds = build_rounds(args.rounds, args.guesses, args.seed)
+    before = per_guess(rounds, args.repeat, list, legacy_check)
+    after = per_guess(rounds, args.repeat, AnswerIndex, indexed_check)
+
+    accepted_before = sum(1 for title_words, revealed, guesses in rounds for word in guesses
+                          if legacy_check(title_words, revealed, word))
+    accepted_after = sum(1 for title_words, revealed, guesses in rounds for word in guesses
+                         if indexed_check(AnswerIndex(title_words), revealed, word))
+    started = time.perf_counter()
+    for title_words, _, _ in rounds:
+        AnswerIndex(title_words)
+    build = (time.perf_counter() - started) / len(rounds) * 1e6
+
+    total = args.rounds * args.guesses
+    print(f'before   {before:7.0f} ns per guess, {accepted_before}/{total} guesses accepted')
+    print(f'after    {after:7.0f} ns per guess, {accepted_after}/{total} guesses accepted (plurals count)')
+    print(f'index    {build:7.1f} us to build, once per round')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""Helpers shared by the benchmark scripts"""
+import os
+import tempfile
+
+
+def configure_database(database_url=None):
+    """Point the app at the benchmark database. Must run before importing src.app."""
+    if not database_url:
+        handle, path = tempfile.mkstemp(prefix='spf-bench-', suffix='.db')
+        os.close(handle)
+        database_url = f'sqlite:///{path}'
+    os.environ['DATABASE_URL'] = database_url
+    return database_url
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def sample_image(words):
+    """Image data in the shape process_image() produces"""
+    title = ' '.join(words).capitalize()
+    return {
+        'id': 'bench',
+        'url': 'https://example.com/bench.jpg',
+        'title': title,
+        'title_words': list(words),
+        'easy_mode_hidden_words': [],
+        'contributor': 'Benchmark'
+    }
+
+
+def create_lobby(client, game_mode='free-for-all', difficulty='hard'):
+    client.post('/lobby', data={'game_mode': game_mode, 'difficulty': difficulty})
+    with client.session_transaction() as session:
+        return session['lobby_id']
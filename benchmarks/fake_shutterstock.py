@@ -0,0 +1,174 @@
+"""Local stand-in for the Shutterstock search API.
+
+Serves GET /v2/images/search with generated results built from realistic
+stock-photo descriptions, with optional injected latency and failure rate,
+so benchmarks never touch the real API.
+
+    python -m benchmarks.fake_shutterstock --port 8400 --latency 0.2
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DESCRIPTIONS = [
+    'Young woman hiking on a mountain trail at sunrise with a backpack',
+    'Aerial view of a busy city intersection at night with light trails',
+    'Business team brainstorming around a laptop in a modern office',
+    'Fresh vegetables and herbs on a rustic wooden kitchen table',
+    'Golden retriever puppy playing with a ball in the green grass',
+    'Tropical beach with palm trees and turquoise water under a blue sky',
+    'Close-up of hands typing on a keyboard with a cup of coffee',
+    'Snow-capped mountains reflected in a calm alpine lake',
+    'Happy family having a picnic in the park on a sunny day',
+    'Abstract colorful watercolor background with soft gradients',
+    'Chef preparing pasta in a professional restaurant kitchen',
+    'Red vintage car parked on a street in an old European town',
+    'Businessman shaking hands with a client after a successful meeting',
+    'Field of blooming sunflowers against the evening sunset',
+    'Scientist looking through a microscope in a research laboratory',
+    'Cyclist riding along a coastal road beside the ocean',
+    'Modern glass skyscrapers reflecting the clouds in the financial district',
+    'Cozy living room interior with a sofa, plants and warm lighting',
+    'Elderly couple walking hand in hand along an autumn forest path',
+    'Children building a sandcastle on the beach during summer vacation',
+    'Doctor talking with a patient in a bright hospital room',
+    'Bowl of fresh fruit salad with strawberries, kiwi and blueberries',
+    'Wild elephant herd crossing the African savanna at dusk',
+    'Soccer player kicking the ball during a stadium match',
+    'Hot air balloons floating over a valley at dawn',
+    'Barista pouring latte art into a ceramic cup at a cafe',
+    'Students studying together in a university library',
+    'Night sky full of stars over a desert landscape with a lone tree',
+    'Yoga instructor meditating on a wooden deck by the lake',
+    'Colorful market stall selling spices in a Moroccan bazaar',
+    'Waves crashing against rocky cliffs on a stormy day',
+    'Farmer driving a tractor through a golden wheat field',
+    'Woman shopping for clothes in a boutique with paper bags',
+    'Steaming bowl of ramen noodles with egg and green onions',
+    'Lighthouse on a rocky coast under a dramatic cloudy sky',
+    'Teenagers skateboarding in an urban skate park',
+    'Autumn leaves falling in a quiet city park with benches',
+    'Software developer working on code with multiple monitors',
+    'Bride and groom dancing at an outdoor wedding reception',
+    'Close-up portrait of a tabby cat with green eyes'
+]
+
+
+def fake_image(rng, query):
+    image_id = str(rng.randrange(10 ** 9, 10 ** 10))
+    assets = {size: {'url': f'https://image.example.com/{size}/{image_id}.jpg'}
+              for size in ('preview', 'small', 'large')}
+    description = rng.choice(DESCRIPTIONS)
+    return {
+        'id': image_id,
+        'description': description,
+        'assets': assets,
+        'contributor': {'display_name': f'{query.title()} Studio'}
+    }
+
+
+class FakeShutterstock:
+    """Threaded HTTP server with request counters, usable as a context manager"""
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.connections = 0
+        self.images_served = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}/v2'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def search(self, query, per_page):
+        """Return (status, body) for one search request"""
+        with self._lock:
+            self.requests += 1
+            if self._rng.random() < self.failure_rate:
+                return 503, {'message': 'Service Unavailable'}
+            images = [fake_image(self._rng, query) for _ in range(per_page)]
+            self.images_served += len(images)
+        return 200, {'page': 1, 'per_page': per_page, 'total_count': 10000, 'data': images}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != '/v2/images/search':
+                    self._reply(404, {'message': 'Not Found'})
+                    return
+                params = parse_qs(url.query)
+                query = params.get('query', ['photo'])[0]
+                per_page = max(1, min(500, int(params.get('per_page', ['1'])[0])))
+                if fake.latency or fake.jitter:
+                    time.sleep(fake.latency + random.uniform(0, fake.jitter))
+                self._reply(*fake.search(query, per_page))
+
+            def setup(self):
+                super().setup()
+                with fake._lock:
+                    fake.connections += 1
+
+            def _reply(self, status, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8400)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many extra seconds, at random')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    args = parser.parse_args()
+
+    fake = FakeShutterstock(port=args.port, latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate)
+    print(f'Fake Shutterstock listening on {fake.base_url} (set SHUTTERSTOCK_BASE_URL to this)')
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,409 @@
+"""Full-game load test of the multiplayer API over HTTP.
+
+Starts the app in its own process (gevent WSGI server, like the Procfile's
+gevent worker, or --server threaded), with Shutterstock replaced by
+benchmarks.fake_shutterstock. Load processes then play complete games in
+--lobbies concurrent lobbies:
+
+- the host creates the lobby and opens the lobby page
+- --players phones join
+- the host starts the game
+- each of the 5 rounds fetches an image and posts it with next-round
+- while the round runs, the host polls status every second and the
+  phones poll the compact status every 1-2 s, revalidating with their ETag
+- the phones submit-word on their turn, a mix of title words and misses
+- when every word is found, or after --round-seconds, the host calls
+  reveal-all and moves to the next round
+- everyone opens the results page
+
+Reported per database: games and requests per second, p50/p95/p99 per
+endpoint as the clients saw it, and the server's SQL statements and CPU
+time per game. What every simulated device does is fixed by --seed. The
+interleaving with other lobbies still depends on timing.
+
+    python -m benchmarks.game_load
+    python -m benchmarks.game_load --lobbies 40 --players 8 --database-url sqlite:////tmp/load.db postgresql+psycopg2://localhost/spf_bench
+    python -m benchmarks.game_load --round-seconds 4 --think 0.5 1.5 --server threaded
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+
+from .common import configure_database, percentile
+from .fake_shutterstock import FakeShutterstock
+
+GAME_MODES = ('free-for-all', 'cooperative', 'competitive')
+MISSES = ['zebra', 'violin', 'castle', 'rocket', 'pumpkin', 'glacier', 'lantern', 'bicycle', 'harbor', 'meadow']
+COMPACT = 'application/vnd.stockphotofrenzy.compact+json'
+ROUNDS = 5
+
+
+# --- server process ---------------------------------------------------------
+
+def serve(database_url, args, conn):
+    """Run the app until told to stop, reporting statements and CPU between 'begin' and 'end'"""
+    if args.server == 'gevent':
+        from gevent import monkey
+        from psycogreen.gevent import patch_psycopg
+        monkey.patch_all()
+        # As gunicorn.conf.py's post_fork does for the gevent workers
+        patch_psycopg()
+    configure_database(database_url)
+    os.environ['STATE_BACKEND'] = args.state_backend
+    os.environ['LOBBY_REAPER_INTERVAL'] = '0'
+    os.environ['SHUTTERSTOCK_BASE_URL'] = args.shutterstock_url
+    os.environ['SHUTTERSTOCK_ACCESS_TOKEN'] = 'benchmark'
+    import src.app as app_module
+    from .query_budget import StatementCounter
+
+    random.seed(args.seed)
+    with app_module.app.app_context():
+        counter = StatementCounter(app_module.db.engine)
+        dialect = app_module.db.engine.dialect.name
+
+    if args.server == 'gevent':
+        from gevent.pywsgi import WSGIServer
+        server = WSGIServer(('127.0.0.1', 0), app_module.app, log=None)
+        server.start()
+        port = server.server_port
+    else:
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args):
+                pass
+
+        server = make_server('127.0.0.1', 0, app_module.app, threaded=True, request_handler=QuietHandler)
+        port = server.server_port
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def receive():
+        if args.server == 'gevent':
+            # Wait without blocking the gevent hub that serves requests
+            from gevent.socket import wait_read
+            wait_read(conn.fileno())
+        return conn.recv()
+
+    conn.send({'port': port, 'dialect': dialect})
+    receive()
+    cpu, statements = time.process_time(), counter.count
+    conn.send('started')
+    receive()
+    conn.send({'cpu': time.process_time() - cpu, 'statements': counter.count - statements})
+    if args.server == 'gevent':
+        server.stop(timeout=1)
+    else:
+        server.shutdown()
+
+
+# --- load processes ---------------------------------------------------------
+
+class Stats:
+    """Client-side latencies and failures per endpoint"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.rejected = defaultdict(int)
+        self.games = 0
+
+    def request(self, session, label, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=30, **kwargs)
+        except Exception:
+            with self.lock:
+                self.errors[label] += 1
+            return None
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.latencies[label].append(elapsed)
+            if response.status_code >= 500:
+                self.errors[label] += 1
+            elif response.status_code >= 400:
+                self.rejected[label] += 1
+        return response
+
+    def result(self):
+        return {'latencies': dict(self.latencies), 'errors': dict(self.errors),
+                'rejected': dict(self.rejected), 'games': self.games}
+
+
+class Round:
+    """What the host screen shows, shared with the lobby's phones"""
+
+    def __init__(self):
+        self.lobby_id = None
+        self.title_words = []
+        self.finished = threading.Event()
+        self.lobby_ready = threading.Event()
+
+
+def phone(base_url, stats, shared, name, rng, args):
+    import requests
+
+    session = requests.Session()
+    shared.lobby_ready.wait()
+    lobby_id = shared.lobby_id
+    time.sleep(rng.uniform(0, 1))
+    stats.request(session, 'join', 'POST', f'{base_url}/api/lobby/{lobby_id}/join', json={'player_name': name})
+
+    etag = None
+    view = None
+    guessed = set()
+    guessed_round = None
+    next_poll = time.monotonic()
+    next_guess = next_poll + rng.uniform(*args.think)
+    while True:
+        now = time.monotonic()
+        if now >= next_poll:
+            headers = {'Accept': COMPACT}
+            if etag:
+                headers['If-None-Match'] = etag
+            response = stats.request(session, 'status (phone)', 'GET', f'{base_url}/api/lobby/{lobby_id}/status',
+                                     headers=headers)
+            if response is not None and response.status_code == 200:
+                etag = response.headers.get('ETag')
+                view = response.json()
+            next_poll = now + rng.uniform(*args.poll)
+        if view is not None:
+            lobby = view['lobby']
+            if lobby['status'] in ('finished', 'ended') or shared.finished.is_set():
+                break
+            if lobby['current_round'] != guessed_round:
+                guessed_round = lobby['current_round']
+                guessed.clear()
+            if lobby['status'] == 'active' and now >= next_guess and can_guess(view, name):
+                word = pick_word(rng, shared.title_words, guessed, args.hit_rate)
+                guessed.add(word)
+                stats.request(session, 'submit', 'POST', f'{base_url}/api/lobby/{lobby_id}/submit-word',
+                              json={'player_name': name, 'word': word})
+                next_guess = now + rng.uniform(*args.think)
+        time.sleep(max(0.0, min(next_poll, next_guess) - time.monotonic()))
+    stats.request(session, 'results', 'GET', f'{base_url}/results', params={'lobby': lobby_id})
+
+
+def can_guess(view, name):
+    """Phones only guess on their turn (competitive: the active team's captain; round 5 both captains)"""
+    lobby = view['lobby']
+    if lobby['game_mode'] != 'competitive':
+        return True
+    me = next((p for p in view['participants'] if p['player_name'] == name), None)
+    if me is None or not me['is_captain']:
+        return False
+    return lobby['current_round'] >= 4 or me['team'] == lobby['active_team']
+
+
+def pick_word(rng, title_words, guessed, hit_rate):
+    hits = [word for word in title_words if word not in guessed]
+    if hits and rng.random() < hit_rate:
+        return rng.choice(hits)
+    misses = [word for word in MISSES if word not in guessed]
+    return rng.choice(misses) if misses else f'{rng.choice(MISSES)}{len(guessed)}'
+
+
+def host(base_url, stats, shared, game_mode, rng, args):
+    import requests
+
+    session = requests.Session()
+    stats.request(session, 'create lobby', 'POST', f'{base_url}/lobby',
+                  data={'game_mode': game_mode, 'difficulty': rng.choice(['easy', 'hard'])}, allow_redirects=False)
+    page = stats.request(session, 'lobby page', 'GET', f'{base_url}/lobby')
+    match = re.search(r"const lobbyId = '([A-Z0-9]+)'", page.text if page is not None else '')
+    if not match:
+        shared.finished.set()
+        shared.lobby_ready.set()
+        return False
+    lobby_id = shared.lobby_id = match.group(1)
+    shared.lobby_ready.set()
+    api = f'{base_url}/api/lobby/{lobby_id}'
+
+    etag = None
+    state = None
+
+    def poll():
+        nonlocal etag, state
+        headers = {'If-None-Match': etag} if etag else {}
+        response = stats.request(session, 'status (host)', 'GET', f'{api}/status', headers=headers)
+        if response is not None and response.status_code == 200:
+            etag = response.headers.get('ETag')
+            state = response.json()
+        return state
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        state = poll()
+        if state and len(state['participants']) >= args.players:
+            break
+        time.sleep(1)
+    stats.request(session, 'start', 'POST', f'{api}/start', json={})
+
+    for round_number in range(ROUNDS):
+        response = stats.request(session, 'get image', 'GET', f'{base_url}/api/get-image',
+                                 params={'difficulty': state['lobby']['difficulty'] if state else 'hard'})
+        image = response.json().get('image') if response is not None and response.ok else None
+        if image is None:
+            image = {'id': 'fallback', 'url': '', 'title': 'Fallback image', 'title_words': ['fallback', 'image'],
+                     'easy_mode_hidden_words': []}
+        shared.title_words = list(dict.fromkeys(image.get('easy_mode_hidden_words') or image['title_words']))
+        stats.request(session, 'round image', 'POST', f'{api}/next-round', json={'image_data': image})
+        round_ends = time.monotonic() + args.round_seconds
+        while time.monotonic() < round_ends:
+            time.sleep(1)
+            state = poll()
+            if state and set(shared.title_words) <= set(state['lobby']['revealed_words']):
+                break
+        stats.request(session, 'reveal-all', 'POST', f'{api}/reveal-all', json={'revealed_words': []})
+        shared.title_words = []
+        label = 'last round' if round_number == ROUNDS - 1 else 'next round'
+        stats.request(session, label, 'POST', f'{api}/next-round', json={})
+    shared.finished.set()
+    stats.request(session, 'results', 'GET', f'{base_url}/results', params={'lobby': lobby_id})
+    return True
+
+
+def run_load(base_url, slots, args, results):
+    """One load process: play its lobby slots' games, each slot one game after another"""
+    if args.nice and hasattr(os, 'nice'):
+        # On small machines the simulated devices compete with the server for CPU
+        os.nice(args.nice)
+    stats = Stats()
+    cpu = time.process_time()
+
+    def play_slot(slot):
+        for game in range(args.games):
+            rng = random.Random(f'{args.seed}-{slot}-{game}')
+            shared = Round()
+            phones = [threading.Thread(target=phone, args=(base_url, stats, shared, f'player{index}',
+                                                           random.Random(f'{args.seed}-{slot}-{game}-{index}'), args))
+                      for index in range(args.players)]
+            for thread in phones:
+                thread.start()
+            finished = host(base_url, stats, shared, GAME_MODES[(slot + game) % len(GAME_MODES)], rng, args)
+            for thread in phones:
+                thread.join()
+            if finished:
+                with stats.lock:
+                    stats.games += 1
+
+    threads = [threading.Thread(target=play_slot, args=(slot,)) for slot in slots]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put(dict(stats.result(), cpu=time.process_time() - cpu))
+
+
+# --- driver -----------------------------------------------------------------
+
+def run_database(database_url, args, context):
+    parent, child = context.Pipe()
+    server = context.Process(target=serve, args=(database_url, args, child))
+    server.start()
+    if not parent.poll(60):
+        server.terminate()
+        return None
+    info = parent.recv()
+    base_url = f"http://127.0.0.1:{info['port']}"
+
+    parent.send('begin')
+    parent.recv()
+    results = context.Queue()
+    processes = [context.Process(target=run_load, args=(base_url, range(index, args.lobbies, args.load_processes),
+                                                         args, results))
+                 for index in range(min(args.load_processes, args.lobbies))]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    wall = time.perf_counter() - started
+    for process in processes:
+        process.join()
+    parent.send('end')
+    server_stats = parent.recv()
+    server.join(timeout=10)
+    if server.is_alive():
+        server.terminate()
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    rejected = defaultdict(int)
+    games = 0
+    load_cpu = 0.0
+    for outcome in outcomes:
+        games += outcome['games']
+        load_cpu += outcome['cpu']
+        for label, values in outcome['latencies'].items():
+            latencies[label].extend(values)
+        for label, count in outcome['errors'].items():
+            errors[label] += count
+        for label, count in outcome['rejected'].items():
+            rejected[label] += count
+    return {'database': database_url.split('@')[-1], 'dialect': info['dialect'], 'wall': wall, 'games': games,
+            'latencies': latencies, 'errors': errors, 'rejected': rejected, 'load_cpu': load_cpu, **server_stats}
+
+
+def report(result, args):
+    games = max(result['games'], 1)
+    requests = sum(len(values) for values in result['latencies'].values())
+    print(f"{result['dialect']:<10} {result['database']}")
+    print(f"  games       {result['games']} of {args.lobbies * args.games} in {result['wall']:.1f}s, "
+          f"{requests / result['wall']:.1f} req/s")
+    print(f"  per game    {result['statements'] / games:.0f} SQL statements, "
+          f"{result['cpu'] / games * 1000:.0f} ms server CPU "
+          f"({result['cpu'] / result['wall']:.0%} of one core while running)")
+    busy = (result['cpu'] + result['load_cpu']) / result['wall'] / (os.cpu_count() or 1)
+    print(f"  load        {result['load_cpu'] / result['wall']:.0%} of one core for the simulated devices, "
+          f"machine {busy:.0%} busy{' (CPU bound: latencies include waiting for the load generator)' if busy > 0.8 else ''}")
+    print(f"  {'endpoint':<16}{'requests':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'4xx':>6}{'errors':>8}")
+    for label in sorted(result['latencies'], key=lambda label: -len(result['latencies'][label])):
+        values = result['latencies'][label]
+        print(f"  {label:<16}{len(values):>9}{percentile(values, 50) * 1000:>9.1f}"
+              f"{percentile(values, 95) * 1000:>9.1f}{percentile(values, 99) * 1000:>9.1f}"
+              f"{result['rejected'].get(label, 0):>6}{result['errors'].get(label, 0):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', nargs='+', default=[None], help='one run per URL (default: temporary SQLite)')
+    parser.add_argument('--lobbies', type=int, default=10, help='games played at the same time')
+    parser.add_argument('--games', type=int, default=1, help='games per lobby slot, one after another')
+    parser.add_argument('--players', type=int, default=6)
+    parser.add_argument('--round-seconds', type=float, default=8.0, help='longest a round lasts')
+    parser.add_argument('--think', type=float, nargs=2, default=(1.0, 3.0), metavar=('MIN', 'MAX'),
+                        help='seconds between a phone\'s guesses')
+    parser.add_argument('--poll', type=float, nargs=2, default=(1.0, 2.0), metavar=('MIN', 'MAX'),
+                        help='seconds between a phone\'s status polls')
+    parser.add_argument('--hit-rate', type=float, default=0.4, help='share of guesses that are title words')
+    parser.add_argument('--server', choices=('gevent', 'threaded'), default='gevent')
+    parser.add_argument('--state-backend', default='memory')
+    parser.add_argument('--load-processes', type=int, default=2)
+    parser.add_argument('--nice', type=int, default=10, help='lower the load processes\' CPU priority by this much')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    failed = False
+    with FakeShutterstock(seed=args.seed) as fake:
+        args.shutterstock_url = fake.base_url
+        for database_url in args.database_url:
+            database_url = configure_database(database_url)
+            result = run_database(database_url, args, context)
+            if result is None:
+                print(f'{database_url.split("@")[-1]}: server did not start')
+                failed = True
+                continue
+            report(result, args)
+            failed = failed or bool(result['errors']) or result['games'] < args.lobbies * args.games
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
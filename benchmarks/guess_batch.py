@@ -0,0 +1,139 @@
+"""Batched guesses (submit-words) against one submit-word call per word.
+
+For every game mode, the same word lists are played twice in identical
+lobbies: once word by word, once as a single batch. The per-word results
+and the final lobby state must match exactly. Also reports the requests,
+SQL statements and time each way, with --rtt added per request to stand in
+for a slow mobile network.
+
+    python -m benchmarks.guess_batch
+    python -m benchmarks.guess_batch --rtt 0.15 --words 8
+"""
+import argparse
+import json
+import random
+import time
+
+from .common import configure_database, create_lobby, sample_image
+from .query_budget import StatementCounter
+
+TITLE = ['mountains', 'sunrise', 'hiker', 'backpack', 'valley', 'hiker', 'café']
+EXTRA = ['mountain', 'cafe', 'hikers', 'zzz', 'ab', 'river', 'sunrises', 'valleys']
+
+
+def setup(client, game_mode):
+    lobby_id = create_lobby(client, game_mode=game_mode)
+    for name in ('alice', 'bob'):
+        client.post(f'/api/lobby/{lobby_id}/join', json={'player_name': name})
+    client.post(f'/api/lobby/{lobby_id}/start', json={})
+    client.post(f'/api/lobby/{lobby_id}/next-round', json={'image_data': sample_image(TITLE)})
+    status = client.get(f'/api/lobby/{lobby_id}/status').json
+    if game_mode == 'competitive':
+        # Only the active team's captain may guess in the early rounds
+        players = [p['player_name'] for p in status['participants']
+                   if p['is_captain'] and p['team'] == status['lobby']['active_team']]
+    else:
+        players = ['alice', 'bob']
+    return lobby_id, players
+
+
+def final_state(client, lobby_id):
+    body = client.get(f'/api/lobby/{lobby_id}/status').json
+    lobby = body['lobby']
+    return {
+        'revealed_words': lobby['revealed_words'],
+        'word_owners': lobby['word_owners'],
+        'shared_score': lobby['shared_score'],
+        'participants': sorted((p['player_name'], p['score'], p['guessed_words']) for p in body['participants'])
+    }
+
+
+def play_sequential(client, lobby_id, players, turns, rtt):
+    results = []
+    requests = 0
+    for player_index, words in turns:
+        player = players[player_index % len(players)]
+        for word in words:
+            time.sleep(rtt)
+            response = client.post(f'/api/lobby/{lobby_id}/submit-word', json={'player_name': player, 'word': word})
+            requests += 1
+            body = response.json
+            if 'error' in body:
+                results.append({'error': body['error']})
+            else:
+                results.append({'word': body['word'], 'is_correct': body['is_correct'], 'points': body['points']})
+    return results, requests
+
+
+def play_batched(client, lobby_id, players, turns, rtt):
+    results = []
+    requests = 0
+    for player_index, words in turns:
+        player = players[player_index % len(players)]
+        time.sleep(rtt)
+        response = client.post(f'/api/lobby/{lobby_id}/submit-words', json={'player_name': player, 'words': words})
+        requests += 1
+        body = response.json
+        if 'error' in body:
+            results.extend({'error': body['error']} for _ in words)
+        else:
+            # Sequential calls don't echo the word on errors either
+            results.extend({'error': r['error']} if 'error' in r else r for r in body['results'])
+    return results, requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--games', type=int, default=20, help='games per mode')
+    parser.add_argument('--words', type=int, default=6, help='words per batch')
+    parser.add_argument('--rtt', type=float, default=0.0, help='seconds of network round trip per request')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    configure_database(args.database_url)
+    import src.app as app_module
+
+    with app_module.app.app_context():
+        counter = StatementCounter(app_module.db.engine)
+    client = app_module.app.test_client()
+    rng = random.Random(args.seed)
+    mismatches = 0
+    totals = {'sequential': [0, 0, 0.0], 'batched': [0, 0, 0.0]}
+    for game_mode in ('free-for-all', 'cooperative', 'competitive'):
+        for _ in range(args.games):
+            turns = [(rng.randrange(2), [rng.choice(TITLE + EXTRA) for _ in range(args.words)])
+                     for _ in range(3)]
+            outcomes = {}
+            for label, play in (('sequential', play_sequential), ('batched', play_batched)):
+                lobby_id, players = setup(client, game_mode)
+                before = counter.count
+                started = time.perf_counter()
+                results, requests = play(client, lobby_id, players, turns, args.rtt)
+                totals[label][0] += requests
+                totals[label][1] += counter.count - before
+                totals[label][2] += time.perf_counter() - started
+                outcomes[label] = (results, final_state(client, lobby_id))
+            if game_mode == 'competitive':
+                # Captains are picked at random, so compare scores without names
+                for label, (results, state) in outcomes.items():
+                    state['participants'] = sorted((score, words) for _, score, words in state['participants'])
+                    state['word_owners'] = sorted(state['word_owners'])
+            if outcomes['sequential'] != outcomes['batched']:
+                mismatches += 1
+                if mismatches == 1:
+                    print(f'first mismatch ({game_mode}, {turns}):')
+                    print(json.dumps(outcomes, indent=1, default=str))
+
+    words = 3 * args.games * 3 * args.words
+    for label, (requests, statements, seconds) in totals.items():
+        print(f'{label:<11} {requests:6d} requests, {statements / words:5.2f} statements per word, '
+              f'{seconds / words * 1000:6.2f} ms per word')
+    if mismatches:
+        print(f'semantics    FAILED ({mismatches} games differ)')
+        raise SystemExit(1)
+    print(f'semantics    OK ({words} words, identical results and final state)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Multi-image fetches: one search after another versus concurrent searches.
+
+Fetches batches of processed images (competitive round 5, image pool
+refills) from several random search terms against a local fake Shutterstock
+with injected latency, first with sequential searches, then through
+fetch_images() at a few concurrency limits.
+
+    python -m benchmarks.image_batch
+    python -m benchmarks.image_batch --latency 0.2 --jitter 0.2 --batch 8
+"""
+import argparse
+import os
+import time
+
+from .common import configure_database, percentile
+from .fake_shutterstock import FakeShutterstock
+
+
+def sequential_fetch(app_module, searches, difficulty, count):
+    processed_images = []
+    for query, per_page in searches:
+        for img in app_module.shutterstock.search(query, per_page):
+            processed_images.append(app_module.process_image(img, difficulty))
+    return processed_images[:count]
+
+
+def run(label, batches, fetch):
+    latencies = []
+    for _ in range(batches):
+        started = time.perf_counter()
+        images = fetch()
+        latencies.append(time.perf_counter() - started)
+        if not images:
+            raise SystemExit(f'{label}: empty batch')
+    print(f'{label:<16} p50 {percentile(latencies, 50) * 1000:.1f} ms, '
+          f'p99 {percentile(latencies, 99) * 1000:.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batches', type=int, default=20)
+    parser.add_argument('--batch', type=int, default=5, help='images per batch')
+    parser.add_argument('--latency', type=float, default=0.1, help='fake upstream latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.1, help='extra random latency in seconds')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+
+    with FakeShutterstock(latency=args.latency, jitter=args.jitter, seed=1) as fake:
+        os.environ['SHUTTERSTOCK_BASE_URL'] = fake.base_url
+        os.environ['IMAGE_POOL_SIZE'] = '0'
+        configure_database()
+        import src.app as app_module
+        from src.shutterstock import ShutterstockClient
+
+        searches = app_module.random_searches(args.batch)
+        print(f'upstream         {args.latency * 1000:.0f}-{(args.latency + args.jitter) * 1000:.0f} ms per search')
+        print(f'batch            {args.batch} images from {len(searches)} search terms, {args.batches} batches')
+        run('sequential', args.batches,
+            lambda: sequential_fetch(app_module, app_module.random_searches(args.batch), 'hard', args.batch))
+        for limit in args.concurrency:
+            app_module.shutterstock = ShutterstockClient(fake.base_url, '', max_concurrency=limit)
+            run(f'concurrent ({limit})', args.batches,
+                lambda: app_module.fetch_images(app_module.random_searches(args.batch), 'hard', args.batch))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Round-start latency of /api/get-image with and without the image pool.
+
+Plays rounds against a local fake Shutterstock with injected latency: each
+round fetches an image, then "plays" for --round-gap seconds, which is when
+the pool refills in the background. Then checks, from /api/get-image/stats
+and the fake's request counter, that:
+
+- every pooled round is counted as a hit or a miss, and most are hits
+- refills fetch a batch per upstream search instead of one image per call
+- no image is handed out twice
+- images pooled longer than the pool's max age are dropped, not served
+
+Exits with status 1 when a check fails.
+
+    python -m benchmarks.image_pool
+    python -m benchmarks.image_pool --latency 0.3 --rounds 40 --query "mountain lake"
+"""
+import argparse
+import os
+import time
+
+from .common import configure_database, percentile
+from .fake_shutterstock import FakeShutterstock
+
+
+def play_rounds(client, rounds, query, difficulty, round_gap):
+    latencies = []
+    seen = set()
+    repeats = 0
+    url = f'/api/get-image?difficulty={difficulty}'
+    if query:
+        url += f'&query={query}'
+    for _ in range(rounds):
+        started = time.perf_counter()
+        response = client.get(url)
+        latencies.append(time.perf_counter() - started)
+        image = response.get_json()['image']
+        if not image['url'] or not image['title_words']:
+            raise SystemExit(f'Bad image in response: {image}')
+        if image['id'] in seen:
+            repeats += 1
+        seen.add(image['id'])
+        time.sleep(round_gap)
+    return latencies, repeats
+
+
+def pool_stats(client):
+    return client.get('/api/get-image/stats').get_json()
+
+
+def check_pooled_run(label, rounds, stats, upstream_calls, repeats, batch_searches):
+    """Failed checks for a run served from the pool"""
+    failures = []
+    if stats['hits'] + stats['misses'] != rounds:
+        failures.append(f'{label}: {stats["hits"]} hits + {stats["misses"]} misses for {rounds} rounds')
+    if stats['hits'] < rounds * 0.8:
+        failures.append(f'{label}: only {stats["hits"]} of {rounds} rounds served from the pool')
+    # Each miss searches once; a refill at most once per term (one more may still be in flight)
+    allowed = (stats['refills'] + 1) * batch_searches + stats['misses']
+    if upstream_calls > allowed or upstream_calls >= rounds:
+        failures.append(f'{label}: {upstream_calls} upstream calls for {rounds} images '
+                        f'and {stats["refills"]} refills, refills are not batched')
+    if repeats:
+        failures.append(f'{label}: {repeats} images served twice')
+    return failures
+
+
+def check_max_age(app_module, client, query, difficulty, size, max_age):
+    """Fill a pool, let it go stale and check the next round doesn't get a stale image"""
+    from src.image_pool import ImagePool
+
+    app_module.image_pool = ImagePool(app_module.fetch_image_batch, target_size=size, max_age=max_age)
+    app_module.image_pool.prefetch(query, difficulty)
+    deadline = time.monotonic() + 10
+    while pool_stats(client)['pooled_images'] < size and time.monotonic() < deadline:
+        time.sleep(0.05)
+    pooled = {image['id'] for _, image in app_module.image_pool._pools[(query or None, difficulty)]}
+    if len(pooled) < size:
+        return [f'max age: the pool never filled ({len(pooled)} of {size} images)']
+    time.sleep(max_age + 0.2)
+
+    url = f'/api/get-image?difficulty={difficulty}' + (f'&query={query}' if query else '')
+    image = client.get(url).get_json()['image']
+    stats = pool_stats(client)
+    failures = []
+    if image['id'] in pooled:
+        failures.append(f'max age: served image {image["id"]} pooled more than {max_age}s ago')
+    if stats['hits'] or stats['misses'] != 1:
+        failures.append(f'max age: expected a miss, got {stats["hits"]} hits and {stats["misses"]} misses')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=30)
+    parser.add_argument('--latency', type=float, default=0.15, help='fake upstream latency in seconds')
+    parser.add_argument('--round-gap', type=float, default=0.5, help='seconds of play between rounds')
+    parser.add_argument('--pool-size', type=int, default=8)
+    parser.add_argument('--query', default='', help='game phrase (default: random search terms)')
+    parser.add_argument('--difficulty', default='hard', choices=['easy', 'hard'])
+    parser.add_argument('--max-age', type=float, default=1.0, help='pool max age for the expiry check, in seconds')
+    args = parser.parse_args()
+
+    with FakeShutterstock(latency=args.latency, seed=1) as fake:
+        os.environ['SHUTTERSTOCK_BASE_URL'] = fake.base_url
+        configure_database()
+        import src.app as app_module
+        from src.image_pool import ImagePool
+
+        client = app_module.app.test_client()
+        batch_searches = 1 if args.query else app_module.IMAGE_FETCH_TERMS
+        failures = []
+        print(f'upstream     fake Shutterstock, {args.latency * 1000:.0f} ms per search')
+        print(f'rounds       {args.rounds}, {args.round_gap:.2f}s apart, query {args.query or "(random)"}')
+        for label, size in (('no pool', 0), (f'pool of {args.pool_size}', args.pool_size)):
+            app_module.image_pool = ImagePool(app_module.fetch_image_batch, target_size=size)
+            app_module.image_pool.prefetch(args.query, args.difficulty)
+            time.sleep(args.round_gap)
+            requests_before = fake.requests
+            latencies, repeats = play_rounds(client, args.rounds, args.query, args.difficulty, args.round_gap)
+            stats = pool_stats(client)
+            upstream_calls = fake.requests - requests_before
+            print(f'{label:<12} p50 {percentile(latencies, 50) * 1000:.1f} ms, '
+                  f'p99 {percentile(latencies, 99) * 1000:.1f} ms, '
+                  f'hits {stats["hits"]}, misses {stats["misses"]}, '
+                  f'upstream calls {upstream_calls}, repeated images {repeats}')
+            if size:
+                failures += check_pooled_run(label, args.rounds, stats, upstream_calls, repeats, batch_searches)
+            elif stats['hits'] or stats['misses']:
+                failures.append(f'{label}: counted {stats["hits"]} hits and {stats["misses"]} misses')
+
+        failures += check_max_age(app_module, client, args.query, args.difficulty, args.pool_size, args.max_age)
+        for failure in failures:
+            print(f'FAIL {failure}')
+        if failures:
+            raise SystemExit(1)
+        print('pool counters, batching, uniqueness and expiry as expected')
+
+
+if __name__ == '__main__':
+    main()
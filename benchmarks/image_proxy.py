@@ -0,0 +1,236 @@
+"""Bytes per round image, direct versus through /img, and the proxy's cache behaviour.
+
+A local asset server stands in for Shutterstock's image CDN and serves
+"huge"-sized JPEGs (--width pixels wide, several MB, like the asset
+process_image picks). For each image the script records:
+
+- the original's size
+- every /img variant's size
+- the first request (fetch, resize, encode)
+- a second variant of the same image (no new fetch)
+- a cached hit and a 304 revalidation
+
+It then checks that each image was fetched upstream exactly once, that
+/img refuses sources outside IMAGE_PROXY_HOSTS and redirects that leave
+them without fetching anything, and, after pushing more images through
+/img than a --cache-mb cache holds, that the directory stays within its
+limit. Exits with status 1 when a check fails.
+
+    python -m benchmarks.image_proxy
+    python -m benchmarks.image_proxy --images 10 --width 6000
+"""
+import argparse
+import io
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from .common import configure_database, percentile
+
+
+def huge_jpeg(seed, width):
+    """A photo-like JPEG: colour gradients with texture at every scale, so resized copies keep detail"""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    height = width * 2 // 3
+    small = Image.new('RGB', (8, 6))
+    small.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(48)])
+    image = small.resize((width, height), Image.BICUBIC)
+    for scale in (1, 3, 9, 27):
+        noise = Image.effect_noise((width // scale, height // scale), 60).resize((width, height), Image.BICUBIC)
+        image = Image.blend(image, noise.convert('RGB'), 0.15)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=92)
+    return buffer.getvalue()
+
+
+class AssetServer:
+    """Serves /assets/<n>.jpg and /redirect?to=<url>, and counts requests per path"""
+
+    def __init__(self, width):
+        self.width = width
+        self.requests = {}
+        self._images = {}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+
+    def url(self, index, host='127.0.0.1'):
+        return f'http://{host}:{self.server.server_address[1]}/assets/{index}.jpg'
+
+    def redirect_url(self, target):
+        return f'http://127.0.0.1:{self.server.server_address[1]}/redirect?' + urlencode({'to': target})
+
+    def image(self, path):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+            if path not in self._images:
+                self._images[path] = huge_jpeg(path, self.width)
+            return self._images[path]
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        assets = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == '/redirect':
+                    self.send_response(302)
+                    self.send_header('Location', parse_qs(url.query)['to'][0])
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = assets.image(self.path)
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def timed(request):
+    started = time.perf_counter()
+    response = request()
+    return response, time.perf_counter() - started
+
+
+def check_allowed_hosts(client, assets):
+    """Failed checks for sources and redirect targets outside IMAGE_PROXY_HOSTS"""
+    failures = []
+    before = dict(assets.requests)
+    # localhost reaches the same server, but only 127.0.0.1 is allowed
+    for src in (assets.url(900, host='localhost'), 'http://127.0.0.1.example.com/assets/901.jpg',
+                'file:///etc/passwd', 'not a url'):
+        response = client.get('/img/host.webp', query_string={'src': src})
+        if not 400 <= response.status_code < 500:
+            failures.append(f'/img answered {response.status_code} for {src}, outside IMAGE_PROXY_HOSTS')
+
+    response = client.get('/img/host.webp', query_string={'src': assets.redirect_url(assets.url(902, host='localhost'))})
+    if response.status_code == 200:
+        failures.append('/img followed a redirect to a host outside IMAGE_PROXY_HOSTS')
+    if assets.requests.get('/assets/900.jpg') or assets.requests.get('/assets/902.jpg'):
+        failures.append('a source outside IMAGE_PROXY_HOSTS was fetched')
+
+    # The redirect route itself works: a redirect that stays on an allowed host is served
+    response = client.get('/img/host.webp', query_string={'src': assets.redirect_url(assets.url(903))})
+    if response.status_code != 200 or assets.requests.get('/assets/903.jpg') != 1:
+        failures.append(f'/img answered {response.status_code} for a redirect within IMAGE_PROXY_HOSTS')
+    assets.requests.update(before)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=6)
+    parser.add_argument('--width', type=int, default=5000, help='width of the originals in pixels')
+    parser.add_argument('--cache-mb', type=int, default=16, help='IMAGE_CACHE_MAX_MB for the eviction check')
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix='spf-image-cache-')
+    configure_database()
+    os.environ['IMAGE_CACHE_DIR'] = cache_dir
+    os.environ['IMAGE_PROXY_HOSTS'] = '127.0.0.1'
+    import src.app as app_module
+    from src.image_proxy import ImageProxy, VARIANTS
+
+    client = app_module.app.test_client()
+    variants = [(variant, fmt) for variant in VARIANTS for fmt in ('webp', 'jpg')]
+    sizes = {'original': []}
+    sizes.update({f'{variant}.{fmt}': [] for variant, fmt in variants})
+    timings = {'first request': [], 'other variant': [], 'cached': [], 'not modified': []}
+    failures = []
+    try:
+        with AssetServer(args.width) as assets:
+            for index in range(args.images):
+                url = assets.url(index)
+                sizes['original'].append(len(assets.image(f'/assets/{index}.jpg')))
+                assets.requests.clear()
+                for position, (variant, fmt) in enumerate(variants):
+                    path = f'/img/{variant}.{fmt}'
+                    response, seconds = timed(lambda: client.get(path, query_string={'src': url}))
+                    if response.status_code != 200:
+                        raise SystemExit(f'{path} answered {response.status_code} for image {index}')
+                    timings['first request' if position == 0 else 'other variant'].append(seconds)
+                    sizes[f'{variant}.{fmt}'].append(len(response.get_data()))
+                    etag = response.headers['ETag']
+                    _, seconds = timed(lambda: client.get(path, query_string={'src': url}))
+                    timings['cached'].append(seconds)
+                    response, seconds = timed(lambda: client.get(path, query_string={'src': url},
+                                                                 headers={'If-None-Match': etag}))
+                    if response.status_code != 304:
+                        failures.append(f'revalidating {path} for image {index} answered {response.status_code}')
+                    timings['not modified'].append(seconds)
+                fetches = sum(assets.requests.values())
+                if fetches != 1:
+                    failures.append(f'image {index} fetched {fetches} times')
+
+            failures += check_allowed_hosts(client, assets)
+
+            # Eviction: a small cache must stay within its limit however much goes through /img.
+            # Built the way app.py builds it from IMAGE_CACHE_MAX_MB
+            small_dir = tempfile.mkdtemp(prefix='spf-image-lru-')
+            try:
+                limit = args.cache_mb * 1024 * 1024
+                app_module.image_proxy = ImageProxy(small_dir, max_bytes=limit, allowed_hosts=['127.0.0.1'])
+                for index in range(args.images):
+                    for variant, fmt in variants:
+                        client.get(f'/img/{variant}.{fmt}', query_string={'src': assets.url(index)})
+                entries = list(os.scandir(small_dir))
+                on_disk = sum(entry.stat().st_size for entry in entries)
+                reported = client.get('/api/get-image/stats').get_json()['proxy']['cached_bytes']
+                reopened = ImageProxy(small_dir, max_bytes=limit, allowed_hosts=['127.0.0.1'])
+            finally:
+                shutil.rmtree(small_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    original = sum(sizes['original']) / args.images
+    print(f'{args.images} images, originals {args.width}px wide')
+    print(f'{"":<14}{"avg KB":>9}{"vs original":>13}')
+    for label, values in sizes.items():
+        average = sum(values) / len(values)
+        print(f'{label:<14}{average / 1024:>9.0f}{average / original:>12.1%}')
+    print()
+    for label, values in timings.items():
+        print(f'{label:<14} p50 {percentile(values, 50) * 1000:7.1f} ms, max {max(values) * 1000:7.1f} ms')
+    print(f'eviction      {on_disk / 1024:.0f} KB on disk with a {args.cache_mb} MB limit, '
+          f'{reported / 1024:.0f} KB reported by /api/get-image/stats, '
+          f'{reopened.cache.size / 1024:.0f} KB indexed after reopening')
+    if on_disk > limit:
+        failures.append(f'{on_disk} bytes left on disk with a {limit} byte IMAGE_CACHE_MAX_MB limit')
+    # Every image leaves its source and each variant behind unless something was evicted
+    if len(entries) == args.images * (len(variants) + 1):
+        failures.append('nothing was evicted, raise --images or lower --cache-mb')
+    if reported != on_disk or reopened.cache.size != on_disk:
+        failures.append(f'cache size is {reported} bytes while running and {reopened.cache.size} '
+                        f'after reopening, {on_disk} on disk')
+    for failure in failures:
+        print(f'FAIL {failure}')
+    if failures:
+        raise SystemExit(1)
+    print('one fetch per image, allowed hosts enforced, cache within its limit')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""Delta polling with /changes against polling the full /status payload.
+
+Plays games in every mode while a simulated phone polls at random moments,
+sometimes missing a few updates. The phone keeps the state built from the
+change events and, after every poll, it is compared with /status:
+revealed words, owners, scores, guesses, teams, round and status must all
+match. Also reports the bytes each way and the change log rows left per
+lobby, which only cover the last two rounds.
+
+    python -m benchmarks.lobby_changes
+    python -m benchmarks.lobby_changes --games 20 --players 8
+"""
+import argparse
+import random
+
+from .common import configure_database, create_lobby, sample_image
+
+TITLE = ['mountains', 'sunrise', 'hiker', 'backpack', 'valley', 'hiker']
+EXTRA = ['mountain', 'hikers', 'zzz', 'river', 'valleys', 'forest']
+LOBBY_FIELDS = ('status', 'current_round', 'active_team', 'shared_score', 'revealed_words', 'word_owners')
+PARTICIPANT_FIELDS = ('score', 'team', 'is_captain', 'player_color', 'guessed_words')
+
+
+def snapshot(payload):
+    """The parts of a /status payload the change events cover"""
+    lobby = payload['lobby']
+    return {
+        'lobby': {key: lobby[key] for key in LOBBY_FIELDS},
+        'participants': {p['player_name']: {key: p[key] for key in PARTICIPANT_FIELDS}
+                         for p in payload['participants']}
+    }
+
+
+def apply_change(state, change):
+    lobby = state['lobby']
+    participants = state['participants']
+    kind = change['type']
+    if kind == 'player_joined':
+        participants[change['participant']['player_name']] = dict(
+            {key: change['participant'][key] for key in PARTICIPANT_FIELDS if key != 'guessed_words'},
+            guessed_words=[])
+    elif kind == 'teams':
+        for name, team in change['teams'].items():
+            participants[name].update(team)
+    elif kind == 'lobby':
+        lobby.update({key: value for key, value in change.items() if key not in ('type', 'version')})
+    elif kind == 'round':
+        lobby.update(current_round=change['current_round'], active_team=change['active_team'],
+                     revealed_words=[], word_owners={})
+        for participant in participants.values():
+            participant['guessed_words'] = []
+    elif kind == 'guessed':
+        participants[change['player_name']]['guessed_words'].append(change['word'])
+    elif kind == 'word_revealed':
+        lobby['revealed_words'].append(change['word'])
+        if change['owner']:
+            lobby['word_owners'][change['word']] = change['owner']
+    elif kind == 'score':
+        participants[change['player_name']]['score'] = change['score']
+    else:
+        raise ValueError(f'unknown change type {kind}')
+
+
+class Phone:
+    """A client that keeps its state up to date through /changes"""
+
+    def __init__(self, client, lobby_id):
+        self.client = client
+        self.lobby_id = lobby_id
+        self.state = None
+        self.version = None
+        self.resets = 0
+        self.delta_bytes = 0
+        self.status_bytes = 0
+
+    def poll(self):
+        if self.state is None:
+            self.refetch()
+            return
+        response = self.client.get(f'/api/lobby/{self.lobby_id}/changes?since={self.version}')
+        self.delta_bytes += len(response.get_data())
+        body = response.json
+        if body.get('reset'):
+            self.resets += 1
+            self.refetch()
+            return
+        for change in body['changes']:
+            apply_change(self.state, change)
+        self.version = body['version']
+
+    def refetch(self):
+        response = self.client.get(f'/api/lobby/{self.lobby_id}/status')
+        self.delta_bytes += len(response.get_data())
+        self.state = snapshot(response.json)
+        self.version = response.json['lobby']['state_version']
+
+    def check(self):
+        """Compare with /status; also count what a full poll would have cost"""
+        response = self.client.get(f'/api/lobby/{self.lobby_id}/status', headers={
+            'Accept': 'application/vnd.stockphotofrenzy.compact+json'})
+        self.status_bytes += len(response.get_data())
+        full = self.client.get(f'/api/lobby/{self.lobby_id}/status').json
+        return full['lobby']['state_version'] == self.version and snapshot(full) == self.state
+
+
+def play(client, rng, game_mode, players, miss_rate):
+    lobby_id = create_lobby(client, game_mode=game_mode)
+    phone = Phone(client, lobby_id)
+    mismatches = []
+
+    def maybe_poll():
+        if rng.random() < miss_rate:
+            return
+        phone.poll()
+        if not phone.check():
+            mismatches.append((game_mode, phone.version))
+
+    names = [f'player{index}' for index in range(players)]
+    for name in names:
+        client.post(f'/api/lobby/{lobby_id}/join', json={'player_name': name})
+        maybe_poll()
+    client.post(f'/api/lobby/{lobby_id}/start', json={})
+    maybe_poll()
+    for round_number in range(5):
+        client.post(f'/api/lobby/{lobby_id}/next-round', json={'image_data': sample_image(TITLE)})
+        maybe_poll()
+        status = client.get(f'/api/lobby/{lobby_id}/status').json
+        guessers = [p['player_name'] for p in status['participants']
+                    if game_mode != 'competitive' or (p['is_captain'] and (
+                        round_number == 4 or p['team'] == status['lobby']['active_team']))]
+        for _ in range(players * 2):
+            name = rng.choice(guessers)
+            if rng.random() < 0.3:
+                words = rng.sample(TITLE + EXTRA, 3)
+                client.post(f'/api/lobby/{lobby_id}/submit-words', json={'player_name': name, 'words': words})
+            else:
+                client.post(f'/api/lobby/{lobby_id}/submit-word',
+                            json={'player_name': name, 'word': rng.choice(TITLE + EXTRA)})
+            maybe_poll()
+        if rng.random() < 0.5:
+            client.post(f'/api/lobby/{lobby_id}/forfeit', json={})
+        else:
+            client.post(f'/api/lobby/{lobby_id}/reveal-all', json={'revealed_words': TITLE[:2]})
+        maybe_poll()
+        client.post(f'/api/lobby/{lobby_id}/next-round', json={})
+        maybe_poll()
+    return lobby_id, phone, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--games', type=int, default=10, help='games per mode')
+    parser.add_argument('--players', type=int, default=4)
+    parser.add_argument('--miss-rate', type=float, default=0.3, help='share of updates the phone polls too late for')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    configure_database(args.database_url)
+    import src.app as app_module
+    from src.models import LobbyChange
+
+    client = app_module.app.test_client()
+    rng = random.Random(args.seed)
+    mismatches = []
+    delta_bytes = status_bytes = resets = 0
+    rows_left = []
+    for game_mode in ('free-for-all', 'cooperative', 'competitive'):
+        for _ in range(args.games):
+            lobby_id, phone, game_mismatches = play(client, rng, game_mode, args.players, args.miss_rate)
+            mismatches += game_mismatches
+            delta_bytes += phone.delta_bytes
+            status_bytes += phone.status_bytes
+            resets += phone.resets
+            with app_module.app.app_context():
+                rows_left.append(LobbyChange.query.filter_by(lobby_id=lobby_id).count())
+
+    print(f'compact /status polls  {status_bytes:9d} bytes')
+    print(f'/changes polls         {delta_bytes:9d} bytes ({delta_bytes / status_bytes:.0%}, {resets} resets)')
+    print(f'change log rows left   {max(rows_left)} per lobby at most (last two rounds only)')
+    if mismatches:
+        print(f'state        FAILED ({len(mismatches)} polls differ from /status, first {mismatches[0]})')
+        raise SystemExit(1)
+    print('state        OK (deltas rebuild the same state as /status after every poll)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""Lobby creation throughput under contention.
+
+Several processes (like gunicorn workers) with several threads each create
+lobbies through POST /lobby at the same time. A short --code-length shrinks
+the code space so collisions actually happen, and --prefill fills it with
+old finished lobbies whose codes should get recycled.
+
+--legacy swaps in the old allocator (SELECT until a code looks free, then
+INSERT) for comparison.
+
+    python -m benchmarks.lobby_creation
+    python -m benchmarks.lobby_creation --code-length 2 --prefill 600 --legacy
+"""
+import argparse
+import multiprocessing
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .common import configure_database, percentile
+
+
+def legacy_create_lobby(recycle_after=None, **fields):
+    """The old generate_lobby_code + insert"""
+    from src.lobby_codes import generate_lobby_code
+    from src.models import db, Lobby
+
+    while True:
+        code = generate_lobby_code()
+        if not Lobby.query.filter_by(id=code).first():
+            break
+    db.session.add(Lobby(id=code, **fields))
+    db.session.commit()
+    return code
+
+
+def prefill(count):
+    """Insert old finished lobbies, as if earlier games had used these codes"""
+    import src.lobby_codes as lobby_codes
+    from src.app import app
+    from src.models import db, Lobby
+
+    created_at = datetime.utcnow() - timedelta(days=2)
+    with app.app_context():
+        codes = set()
+        while len(codes) < count:
+            codes.add(lobby_codes.generate_lobby_code())
+        db.session.add_all(Lobby(id=code, status='finished', created_at=created_at, last_activity_at=created_at) for code in codes)
+        db.session.commit()
+
+
+def run_worker(database_url, code_length, legacy, creations, threads, start_at, results):
+    configure_database(database_url)
+    import src.app as app_module
+    import src.lobby_codes as lobby_codes
+    from sqlalchemy import event
+
+    lobby_codes.CODE_LENGTH = code_length
+    if legacy:
+        app_module.create_lobby = legacy_create_lobby
+
+    counts = {'statements': 0, 'conflicts': 0}
+    lock = threading.Lock()
+    with app_module.app.app_context():
+        engine = app_module.db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count_statement(*args):
+        with lock:
+            counts['statements'] += 1
+
+    @event.listens_for(engine, 'handle_error')
+    def count_conflict(context):
+        with lock:
+            counts['conflicts'] += 1
+
+    latencies = []
+    outcomes = []
+
+    def create(count):
+        client = app_module.app.test_client()
+        local_latencies = []
+        local_outcomes = []
+        for _ in range(count):
+            started = time.perf_counter()
+            response = client.post('/lobby', data={'game_mode': 'free-for-all', 'difficulty': 'hard'})
+            local_latencies.append(time.perf_counter() - started)
+            with client.session_transaction() as session:
+                local_outcomes.append((response.status_code, session.get('lobby_id')))
+                session.pop('lobby_id', None)
+        with lock:
+            latencies.extend(local_latencies)
+            outcomes.extend(local_outcomes)
+
+    per_thread = [creations // threads + (1 if i < creations % threads else 0) for i in range(threads)]
+    workers = [threading.Thread(target=create, args=(count,)) for count in per_thread]
+    time.sleep(max(0, start_at - time.time()))
+    began = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    results.put((began, time.time(), latencies, outcomes, counts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--lobbies', type=int, default=2000, help='lobbies to create in total')
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--code-length', type=int, default=6)
+    parser.add_argument('--prefill', type=int, default=0, help='old finished lobbies to start with')
+    parser.add_argument('--legacy', action='store_true', help='use the old check-then-insert allocator')
+    args = parser.parse_args()
+
+    database_url = configure_database(args.database_url)
+    # Importing the app creates the schema, so the workers don't race to
+    import src.app  # noqa: F401
+    import src.lobby_codes as lobby_codes
+    lobby_codes.CODE_LENGTH = args.code_length
+    if args.prefill:
+        prefill(args.prefill)
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    start_at = time.time() + 5
+    shares = [args.lobbies // args.processes + (1 if i < args.lobbies % args.processes else 0)
+              for i in range(args.processes)]
+    processes = [
+        context.Process(target=run_worker,
+                        args=(database_url, args.code_length, args.legacy, share, args.threads, start_at, results))
+        for share in shares
+    ]
+    for process in processes:
+        process.start()
+    spans = []
+    latencies = []
+    outcomes = []
+    statements = conflicts = 0
+    for _ in processes:
+        began, finished, process_latencies, process_outcomes, counts = results.get()
+        spans.append((began, finished))
+        latencies.extend(process_latencies)
+        outcomes.extend(process_outcomes)
+        statements += counts['statements']
+        conflicts += counts['conflicts']
+    for process in processes:
+        process.join()
+    wall = max(end for _, end in spans) - min(start for start, _ in spans)
+
+    from src.app import app
+    from src.models import Lobby
+    statuses = {}
+    for status, _ in outcomes:
+        statuses[status] = statuses.get(status, 0) + 1
+    created = [lobby_id for status, lobby_id in outcomes if status == 302 and lobby_id]
+    with app.app_context():
+        waiting = Lobby.query.filter_by(status='waiting').count()
+        finished_left = Lobby.query.filter_by(status='finished').count()
+
+    print(f'database     {database_url.split("@")[-1]}')
+    print(f'allocator    {"legacy check-then-insert" if args.legacy else "insert-and-retry"}, '
+          f'{len(lobby_codes.CODE_CHARACTERS) ** args.code_length} possible codes, {args.prefill} prefilled')
+    print(f'concurrency  {args.processes} processes x {args.threads} threads')
+    print(f'throughput   {len(outcomes) / wall:.1f} lobbies/s over {wall:.2f}s')
+    print(f'latency      p50 {percentile(latencies, 50) * 1000:.1f} ms, p99 {percentile(latencies, 99) * 1000:.1f} ms')
+    print(f'statements   {statements / max(1, len(outcomes)):.2f} per creation, {conflicts} failed (conflicts)')
+    print(f'statuses     {dict(sorted(statuses.items()))}')
+    print(f'recycled     {args.prefill - finished_left} of {args.prefill} finished lobbies')
+    if len(set(created)) != len(created) or waiting != len(created):
+        print(f'correctness  FAILED ({len(created)} created, {len(set(created))} distinct, {waiting} in database)')
+        raise SystemExit(1)
+    print(f'correctness  OK ({len(created)} distinct lobbies created)')
+
+
+if __name__ == '__main__':
+    main()
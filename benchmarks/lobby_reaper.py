@@ -0,0 +1,145 @@
+"""Lobby reaper cost and its effect on live games.
+
+Fills the database with old finished and abandoned lobbies (with players,
+guesses and round words), then runs the reaper while other threads keep
+submitting guesses in live lobbies. Prints the rows reclaimed, how long the
+reap took and the guess latency before and during it. Compare batch sizes
+to see how long one batch holds its locks:
+
+    python -m benchmarks.lobby_reaper --lobbies 5000
+    python -m benchmarks.lobby_reaper --lobbies 5000 --batch-size 100000
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .common import configure_database, create_lobby, percentile, sample_image
+
+WORDS = ['mountain', 'sunrise', 'hiker', 'backpack', 'valley']
+
+
+def prefill(count, players):
+    """Insert `count` old lobbies: two thirds played and finished, the rest abandoned while waiting"""
+    from src.app import app
+    from src.lobby_codes import generate_lobby_code
+    from src.models import db, Guess, Lobby, LobbyParticipant, RoundWord
+
+    long_ago = datetime.utcnow() - timedelta(days=2)
+    with app.app_context():
+        codes = set()
+        while len(codes) < count:
+            codes.add(generate_lobby_code())
+        codes = sorted(codes)
+        played = codes[:count * 2 // 3]
+        db.session.execute(db.insert(Lobby), [{
+            'id': code, 'status': 'finished' if code in played else 'waiting', 'current_round': 4,
+            'created_at': long_ago, 'started_at': long_ago if code in played else None,
+            'last_activity_at': long_ago, 'state_version': 1
+        } for code in codes])
+        db.session.execute(db.insert(LobbyParticipant), [{
+            'lobby_id': code, 'player_name': f'player{index}', 'score': index * 10, 'joined_at': long_ago
+        } for code in codes for index in range(players)])
+        participants = db.session.execute(
+            db.select(LobbyParticipant.id, LobbyParticipant.lobby_id)
+            .where(LobbyParticipant.lobby_id.in_(played))).all()
+        db.session.execute(db.insert(Guess), [{
+            'participant_id': participant.id, 'lobby_id': participant.lobby_id, 'round': 4,
+            'word': word, 'is_correct': True
+        } for participant in participants for word in WORDS[:2]])
+        db.session.execute(db.insert(RoundWord), [{
+            'lobby_id': code, 'round': 4, 'word': word
+        } for code in played for word in WORDS])
+        db.session.commit()
+        return played[0]
+
+
+def table_counts():
+    from src.app import app
+    from src.models import db, ArchivedGame, Guess, Lobby, LobbyParticipant, RoundWord
+
+    with app.app_context():
+        return {model.__tablename__: db.session.scalar(db.select(db.func.count()).select_from(model))
+                for model in (Lobby, LobbyParticipant, Guess, RoundWord, ArchivedGame)}
+
+
+def play(app_module, stop, latencies, lock):
+    """Keep guessing in a fresh live lobby until told to stop"""
+    client = app_module.app.test_client()
+    lobby_id = create_lobby(client)
+    client.post(f'/api/lobby/{lobby_id}/join', json={'player_name': 'live'})
+    client.post(f'/api/lobby/{lobby_id}/start', json={})
+    client.post(f'/api/lobby/{lobby_id}/next-round', json={'image_data': sample_image(WORDS)})
+    local = []
+    attempt = 0
+    while not stop.is_set():
+        attempt += 1
+        started_at = time.time()
+        started = time.perf_counter()
+        client.post(f'/api/lobby/{lobby_id}/submit-word', json={'player_name': 'live', 'word': f'miss{attempt}'})
+        local.append((started_at, time.perf_counter() - started))
+    with lock:
+        latencies.extend(local)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--lobbies', type=int, default=3000, help='old lobbies to reap')
+    parser.add_argument('--players', type=int, default=4, help='players per old lobby')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--live-games', type=int, default=4, help='threads guessing while the reaper runs')
+    parser.add_argument('--warmup', type=float, default=2.0, help='seconds of guessing before reaping')
+    args = parser.parse_args()
+
+    database_url = configure_database(args.database_url)
+    os.environ['LOBBY_REAPER_INTERVAL'] = '0'
+    import src.app as app_module
+    from src.lobby_reaper import LobbyReaper
+
+    archived_lobby = prefill(args.lobbies, args.players)
+    before = table_counts()
+
+    stop = threading.Event()
+    latencies = []
+    lock = threading.Lock()
+    players = [threading.Thread(target=play, args=(app_module, stop, latencies, lock))
+               for _ in range(args.live_games)]
+    for player in players:
+        player.start()
+    time.sleep(args.warmup)
+    reaper = LobbyReaper(app_module.app, batch_size=args.batch_size,
+                         on_removed=app_module.state_backend.invalidate)
+    reap_started = time.time()
+    report = reaper.run_once()
+    reap_finished = time.time()
+    time.sleep(0.5)
+    stop.set()
+    for player in players:
+        player.join()
+    after = table_counts()
+
+    baseline = [latency for at, latency in latencies if at < reap_started]
+    during = [latency for at, latency in latencies if reap_started <= at <= reap_finished]
+    results_page = app_module.app.test_client().get(f'/results?lobby={archived_lobby}')
+
+    print(f'database     {database_url.split("@")[-1]}')
+    print(f'reaped       {report["lobbies"]} lobbies in {report["batches"]} batches of up to '
+          f'{args.batch_size}, {report["seconds"]:.2f}s, {report["conflicts"]} conflicts')
+    print(f'reclaimed    ' + ', '.join(f'{table} {before[table]} -> {after[table]}' for table in before))
+    print(f'report       {json.dumps(report)}')
+    for label, values in (('guess before', baseline), ('guess during', during)):
+        print(f'{label} p50 {percentile(values, 50) * 1000:.1f} ms, p99 {percentile(values, 99) * 1000:.1f} ms, '
+              f'max {max(values, default=0) * 1000:.1f} ms ({len(values)} guesses)')
+    print(f'results page {results_page.status_code} for archived lobby {archived_lobby}')
+    live = after['lobbies'] == before['lobbies'] - report['lobbies'] + args.live_games
+    if report['lobbies'] != args.lobbies or not live or results_page.status_code != 200:
+        print('correctness  FAILED')
+        raise SystemExit(1)
+    print('correctness  OK (old lobbies gone, live games untouched, archive readable)')
+
+
+if __name__ == '__main__':
+    main()
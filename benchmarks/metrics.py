@@ -0,0 +1,192 @@
+"""Cost of the Prometheus metrics per request, and their totals across gunicorn workers.
+
+Overhead: status polls and guesses through the test client, switching
+the metrics on and off in alternating blocks, once with values in memory
+and once in multiprocess mode. The difference per request is what
+recording the metrics costs.
+
+Multiprocess: starts gunicorn with gunicorn.conf.py and --workers
+processes (sync workers, so every connection goes to whichever worker
+accepts it first), with Shutterstock replaced by
+benchmarks.fake_shutterstock failing --failure-rate of searches. After
+status polls and image fetches on fresh connections, repeated scrapes of
+/metrics must each report exactly the requests that were sent and the
+searches the fake server saw, whichever worker answered.
+
+    python -m benchmarks.metrics
+    python -m benchmarks.metrics --workers 4 --requests 400
+"""
+import argparse
+import multiprocessing
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from .common import configure_database, create_lobby, percentile, sample_image
+from .fake_shutterstock import FakeShutterstock
+
+TITLE = ['mountains', 'sunrise', 'hiker', 'backpack', 'valley']
+
+
+def time_requests(multiprocess, polls, conn):
+    """Per-request seconds for status polls and guesses, alternating metrics on and off in blocks"""
+    configure_database()
+    metrics_dir = tempfile.mkdtemp(prefix='spf-metrics-') if multiprocess else None
+    if metrics_dir:
+        os.environ['PROMETHEUS_MULTIPROC_DIR'] = metrics_dir
+    os.environ['LOBBY_REAPER_INTERVAL'] = '0'
+    os.environ['IMAGE_POOL_SIZE'] = '0'
+    import src.app as app_module
+
+    client = app_module.app.test_client()
+    lobby_id = create_lobby(client)
+    for index in range(4):
+        client.post(f'/api/lobby/{lobby_id}/join', json={'player_name': f'player{index}'})
+    client.post(f'/api/lobby/{lobby_id}/start', json={})
+    client.post(f'/api/lobby/{lobby_id}/next-round', json={'image_data': sample_image(TITLE)})
+    timings = {enabled: {'status': [], 'submit-word': []} for enabled in (False, True)}
+    for index in range(polls):
+        # Blocks of 50 so both settings see the same database growth and machine noise
+        enabled = app_module.metrics.enabled = (index // 50) % 2 == 1
+        started = time.perf_counter()
+        client.get(f'/api/lobby/{lobby_id}/status')
+        timings[enabled]['status'].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        client.post(f'/api/lobby/{lobby_id}/submit-word',
+                    json={'player_name': f'player{index % 4}', 'word': f'miss{index}'})
+        timings[enabled]['submit-word'].append(time.perf_counter() - started)
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+    conn.send(timings)
+    conn.close()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def scrape(base_url):
+    import requests
+    from prometheus_client.parser import text_string_to_metric_families
+
+    response = requests.get(f'{base_url}/metrics', headers={'Connection': 'close'}, timeout=10)
+    samples = {}
+    for family in text_string_to_metric_families(response.text):
+        for sample in family.samples:
+            samples[(sample.name, tuple(sorted(sample.labels.items())))] = sample.value
+    return samples
+
+
+def total(samples, name, **labels):
+    return sum(value for (sample_name, sample_labels), value in samples.items()
+               if sample_name == name and all((key, label) in sample_labels for key, label in labels.items()))
+
+
+def check_multiprocess(args):
+    import requests
+
+    metrics_dir = tempfile.mkdtemp(prefix='spf-metrics-')
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    with FakeShutterstock(failure_rate=args.failure_rate, seed=1) as fake:
+        env = dict(os.environ,
+                   DATABASE_URL=configure_database(),
+                   PROMETHEUS_MULTIPROC_DIR=metrics_dir,
+                   SHUTTERSTOCK_BASE_URL=fake.base_url,
+                   SHUTTERSTOCK_ACCESS_TOKEN='benchmark',
+                   SHUTTERSTOCK_RETRIES='0',
+                   IMAGE_POOL_SIZE='0',
+                   LOBBY_REAPER_INTERVAL='0')
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--workers', str(args.workers),
+             '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'src.app:app'],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            for _ in range(60):
+                try:
+                    requests.get(f'{base_url}/', timeout=10)
+                    break
+                except requests.RequestException:
+                    time.sleep(0.5)
+            session = requests.Session()
+            session.post(f'{base_url}/lobby', data={'game_mode': 'free-for-all', 'difficulty': 'hard'},
+                         allow_redirects=False)
+            page = session.get(f'{base_url}/lobby').text
+            lobby_id = re.search(r"const lobbyId = '([A-Z0-9]+)'", page).group(1)
+            statuses = images = 0
+            for index in range(args.requests):
+                # A new connection per request, so the workers share them out
+                if index % 4 == 0:
+                    requests.get(f'{base_url}/api/get-image', headers={'Connection': 'close'}, timeout=10)
+                    images += 1
+                else:
+                    requests.get(f'{base_url}/api/lobby/{lobby_id}/status', headers={'Connection': 'close'}, timeout=10)
+                    statuses += 1
+            scrapes = [scrape(base_url) for _ in range(args.workers * 2)]
+            worker_files = {name.rsplit('_', 1)[-1] for name in os.listdir(metrics_dir)}
+        finally:
+            server.terminate()
+            server.wait()
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+        searches = fake.requests
+
+    failures = []
+    for samples in scrapes:
+        seen = (total(samples, 'spf_http_requests_total', endpoint='game.lobby_status'),
+                total(samples, 'spf_http_requests_total', endpoint='game.get_image'),
+                total(samples, 'spf_upstream_requests_total', upstream='search'))
+        if seen != (statuses, images, searches):
+            failures.append(seen)
+    samples = scrapes[-1]
+    print(f'{args.workers} workers, {len(worker_files)} wrote metrics files')
+    print(f'sent          {statuses} status polls, {images} image fetches, fake Shutterstock saw {searches} searches')
+    upstream_errors = searches - total(samples, 'spf_upstream_requests_total', upstream='search', outcome='200')
+    print(f'/metrics      {total(samples, "spf_http_requests_total", endpoint="game.lobby_status"):.0f} status polls, '
+          f'{total(samples, "spf_http_requests_total", endpoint="game.get_image"):.0f} image fetches, '
+          f'{total(samples, "spf_upstream_requests_total", upstream="search"):.0f} searches '
+          f'({upstream_errors:.0f} failed)')
+    count = total(samples, 'spf_db_statements_per_request_count', endpoint='game.lobby_status')
+    statements = total(samples, 'spf_db_statements_per_request_sum', endpoint='game.lobby_status')
+    print(f'              {statements / count:.2f} SQL statements per status poll')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--polls', type=int, default=2000, help='status polls and guesses per overhead run')
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=200, help='requests sent to gunicorn')
+    parser.add_argument('--failure-rate', type=float, default=0.2)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    print(f'{"":<28}{"off p50":>10}{"on p50":>10}{"overhead":>11}')
+    for multiprocess in (False, True):
+        parent, child = context.Pipe()
+        process = context.Process(target=time_requests, args=(multiprocess, args.polls, child))
+        process.start()
+        timings = parent.recv()
+        process.join()
+        for label in timings[False]:
+            off = percentile(timings[False][label], 50) * 1e6
+            on = percentile(timings[True][label], 50) * 1e6
+            mode = 'multiprocess' if multiprocess else 'single process'
+            print(f'{label + ", " + mode:<28}{off:>8.0f}us{on:>8.0f}us{on - off:>9.0f}us')
+    print()
+
+    failures = check_multiprocess(args)
+    if failures:
+        print(f'multiprocess  FAILED ({len(failures)} scrapes disagree, first {failures[0]})')
+        raise SystemExit(1)
+    print('multiprocess  OK (every scrape adds up all workers)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Cost of the request profiler, and what its collapsed stacks show.
+
+Status polls and guesses through the test client, switching the profiler
+between off, --rate of requests and every request in alternating blocks.
+Reports p50 per setting, and the cost of the per-request check while it
+is off. Then prints the functions most samples ended in for each
+endpoint, and writes the .folded files to --output for flamegraph.pl or
+speedscope.
+
+    python -m benchmarks.profiler
+    python -m benchmarks.profiler --polls 5000 --output /tmp/profiles
+    flamegraph.pl /tmp/profiles/game.submit_word.*.folded > submit_word.svg
+"""
+import argparse
+import os
+import tempfile
+import time
+import timeit
+from collections import Counter
+
+from .common import configure_database, create_lobby, percentile, sample_image
+
+TITLE = ['mountains', 'sunrise', 'hiker', 'backpack', 'valley']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--polls', type=int, default=3000, help='status polls and guesses in total')
+    parser.add_argument('--rate', type=float, default=0.1, help='sampled share of requests for the middle setting')
+    parser.add_argument('--output', default=tempfile.mkdtemp(prefix='spf-profiles-'))
+    parser.add_argument('--top', type=int, default=8)
+    args = parser.parse_args()
+
+    configure_database(args.database_url)
+    os.environ['PROFILE_DIR'] = args.output
+    os.environ['LOBBY_REAPER_INTERVAL'] = '0'
+    os.environ['IMAGE_POOL_SIZE'] = '0'
+    import src.app as app_module
+
+    app = app_module.app
+    profiler = app_module.profiler
+    client = app.test_client()
+    lobby_id = create_lobby(client)
+    for index in range(4):
+        client.post(f'/api/lobby/{lobby_id}/join', json={'player_name': f'player{index}'})
+    client.post(f'/api/lobby/{lobby_id}/start', json={})
+    client.post(f'/api/lobby/{lobby_id}/next-round', json={'image_data': sample_image(TITLE)})
+
+    settings = (0.0, args.rate, 1.0)
+    timings = {rate: {'status': [], 'submit-word': []} for rate in settings}
+    for index in range(args.polls):
+        # Blocks of 50 so every setting sees the same database growth and machine noise
+        rate = settings[(index // 50) % len(settings)]
+        profiler.configure(sample_rate=rate)
+        started = time.perf_counter()
+        client.get(f'/api/lobby/{lobby_id}/status')
+        timings[rate]['status'].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        client.post(f'/api/lobby/{lobby_id}/submit-word',
+                    json={'player_name': f'player{index % 4}', 'word': f'miss{index}'})
+        timings[rate]['submit-word'].append(time.perf_counter() - started)
+    profiler.configure(sample_rate=0)
+
+    with app.test_request_context(f'/api/lobby/{lobby_id}/status'):
+        runs = 100000
+        disabled_check = timeit.timeit(profiler._before_request, number=runs) / runs
+
+    print(f'{"":<14}{"off":>10}{f"{args.rate:.0%}":>10}{"100%":>10}')
+    for label in timings[0.0]:
+        print(f'{label:<14}' + ''.join(f'{percentile(timings[rate][label], 50) * 1e6:>8.0f}us' for rate in settings))
+    print(f'check per request while off: {disabled_check * 1e9:.0f} ns')
+    print()
+
+    profiler.dump()
+    for endpoint, route in (('game.submit_word', 'submit-word'), ('game.lobby_status', 'status')):
+        stats = profiler.stats()['routes'].get(endpoint, {'requests': 0, 'samples': 0})
+        leaves = Counter()
+        for line in profiler.folded(endpoint).splitlines():
+            stack, count = line.rsplit(' ', 1)
+            leaves[stack.rsplit(';', 1)[-1]] += int(count)
+        total = sum(leaves.values()) or 1
+        print(f'{route}: {stats["requests"]} requests sampled, {stats["samples"]} samples')
+        for name, count in leaves.most_common(args.top):
+            print(f'  {count / total:6.1%}  {name}')
+    print()
+    print(f'collapsed stacks in {args.output}: {", ".join(sorted(os.listdir(args.output)))}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""SQL statement budget per endpoint.
+
+Plays a full game in every mode with a small and a large lobby, counts the
+statements each request sends to the database and fails (exit status 1) when
+any endpoint goes over its budget. Budgets don't depend on the number of
+players, so an N+1 query pattern shows up as a failure with the larger lobby.
+Meant to run in CI:
+
+    python -m benchmarks.query_budget
+    python -m benchmarks.query_budget --players 3 12 --database-url postgresql+psycopg2://localhost/spf_bench
+"""
+import argparse
+import threading
+
+from .common import configure_database, create_lobby, sample_image
+
+# Most statements one request may issue
+BUDGETS = {
+    'create lobby': 1,
+    'lobby page': 1,
+    'join': 7,
+    'start': 9,
+    'round image': 8,
+    'status (cold)': 5,
+    'status': 1,
+    'status (not modified)': 1,
+    'changes': 2,
+    'changes (up to date)': 1,
+    'submit (miss)': 3,
+    'submit (hit)': 5,
+    'submit batch': 5,
+    'forfeit': 7,
+    'reveal-all': 7,
+    'next round': 9,
+    'last round': 6,
+    'leaderboard': 2,
+    'results page': 3,
+    'end': 6,
+}
+
+WORDS = ['mountain', 'sunrise', 'hiker', 'backpack', 'valley']
+
+
+class StatementCounter:
+    """Counts statements sent through an engine"""
+
+    def __init__(self, engine):
+        self.count = 0
+        self._lock = threading.Lock()
+        from sqlalchemy import event
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+def play_game(client, counter, game_mode, players):
+    """Play one game and return [(label, statements, status code)]"""
+    measured = []
+
+    def measure(label, request):
+        before = counter.count
+        response = request()
+        measured.append((label, counter.count - before, response.status_code))
+        return response
+
+    before = counter.count
+    lobby_id = create_lobby(client, game_mode=game_mode)
+    measured.append(('create lobby', counter.count - before, 200))
+    measure('lobby page', lambda: client.get('/lobby'))
+    names = [f'player{index}' for index in range(players)]
+    for name in names:
+        measure('join', lambda: client.post(f'/api/lobby/{lobby_id}/join', json={'player_name': name}))
+    measure('start', lambda: client.post(f'/api/lobby/{lobby_id}/start', json={}))
+
+    for round_number in range(5):
+        measure('round image', lambda: client.post(f'/api/lobby/{lobby_id}/next-round',
+                                                   json={'image_data': sample_image(WORDS)}))
+        measure('status', lambda: client.get(f'/api/lobby/{lobby_id}/status'))
+        etag = client.get(f'/api/lobby/{lobby_id}/status').headers['ETag']
+        since = client.get(f'/api/lobby/{lobby_id}/status').json['lobby']['state_version']
+        measure('status (not modified)', lambda: client.get(f'/api/lobby/{lobby_id}/status',
+                                                            headers={'If-None-Match': etag}))
+        measure('submit batch', lambda: client.post(f'/api/lobby/{lobby_id}/submit-words',
+                                                    json={'player_name': names[0], 'words': ['yyy', WORDS[-1], 'xxx']}))
+        for index, name in enumerate(names):
+            word = WORDS[index % len(WORDS)]
+            measure('submit (miss)', lambda: client.post(f'/api/lobby/{lobby_id}/submit-word',
+                                                         json={'player_name': name, 'word': 'zzz'}))
+            client.post(f'/api/lobby/{lobby_id}/submit-word', json={'player_name': name, 'word': word})
+        measure('changes', lambda: client.get(f'/api/lobby/{lobby_id}/changes?since={since}'))
+        version = client.get(f'/api/lobby/{lobby_id}/changes?since={since}').json['version']
+        measure('changes (up to date)', lambda: client.get(f'/api/lobby/{lobby_id}/changes?since={version}'))
+        if round_number % 2:
+            measure('forfeit', lambda: client.post(f'/api/lobby/{lobby_id}/forfeit', json={}))
+        else:
+            measure('reveal-all', lambda: client.post(f'/api/lobby/{lobby_id}/reveal-all',
+                                                      json={'revealed_words': WORDS[:2]}))
+        measure('leaderboard', lambda: client.get(f'/api/lobby/{lobby_id}/leaderboard'))
+        label = 'last round' if round_number == 4 else 'next round'
+        measure(label, lambda: client.post(f'/api/lobby/{lobby_id}/next-round', json={}))
+
+    measure('results page', lambda: client.get(f'/results?lobby={lobby_id}'))
+    measure('end', lambda: client.post(f'/api/lobby/{lobby_id}/end', json={}))
+    return measured
+
+
+def measure_submit_hit(client, counter, players):
+    """Correct guesses, separately so each one really reveals a word"""
+    lobby_id = create_lobby(client)
+    names = [f'player{index}' for index in range(players)]
+    for name in names:
+        client.post(f'/api/lobby/{lobby_id}/join', json={'player_name': name})
+    client.post(f'/api/lobby/{lobby_id}/start', json={})
+    client.post(f'/api/lobby/{lobby_id}/next-round', json={'image_data': sample_image(WORDS)})
+    measured = []
+    for index, word in enumerate(WORDS):
+        before = counter.count
+        response = client.post(f'/api/lobby/{lobby_id}/submit-word',
+                               json={'player_name': names[index % len(names)], 'word': word})
+        measured.append(('submit (hit)', counter.count - before, response.status_code))
+    return measured
+
+
+def measure_cold_status(app_module, client, counter, players):
+    """Status of a lobby the state backend doesn't hold yet"""
+    lobby_id = create_lobby(client)
+    for index in range(players):
+        client.post(f'/api/lobby/{lobby_id}/join', json={'player_name': f'player{index}'})
+    app_module.state_backend.invalidate(lobby_id)
+    before = counter.count
+    response = client.get(f'/api/lobby/{lobby_id}/status')
+    return [('status (cold)', counter.count - before, response.status_code)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--players', type=int, nargs='+', default=[2, 8], help='lobby sizes to play')
+    args = parser.parse_args()
+
+    configure_database(args.database_url)
+    import src.app as app_module
+
+    with app_module.app.app_context():
+        counter = StatementCounter(app_module.db.engine)
+    client = app_module.app.test_client()
+
+    worst = {}
+    errors = []
+    for players in args.players:
+        measured = measure_cold_status(app_module, client, counter, players)
+        measured += measure_submit_hit(client, counter, players)
+        for game_mode in ('free-for-all', 'cooperative', 'competitive'):
+            measured += play_game(client, counter, game_mode, players)
+        for label, statements, status in measured:
+            if status >= 500:
+                errors.append(f'{label} returned {status} with {players} players')
+            key = (label, players)
+            worst[key] = max(worst.get(key, 0), statements)
+
+    failures = []
+    print(f'{"endpoint":<24}{"budget":>8}' + ''.join(f'{f"{n} players":>12}' for n in args.players))
+    for label, budget in BUDGETS.items():
+        counts = [worst.get((label, players)) for players in args.players]
+        row = ''.join(f'{"-" if count is None else count:>12}' for count in counts)
+        over = any(count is not None and count > budget for count in counts)
+        print(f'{label:<24}{budget:>8}{row}{"  OVER BUDGET" if over else ""}')
+        if over:
+            failures.append(label)
+    unbudgeted = sorted({label for label, _ in worst} - set(BUDGETS))
+    if unbudgeted or failures or errors:
+        for error in errors:
+            print(f'error: {error}')
+        if unbudgeted:
+            print(f'no budget for: {", ".join(unbudgeted)}')
+        raise SystemExit(1)
+    print('all endpoints within budget')
+
+
+if __name__ == '__main__':
+    main()
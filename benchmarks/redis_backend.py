@@ -0,0 +1,202 @@
+"""One game played through two app instances sharing the Redis state backend.
+
+Loads the app twice in this process, as two workers would be, and gives each
+copy its own RedisStateBackend on one in-memory fakeredis server. The host
+drives the game on one instance and the players join and guess on the other,
+while checking that:
+
+- state written by one instance is served by the other from the shared
+  cache, without reloading the lobby from the database
+- a /status?since=&wait= long-poll on one instance is woken by a write on
+  the other, well before its wait runs out
+- a /stream client on one instance receives every version written on the
+  other, in order
+
+Exits with status 1 when a check fails. Needs fakeredis
+(pip install -r requirements-dev.txt):
+
+    python -m benchmarks.redis_backend
+    python -m benchmarks.redis_backend --rounds 5 --players 6
+"""
+import argparse
+import importlib.util
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+from .common import configure_database, create_lobby, sample_image
+from .query_budget import StatementCounter
+
+WORDS = ['lighthouse', 'harbor', 'sailboat', 'evening', 'seagull']
+
+# A woken long-poll must answer well within this; it waits LONG_POLL_WAIT otherwise
+WAKE_LIMIT = 2.0
+LONG_POLL_WAIT = 10
+
+
+def load_instance(name, server):
+    """A separate copy of src.app (its own app, state backend and locks) on the shared Redis"""
+    import fakeredis
+    from src.state_backends import RedisStateBackend
+
+    spec = importlib.util.spec_from_file_location(f'src.{name}', os.path.join('src', 'app.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    module.state_backend = RedisStateBackend(client=fakeredis.FakeRedis(server=server))
+    with module.app.app_context():
+        counter = StatementCounter(module.db.engine)
+    return module, counter
+
+
+class StreamReader:
+    """Reads a /stream response on a thread and queues the (version, payload) events"""
+
+    def __init__(self, response):
+        self.events = queue.Queue()
+        self._response = response
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        buffer = ''
+        for chunk in self._response.response:
+            buffer += chunk.decode() if isinstance(chunk, bytes) else chunk
+            while '\n\n' in buffer:
+                event, buffer = buffer.split('\n\n', 1)
+                fields = dict(line.split(': ', 1) for line in event.split('\n') if not line.startswith(':'))
+                if 'data' in fields:
+                    self.events.put((int(fields['id']), json.loads(fields['data'])))
+
+    def wait_for(self, version, timeout=5):
+        """Versions received up to and including `version`, or None on timeout"""
+        seen = []
+        deadline = time.monotonic() + timeout
+        while not seen or seen[-1] < version:
+            try:
+                seen.append(self.events.get(timeout=max(0, deadline - time.monotonic()))[0])
+            except queue.Empty:
+                return None
+        return seen
+
+
+def long_poll(client, lobby_id, since, results):
+    started = time.monotonic()
+    response = client.get(f'/api/lobby/{lobby_id}/status?since={since}&wait={LONG_POLL_WAIT}')
+    results.append((response.status_code, time.monotonic() - started, response.get_json(silent=True)))
+
+
+def play(host, phones, counters, rounds, players):
+    """Play one game across the two instances and return the failed checks"""
+    failures = []
+
+    def check(ok, message):
+        if not ok:
+            failures.append(message)
+            print(f'FAIL {message}')
+
+    def version_of(client):
+        return client.get(f'/api/lobby/{lobby_id}/status').json['lobby']['state_version']
+
+    lobby_id = create_lobby(host)
+    # The host screen follows the lobby on one instance...
+    stream = StreamReader(host.get(f'/api/lobby/{lobby_id}/stream', buffered=False))
+    check(stream.wait_for(version_of(host)) is not None, 'stream sent no initial state')
+
+    # ...while the players' writes land on the other
+    names = [f'sailor{index}' for index in range(players)]
+    writes = []
+    for name in names:
+        response = phones.post(f'/api/lobby/{lobby_id}/join', json={'player_name': name})
+        check(response.status_code == 200, f'join {name} returned {response.status_code}')
+        writes.append(version_of(phones))
+
+    before = counters['host'].count
+    status = host.get(f'/api/lobby/{lobby_id}/status').json
+    check(sorted(p['player_name'] for p in status['participants']) == names,
+          'host instance does not see players who joined on the other instance')
+    check(counters['host'].count - before <= 1,
+          f'host instance reloaded the lobby ({counters["host"].count - before} statements) '
+          'instead of using the shared cache')
+
+    host.post(f'/api/lobby/{lobby_id}/start', json={})
+    for round_number in range(rounds):
+        host.post(f'/api/lobby/{lobby_id}/next-round', json={'image_data': sample_image(WORDS)})
+        writes.append(version_of(host))
+
+        for index, word in enumerate(WORDS):
+            since = version_of(host)
+            results = []
+            poller = threading.Thread(target=long_poll, args=(host, lobby_id, since, results))
+            poller.start()
+            time.sleep(0.1)
+            response = phones.post(f'/api/lobby/{lobby_id}/submit-word',
+                                   json={'player_name': names[index % players], 'word': word})
+            check(response.status_code == 200, f'guess {word!r} returned {response.status_code}')
+            written = version_of(phones)
+            writes.append(written)
+            poller.join(LONG_POLL_WAIT + 5)
+            code, elapsed, payload = results[0] if results else (None, None, None)
+            if code != 200 or elapsed > WAKE_LIMIT:
+                check(False, f'long-poll on the host instance was not woken by a guess on the other '
+                             f'(status {code}, {elapsed and round(elapsed, 2)}s)')
+            else:
+                check(payload['lobby']['state_version'] == written,
+                      f'long-poll answered version {payload["lobby"]["state_version"]}, expected {written}')
+                check(word in payload['lobby']['revealed_words'],
+                      f'long-poll payload is missing the word {word!r} guessed on the other instance')
+
+        before = counters['phones'].count
+        status = phones.get(f'/api/lobby/{lobby_id}/status').json
+        check(status['lobby']['current_round'] == round_number and
+              sorted(status['lobby']['revealed_words']) == sorted(WORDS),
+              f'phone instance has a stale round {round_number + 1}')
+        check(counters['phones'].count - before <= 1,
+              'phone instance reloaded the lobby instead of using the shared cache')
+        host.post(f'/api/lobby/{lobby_id}/next-round', json={})
+        writes.append(version_of(host))
+
+    seen = stream.wait_for(writes[-1])
+    if seen is None:
+        check(False, f'stream on the host instance stopped before version {writes[-1]}')
+    else:
+        check(seen == sorted(seen), f'stream versions out of order: {seen}')
+        missing = sorted(set(writes) - set(seen))
+        check(not missing, f'stream on the host instance never sent versions {missing}')
+    host.post(f'/api/lobby/{lobby_id}/end', json={})
+    return failures, len(writes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--rounds', type=int, default=5, choices=range(1, 6), help='rounds to play (a game has 5)')
+    parser.add_argument('--players', type=int, default=3)
+    args = parser.parse_args()
+
+    configure_database(args.database_url)
+    # Both copies must accept each other's session cookies, as gunicorn workers do
+    os.environ.setdefault('SECRET_KEY', 'redis-backend-benchmark')
+    os.environ.setdefault('IMAGE_POOL_SIZE', '0')
+    os.environ.setdefault('LOBBY_REAPER_INTERVAL', '0')
+    import fakeredis
+
+    server = fakeredis.FakeServer()
+    host_app, host_counter = load_instance('app_host', server)
+    phones_app, phones_counter = load_instance('app_phones', server)
+    counters = {'host': host_counter, 'phones': phones_counter}
+
+    started = time.perf_counter()
+    failures, writes = play(host_app.app.test_client(), phones_app.app.test_client(),
+                            counters, args.rounds, args.players)
+    print(f'{writes} writes across two instances in {time.perf_counter() - started:.1f}s')
+    if failures:
+        print(f'{len(failures)} check(s) failed')
+        raise SystemExit(1)
+    print('state, long-polls and streams shared across instances')
+
+
+if __name__ == '__main__':
+    main()
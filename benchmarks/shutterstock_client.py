@@ -0,0 +1,79 @@
+"""Shutterstock client behaviour against a local fake upstream.
+
+1. Keep-alive: sequential searches with plain requests.get (a new connection
+   each time) versus the shared pooled client.
+2. Outage: the fake starts failing every request. Round starts keep being
+   served from cached results once the circuit breaker opens, instead of
+   every request retrying the API.
+
+    python -m benchmarks.shutterstock_client
+    python -m benchmarks.shutterstock_client --searches 500 --latency 0.01
+"""
+import argparse
+import os
+import time
+
+import requests
+
+from .common import configure_database, percentile
+from .fake_shutterstock import FakeShutterstock
+
+
+def time_calls(count, call):
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--searches', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.0, help='fake upstream latency in seconds')
+    parser.add_argument('--outage-rounds', type=int, default=40)
+    args = parser.parse_args()
+
+    with FakeShutterstock(latency=args.latency, seed=1) as fake:
+        os.environ['SHUTTERSTOCK_BASE_URL'] = fake.base_url
+        os.environ['IMAGE_POOL_SIZE'] = '0'
+        configure_database()
+        import src.app as app_module
+
+        url = f'{fake.base_url}/images/search'
+        params = {'query': 'nature', 'per_page': 1}
+        connections = fake.connections
+        plain = time_calls(args.searches, lambda: requests.get(url, params=params, timeout=5))
+        plain_connections = fake.connections - connections
+        connections = fake.connections
+        pooled = time_calls(args.searches, lambda: app_module.shutterstock.search('nature'))
+        pooled_connections = fake.connections - connections
+        print(f'searches     {args.searches} sequential, upstream latency {args.latency * 1000:.0f} ms')
+        print(f'requests.get p50 {percentile(plain, 50) * 1000:.2f} ms, p99 {percentile(plain, 99) * 1000:.2f} ms, '
+              f'{plain_connections} connections')
+        print(f'pooled       p50 {percentile(pooled, 50) * 1000:.2f} ms, p99 {percentile(pooled, 99) * 1000:.2f} ms, '
+              f'{pooled_connections} connections')
+
+        client = app_module.app.test_client()
+        for _ in range(5):
+            client.get('/api/get-image?query=nature')
+        fake.failure_rate = 1.0
+        requests_before = fake.requests
+        statuses = {}
+        latencies = []
+        for _ in range(args.outage_rounds):
+            started = time.perf_counter()
+            response = client.get('/api/get-image?query=nature')
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        upstream = app_module.shutterstock.stats()
+        print(f'outage       {args.outage_rounds} round starts while every upstream call fails')
+        print(f'             statuses {dict(sorted(statuses.items()))}, '
+              f'upstream calls {fake.requests - requests_before}, served from cache {upstream["served_from_cache"]}, '
+              f'circuit {upstream["circuit"]}')
+        print(f'             p50 {percentile(latencies, 50) * 1000:.2f} ms, p99 {percentile(latencies, 99) * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Worker boot time: importing the app and its first responses, in fresh processes.
+
+Each run starts a new interpreter, like a gunicorn worker or an autoscaled
+instance, and measures:
+
+- import: `import src.app`, including whatever it does to the database
+- first page: GET / (template compilation)
+- first poll: GET /api/lobby/<id>/status (first database connection)
+
+It reports medians over --runs, with the schema prepared by each worker
+and with PREPARE_SCHEMA=false (gunicorn.conf.py runs `flask prepare-db`
+once in the master instead). It also shows the heaviest imports, and
+the time from launching gunicorn with --workers until the first response,
+with the schema prepared by the master and by a release step beforehand.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 10 --database-url postgresql+psycopg2://localhost/spf_bench
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from .common import configure_database
+
+WORKER = '''
+import json, time
+started = time.perf_counter()
+import src.app as app_module
+imported = time.perf_counter()
+client = app_module.app.test_client()
+page = client.get('/').status_code
+first_page = time.perf_counter()
+poll = client.get('/api/lobby/NOPE/status').status_code
+first_poll = time.perf_counter()
+import sys
+print(json.dumps({
+    'import': imported - started,
+    'first page': first_page - imported,
+    'first poll': first_poll - first_page,
+    'heavy modules': sorted(name for name in ('qrcode', 'PIL.Image', 'requests', 'prometheus_client')
+                            if name in sys.modules),
+    'status': [page, poll],
+}))
+'''
+HEAVY = ('qrcode', 'PIL', 'requests', 'prometheus_client', 'sqlalchemy', 'flask', 'flask_sqlalchemy', 'dotenv')
+
+
+def boot(env):
+    output = subprocess.run([sys.executable, '-c', WORKER], env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def import_breakdown(env):
+    """Cumulative import time of the heaviest top-level packages, from -X importtime"""
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import src.app'],
+                            env=env, capture_output=True, text=True, check=True)
+    cumulative = {}
+    for line in output.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, total, name = line.split('|')
+        name = name.strip()
+        if name in HEAVY or name == 'src.app':
+            cumulative[name] = max(cumulative.get(name, 0), int(total) / 1e6)
+    return cumulative
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def gunicorn_first_response(env, workers):
+    import requests
+
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--workers', str(workers),
+         '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'src.app:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < 60:
+            try:
+                requests.get(f'http://127.0.0.1:{port}/api/lobby/NOPE/status', timeout=30)
+                return time.perf_counter() - started
+            except requests.RequestException:
+                time.sleep(0.02)
+        return float('nan')
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    env = dict(os.environ, DATABASE_URL=configure_database(args.database_url),
+               LOBBY_REAPER_INTERVAL='0', IMAGE_POOL_SIZE='0', PYTHONPATH=os.getcwd())
+    env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    boot(env)  # creates the schema, so every measured run starts from the same database
+
+    configurations = (('schema prepared by each worker', {}),
+                      ('PREPARE_SCHEMA=false', {'PREPARE_SCHEMA': 'false'}))
+    # Interleaved, so both see the same machine noise
+    runs = {label: [] for label, _ in configurations}
+    for _ in range(args.runs):
+        for label, extra in configurations:
+            runs[label].append(boot(dict(env, **extra)))
+
+    print(f'{"median of " + str(args.runs) + " runs":<34}{"import":>9}{"1st page":>10}{"1st poll":>10}{"total":>9}')
+    for label, _ in configurations:
+        medians = {key: statistics.median(run[key] for run in runs[label]) for key in ('import', 'first page', 'first poll')}
+        print(f'{label:<34}' + ''.join(f'{medians[key] * 1000:>8.0f}ms' for key in medians)
+              + f'{sum(medians.values()) * 1000:>7.0f}ms')
+    print(f'heavy modules loaded by the first poll: {", ".join(runs[label][-1]["heavy modules"]) or "none"}')
+    print()
+
+    breakdown = import_breakdown(dict(env, PREPARE_SCHEMA='false'))
+    print('cumulative import time (one run, -X importtime)')
+    for name, seconds in sorted(breakdown.items(), key=lambda item: -item[1]):
+        print(f'  {name:<20}{seconds * 1000:>7.0f}ms')
+    print()
+    print(f'gunicorn, {args.workers} workers: first response after launch')
+    for label, extra in (('schema prepared by the master', {}),
+                         ('PREPARE_SCHEMA=false', {'PREPARE_SCHEMA': 'false'})):
+        print(f'  {label:<32}{gunicorn_first_response(dict(env, **extra), args.workers) * 1000:>7.0f}ms')
+
+
+if __name__ == '__main__':
+    main()
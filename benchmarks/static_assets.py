@@ -0,0 +1,91 @@
+"""Static asset bytes and requests per visit, plain /static/ files versus fingerprinted ones.
+
+For every page a phone or host opens (home, lobby, join, game, results),
+collects the /static/ URLs the page links and checks they are all
+fingerprinted. Then, for those assets, compares:
+
+- first visit: bytes sent, plain files (what Flask's static view served
+  before) versus the precompressed fingerprinted copies
+- next visit: requests a browser has to make; plain files are
+  revalidated, fingerprinted ones are immutable and come from its cache
+- p50 server time per asset request for both
+
+    python -m benchmarks.static_assets
+"""
+import argparse
+import re
+import time
+
+from .common import configure_database, create_lobby, percentile
+
+STATIC_URL = re.compile(r'(?:href|src)="(/static/[^"]+)"')
+FINGERPRINTED = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000, help='timed requests per asset and variant')
+    args = parser.parse_args()
+
+    configure_database()
+    import src.app as app_module
+
+    app = app_module.app
+    client = app.test_client()
+    lobby_id = create_lobby(client)
+    pages = ['/', '/lobby', f'/join/{lobby_id}', '/game', f'/game?lobby_id={lobby_id}', '/results']
+    urls = set()
+    plain_links = []
+    for page in pages:
+        html = client.get(page).get_data(as_text=True)
+        for url in STATIC_URL.findall(html):
+            urls.add(url)
+            if not FINGERPRINTED.search(url):
+                plain_links.append((page, url))
+
+    accept = {'Accept-Encoding': 'gzip, deflate, br'}
+    first_plain = first_hashed = 0
+    revalidations = 0
+    timings = {'plain (send_static_file)': [], 'fingerprinted': []}
+    print(f'{"asset":<34}{"plain":>9}{"sent":>9}  encoding')
+    for url in sorted(urls):
+        name = re.sub(r'\.[0-9a-f]{12}(\.[^./]+)$', r'\1', url[len('/static/'):])
+        with app.test_request_context(f'/static/{name}', headers=accept):
+            plain = app.send_static_file(name)
+            plain.direct_passthrough = False
+            plain_size = len(plain.get_data())
+            plain.close()
+        response = client.get(url, headers=accept)
+        first_plain += plain_size
+        first_hashed += len(response.get_data())
+        if 'immutable' not in response.headers.get('Cache-Control', ''):
+            revalidations += 1
+        print(f'{name:<34}{plain_size:>9}{len(response.get_data()):>9}  {response.headers.get("Content-Encoding", "identity")}')
+
+        for _ in range(args.requests):
+            with app.test_request_context(f'/static/{name}', headers=accept):
+                started = time.perf_counter()
+                plain = app.send_static_file(name)
+                plain.direct_passthrough = False
+                plain.get_data()
+                plain.close()
+                timings['plain (send_static_file)'].append(time.perf_counter() - started)
+            with app.test_request_context(url, headers=accept):
+                started = time.perf_counter()
+                app_module.static_assets.send(url[len('/static/'):]).get_data()
+                timings['fingerprinted'].append(time.perf_counter() - started)
+
+    print()
+    print(f'first visit   {first_plain} bytes plain, {first_hashed} bytes fingerprinted '
+          f'({first_hashed / first_plain:.0%})')
+    print(f'next visit    {len(urls)} revalidations plain, {revalidations} fingerprinted')
+    for label, values in timings.items():
+        print(f'{label:<26} p50 {percentile(values, 50) * 1e6:6.0f} us per asset')
+    if plain_links:
+        print(f'links         FAILED, not fingerprinted: {plain_links}')
+        raise SystemExit(1)
+    print(f'links         OK ({len(urls)} assets, all fingerprinted on {len(pages)} pages)')
+
+
+if __name__ == '__main__':
+    main()
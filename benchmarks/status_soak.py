@@ -0,0 +1,180 @@
+"""Soak test of GET /api/lobby/<id>/status for each database backend.
+
+Reader threads poll a lobby while writer threads keep submitting guesses to
+it, for --duration seconds. Then the pool sits idle. With --kill-idle on
+PostgreSQL, the server also closes every pooled connection meanwhile, the
+way a managed database or proxy drops idle ones, and the first requests
+afterwards are timed separately. Each database URL runs in its own process
+with the app's normal engine settings (DB_* environment variables apply).
+
+    python -m benchmarks.status_soak
+    python -m benchmarks.status_soak --database-url sqlite:////tmp/soak.db postgresql+psycopg2://localhost/spf_bench --kill-idle
+    DB_POOL_PRE_PING=false python -m benchmarks.status_soak --database-url postgresql+psycopg2://localhost/spf_bench --kill-idle
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+from .common import configure_database, create_lobby, percentile, sample_image
+
+WORDS = ['mountain', 'sunrise', 'hiker', 'backpack', 'valley']
+
+
+def kill_pooled_connections(db):
+    """Terminate every other connection to the database, as an idle timeout would"""
+    with db.engine.connect() as conn:
+        conn.execute(db.text(
+            'SELECT pg_terminate_backend(pid) FROM pg_stat_activity '
+            'WHERE datname = current_database() AND pid <> pg_backend_pid()'))
+        conn.commit()
+
+
+def run_backend(database_url, args, results):
+    configure_database(database_url)
+    os.environ['STATE_BACKEND'] = args.state_backend
+    os.environ['LOBBY_REAPER_INTERVAL'] = '0'
+    import src.app as app_module
+
+    with app_module.app.app_context():
+        dialect = app_module.db.engine.dialect.name
+    client = app_module.app.test_client()
+    lobby_id = create_lobby(client)
+    for index in range(args.players):
+        client.post(f'/api/lobby/{lobby_id}/join', json={'player_name': f'player{index}'})
+    client.post(f'/api/lobby/{lobby_id}/start', json={})
+    client.post(f'/api/lobby/{lobby_id}/next-round', json={'image_data': sample_image(WORDS)})
+
+    lock = threading.Lock()
+    reads = []
+    writes = []
+    errors = {}
+    stop = threading.Event()
+
+    def record(kind, status):
+        if status >= 500:
+            with lock:
+                errors[kind] = errors.get(kind, 0) + 1
+
+    def reader():
+        local = []
+        thread_client = app_module.app.test_client()
+        while not stop.is_set():
+            started = time.perf_counter()
+            response = thread_client.get(f'/api/lobby/{lobby_id}/status')
+            local.append(time.perf_counter() - started)
+            record('status', response.status_code)
+        with lock:
+            reads.extend(local)
+
+    def writer(index):
+        local = []
+        thread_client = app_module.app.test_client()
+        attempt = 0
+        while not stop.is_set():
+            attempt += 1
+            started = time.perf_counter()
+            response = thread_client.post(f'/api/lobby/{lobby_id}/submit-word',
+                                          json={'player_name': f'player{index % args.players}',
+                                                'word': f'miss{index}x{attempt}'})
+            local.append(time.perf_counter() - started)
+            record('submit', response.status_code)
+        with lock:
+            writes.extend(local)
+
+    threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+    threads += [threading.Thread(target=writer, args=(index,)) for index in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    # Idle period, then the first requests that find whatever is left in the pool
+    time.sleep(args.idle)
+    killed = False
+    if args.kill_idle and dialect == 'postgresql':
+        with app_module.app.app_context():
+            kill_pooled_connections(app_module.db)
+        killed = True
+    after_idle = []
+    after_idle_errors = 0
+    for _ in range(args.readers):
+        started = time.perf_counter()
+        try:
+            status = client.get(f'/api/lobby/{lobby_id}/status').status_code
+        except Exception:
+            status = 500
+        after_idle.append(time.perf_counter() - started)
+        if status >= 500:
+            after_idle_errors += 1
+
+    options = app_module.app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    results.put({
+        'database': database_url.split('@')[-1],
+        'dialect': dialect,
+        'pool': f"size {options.get('pool_size', '-')}, overflow {options.get('max_overflow', '-')}, "
+                f"pre-ping {options.get('pool_pre_ping', '-')}",
+        'reads': reads,
+        'writes': writes,
+        'errors': errors,
+        'after_idle': after_idle,
+        'after_idle_errors': after_idle_errors,
+        'killed': killed
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', nargs='+', default=[None], help='one run per URL (default: temporary SQLite)')
+    parser.add_argument('--state-backend', default='sqlalchemy',
+                        help='sqlalchemy (default) decodes every status from the database')
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--players', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--idle', type=float, default=2.0, help='seconds without traffic before the last burst')
+    parser.add_argument('--kill-idle', action='store_true',
+                        help='PostgreSQL only: drop pooled connections server-side while idle')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    failed = False
+    for database_url in args.database_url:
+        database_url = configure_database(database_url)
+        results = context.Queue()
+        process = context.Process(target=run_backend, args=(database_url, args, results))
+        process.start()
+        result = None
+        while result is None:
+            try:
+                result = results.get(timeout=1)
+            except queue.Empty:
+                if not process.is_alive():
+                    break
+        process.join()
+        if result is None:
+            print(f'{database_url.split("@")[-1]}: benchmark process failed')
+            failed = True
+            continue
+
+        print(f"{result['dialect']:<10} {result['database']}")
+        print(f"  pool        {result['pool']}")
+        for label, values in (('status', result['reads']), ('submit', result['writes'])):
+            print(f'  {label:<11} p50 {percentile(values, 50) * 1000:6.1f} ms, '
+                  f'p99 {percentile(values, 99) * 1000:6.1f} ms, '
+                  f'{len(values) / args.duration:7.1f} req/s, {result["errors"].get(label, 0)} errors')
+        after_idle = result['after_idle']
+        print(f"  after idle  p50 {percentile(after_idle, 50) * 1000:6.1f} ms, "
+              f"max {max(after_idle, default=0) * 1000:6.1f} ms, {result['after_idle_errors']} errors"
+              f"{' (pooled connections were killed)' if result['killed'] else ''}")
+        failed = failed or bool(result['errors']) or bool(result['after_idle_errors'])
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
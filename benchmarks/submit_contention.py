@@ -0,0 +1,173 @@
+"""Concurrent submit-word load test.
+
+Every player in every lobby submits every hidden word at the same time, from
+several processes (separate app instances, like gunicorn workers) with
+several threads each. Afterwards the database is checked for lost updates
+and double-awarded points.
+
+    python -m benchmarks.submit_contention
+    python -m benchmarks.submit_contention --database-url postgresql://localhost/spf_bench
+"""
+import argparse
+import multiprocessing
+import random
+import threading
+import time
+
+from .common import configure_database, create_lobby, percentile, sample_image
+
+WORDS = ['mountain', 'sunrise', 'hiker', 'backpack', 'valley', 'forest', 'river', 'clouds']
+
+
+def setup_lobbies(lobbies, players, words):
+    from src.app import app
+
+    client = app.test_client()
+    lobby_ids = []
+    for _ in range(lobbies):
+        lobby_id = create_lobby(client)
+        for index in range(players):
+            client.post(f'/api/lobby/{lobby_id}/join', json={'player_name': f'player{index}'})
+        client.post(f'/api/lobby/{lobby_id}/start', json={})
+        client.post(f'/api/lobby/{lobby_id}/next-round', json={'image_data': sample_image(words)})
+        lobby_ids.append(lobby_id)
+    return lobby_ids
+
+
+def run_worker(database_url, jobs, threads, start_at, results):
+    """One process: fire its share of submissions from several threads"""
+    configure_database(database_url)
+    from src.app import app
+
+    chunks = [jobs[i::threads] for i in range(threads)]
+    latencies = []
+    outcomes = []
+    lock = threading.Lock()
+
+    def fire(chunk):
+        client = app.test_client()
+        local_latencies = []
+        local_outcomes = []
+        for lobby_id, player_name, word in chunk:
+            started = time.perf_counter()
+            response = client.post(f'/api/lobby/{lobby_id}/submit-word',
+                                   json={'player_name': player_name, 'word': word})
+            local_latencies.append(time.perf_counter() - started)
+            body = response.get_json(silent=True) or {}
+            local_outcomes.append((lobby_id, player_name, word, response.status_code, bool(body.get('is_correct'))))
+        with lock:
+            latencies.extend(local_latencies)
+            outcomes.extend(local_outcomes)
+
+    workers = [threading.Thread(target=fire, args=(chunk,)) for chunk in chunks]
+    # Line every process up so the submissions really overlap
+    time.sleep(max(0, start_at - time.time()))
+    began = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    results.put((began, time.time(), latencies, outcomes))
+
+
+def check_lobbies(lobby_ids, words, outcomes):
+    """Compare the stored state with what a serial game would have produced"""
+    from src.app import app
+    from src.models import db, Lobby
+
+    accepted = {}
+    correct = {}
+    for lobby_id, player_name, word, status, is_correct in outcomes:
+        if status == 200:
+            accepted.setdefault((lobby_id, player_name), set()).add(word)
+        if is_correct:
+            correct[lobby_id] = correct.get(lobby_id, 0) + 1
+
+    expected_total = len(words) * 10 + 100
+    problems = []
+    with app.app_context():
+        for lobby_id in lobby_ids:
+            lobby = db.session.get(Lobby, lobby_id)
+            lobby_data = lobby.to_dict()
+            revealed = lobby_data['revealed_words']
+            owners = lobby_data['word_owners']
+            total = sum(p.score for p in lobby.participants)
+            if sorted(revealed) != sorted(words):
+                problems.append(f'{lobby_id}: revealed {len(revealed)}/{len(words)} words')
+            if len(owners) != len(words):
+                problems.append(f'{lobby_id}: {len(owners)} owners for {len(words)} words')
+            if total != expected_total:
+                problems.append(f'{lobby_id}: scores add up to {total}, expected {expected_total}')
+            if correct.get(lobby_id, 0) != len(words):
+                problems.append(f'{lobby_id}: {correct.get(lobby_id, 0)} correct responses for {len(words)} words')
+            for participant in lobby.participants:
+                stored = participant.to_dict()['guessed_words']
+                if len(stored) != len(set(stored)) or set(stored) != accepted.get((lobby_id, participant.player_name), set()):
+                    problems.append(f'{lobby_id}: lost or duplicated guesses for {participant.player_name}')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--lobbies', type=int, default=10)
+    parser.add_argument('--players', type=int, default=6)
+    parser.add_argument('--words', type=int, default=6)
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    database_url = configure_database(args.database_url)
+    words = WORDS[:args.words]
+    lobby_ids = setup_lobbies(args.lobbies, args.players, words)
+
+    jobs = [(lobby_id, f'player{index}', word)
+            for lobby_id in lobby_ids for index in range(args.players) for word in words]
+    random.Random(args.seed).shuffle(jobs)
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    start_at = time.time() + 5
+    processes = [
+        context.Process(target=run_worker,
+                        args=(database_url, jobs[i::args.processes], args.threads, start_at, results))
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    spans = []
+    latencies = []
+    outcomes = []
+    for _ in processes:
+        began, finished, process_latencies, process_outcomes = results.get()
+        spans.append((began, finished))
+        latencies.extend(process_latencies)
+        outcomes.extend(process_outcomes)
+    for process in processes:
+        process.join()
+    slowest = max(latencies) if latencies else 0
+    wall = max(end for _, end in spans) - min(start for start, _ in spans)
+
+    statuses = {}
+    for outcome in outcomes:
+        statuses[outcome[3]] = statuses.get(outcome[3], 0) + 1
+    problems = check_lobbies(lobby_ids, words, outcomes)
+
+    print(f'database     {database_url.split("@")[-1]}')
+    print(f'submissions  {len(jobs)} ({args.lobbies} lobbies x {args.players} players x {len(words)} words)')
+    print(f'concurrency  {args.processes} processes x {args.threads} threads')
+    print(f'throughput   {len(jobs) / wall:.1f} submits/s over {wall:.2f}s')
+    print(f'latency      p50 {percentile(latencies, 50) * 1000:.1f} ms, '
+          f'p99 {percentile(latencies, 99) * 1000:.1f} ms, max {slowest * 1000:.1f} ms')
+    print(f'statuses     {dict(sorted(statuses.items()))}')
+    if problems:
+        print(f'correctness  FAILED ({len(problems)} problems)')
+        for problem in problems[:20]:
+            print(f'  {problem}')
+        raise SystemExit(1)
+    print('correctness  OK (no lost updates, every word awarded exactly once)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Per-title cost of extract_words before and after the tokenizer module.
+
+"before" is the old inline implementation, which rebuilt the stop-word set
+and went through re.sub on every call. "after (cold)" tokenizes titles the
+memo hasn't seen; "after (warm)" repeats them, as when the same image comes
+back in a later batch.
+
+    python -m benchmarks.tokenizer
+    python -m benchmarks.tokenizer --titles 20000 --repeat 5
+"""
+import argparse
+import random
+import time
+
+from src.tokenizer import STOP_WORDS, _tokenize, extract_words, extract_words_batch
+
+from .fake_shutterstock import DESCRIPTIONS
+
+PREFIXES = ['', 'Close-up of ', 'Top view: ', 'Beautiful ', 'Candid photo - ', 'Aerial shot of ', 'Stock image, ']
+SUFFIXES = ['', '.', ' in summer.', ' (copy space)', ', vertical composition', ' at golden hour!', ' - 4K']
+STOP_WORD_LIST = list(STOP_WORDS)
+
+
+def legacy_extract_words(title):
+    """The old extract_words"""
+    import re
+    common_words = set(STOP_WORD_LIST)
+    words = re.sub(r'[^\w\s]', ' ', title.lower())
+    words = words.split()
+    return [w for w in words if len(w) >= 3 and w not in common_words]
+
+
+def build_corpus(count, seed):
+    rng = random.Random(seed)
+    titles = set()
+    while len(titles) < count:
+        words = rng.choice(DESCRIPTIONS).split()
+        rng.shuffle(words)
+        titles.add(rng.choice(PREFIXES) + ' '.join(words[:rng.randint(5, len(words))]) + rng.choice(SUFFIXES))
+    return list(titles)
+
+
+def per_title(titles, repeat, run):
+    best = float('inf')
+    for _ in range(repeat):
+        _tokenize.cache_clear()
+        started = time.perf_counter()
+        run(titles)
+        best = min(best, time.perf_counter() - started)
+    return best / len(titles) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--titles', type=int, default=4000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    titles = build_corpus(args.titles, args.seed)
+    for title in titles:
+        if legacy_extract_words(title) != extract_words(title):
+            raise SystemExit(f'Tokenizer output differs for {title!r}')
+
+    before = per_title(titles, args.repeat, lambda ts: [legacy_extract_words(t) for t in ts])
+    cold = per_title(titles, args.repeat, lambda ts: [extract_words(t) for t in ts])
+    batch = per_title(titles, args.repeat, extract_words_batch)
+
+    def warm_run(ts):
+        extract_words_batch(ts)
+        started = time.perf_counter()
+        extract_words_batch(ts)
+        return time.perf_counter() - started
+
+    warm = float('inf')
+    for _ in range(args.repeat):
+        _tokenize.cache_clear()
+        warm = min(warm, warm_run(titles))
+    warm = warm / len(titles) * 1e6
+
+    print(f'corpus        {len(titles)} stock-photo titles (output identical to the old code)')
+    print(f'before        {before:.2f} us/title')
+    print(f'after (cold)  {cold:.2f} us/title')
+    print(f'batch (cold)  {batch:.2f} us/title')
+    print(f'after (warm)  {warm:.2f} us/title')
+
+
+if __name__ == '__main__':
+    main()
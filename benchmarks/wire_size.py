@@ -0,0 +1,80 @@
+"""Bytes per status poll for a 10-player lobby, by payload view and encoding.
+
+"before" is the old response: json.dumps of the full payload, uncompressed.
+The other rows are real /status responses with the Accept and
+Accept-Encoding headers a browser or phone would send. Header bytes are
+counted too. A 304 revalidation is shown for comparison.
+
+    python -m benchmarks.wire_size
+    python -m benchmarks.wire_size --players 20
+"""
+import argparse
+import json
+
+from .common import configure_database, create_lobby
+
+TITLE = 'Young woman hiking on a mountain trail at sunrise with a backpack and trekking poles'
+
+
+def header_bytes(response):
+    return len(f'HTTP/1.1 {response.status}\r\n') + sum(
+        len(f'{name}: {value}\r\n') for name, value in response.headers.items()) + 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=10)
+    args = parser.parse_args()
+
+    configure_database()
+    import src.app as app_module
+    from src.tokenizer import extract_words
+
+    client = app_module.app.test_client()
+    lobby_id = create_lobby(client)
+    for index in range(args.players):
+        client.post(f'/api/lobby/{lobby_id}/join', json={'player_name': f'Player {index + 1}'})
+    client.post(f'/api/lobby/{lobby_id}/start', json={})
+    words = extract_words(TITLE)
+    image_data = {
+        'id': '2291234567',
+        'url': 'https://image.shutterstock.com/image-photo/young-woman-hiking-on-mountain-600w-2291234567.jpg',
+        'title': TITLE,
+        'title_words': words,
+        'easy_mode_hidden_words': [],
+        'contributor': 'Mountain Studio'
+    }
+    client.post(f'/api/lobby/{lobby_id}/next-round', json={'image_data': image_data})
+    for index in range(args.players):
+        client.post(f'/api/lobby/{lobby_id}/submit-word',
+                    json={'player_name': f'Player {index + 1}', 'word': words[index % len(words)]})
+        client.post(f'/api/lobby/{lobby_id}/submit-word',
+                    json={'player_name': f'Player {index + 1}', 'word': f'guess{index}'})
+
+    full = client.get(f'/api/lobby/{lobby_id}/status')
+    before_body = len(json.dumps(full.json).encode())
+    rows = [('before (full JSON)', before_body, header_bytes(full))]
+    compact_accept = app_module.COMPACT_MIMETYPE
+    encodings = ['identity', 'gzip'] + (['br'] if 'br' in app_module.response_compressor.encodings else [])
+    for view, accept in (('full', 'application/json'), ('compact', compact_accept)):
+        for encoding in encodings:
+            response = client.get(f'/api/lobby/{lobby_id}/status',
+                                  headers={'Accept': accept, 'Accept-Encoding': encoding})
+            assert response.headers.get('Content-Encoding', 'identity') == encoding, response.headers
+            rows.append((f'{view} + {encoding}', len(response.get_data()), header_bytes(response)))
+    etag = full.headers['ETag']
+    not_modified = client.get(f'/api/lobby/{lobby_id}/status', headers={'If-None-Match': etag})
+    rows.append(('304 revalidation', 0, header_bytes(not_modified)))
+
+    print(f'{args.players}-player lobby, one round in progress')
+    print(f'{"":<22}{"body":>8}{"headers":>9}{"total":>8}{"vs before":>11}')
+    before_total = rows[0][1] + rows[0][2]
+    for label, body, headers in rows:
+        total = body + headers
+        print(f'{label:<22}{body:>8}{headers:>9}{total:>8}{total / before_total:>10.0%}')
+    if 'br' not in encodings:
+        print('(brotli not installed, so no br row)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""gunicorn settings; gunicorn loads this file from the working directory on its own"""
+import glob
+import os
+import subprocess
+import sys
+import tempfile
+
+# Every worker writes its Prometheus metrics here and /metrics adds them up,
+# so the numbers are right whichever worker answers the scrape
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                      os.path.join(tempfile.gettempdir(), 'stock-photo-frenzy-metrics'))
+
+
+def on_starting(server):
+    """Start with empty metrics and prepare the schema once, before any worker boots"""
+    # Files left by a previous run would be added in otherwise
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, '*.db')):
+        os.remove(path)
+
+    if os.getenv('PREPARE_SCHEMA', 'true').lower() in ('0', 'false', 'no'):
+        return
+    # In a child process so the master doesn't import the app (workers fork
+    # from it and would inherit its database connections)
+    result = subprocess.run([sys.executable, '-m', 'flask', '--app', 'src.app', 'prepare-db'],
+                            env=dict(os.environ, PREPARE_SCHEMA='false', LOBBY_REAPER_INTERVAL='0'))
+    if result.returncode == 0:
+        os.environ['PREPARE_SCHEMA'] = 'false'
+    else:
+        print('Error preparing the database schema; each worker will try on boot')
+
+
+def post_fork(server, worker):
+    """Let psycopg2 wait on PostgreSQL through gevent instead of blocking the whole worker"""
+    # Without this every query stalls all of the worker's greenlets, streams and long-polls included
+    if 'gevent' in server.cfg.worker_class_str:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
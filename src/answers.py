@@ -0,0 +1,50 @@
+import functools
+from collections import Counter
+
+from .tokenizer import normalize_word
+
+
+class AnswerIndex:
+    """The words to find in a round, indexed once so checking a guess is a lookup.
+
+    `counts` maps each hidden title word to how often it appears in the
+    title (points are per occurrence); `aliases` maps the normalized form of
+    each one (see normalize_word) to the title word, so "puppies" finds
+    "puppy" and "cafe" finds "café".
+    """
+
+    def __init__(self, hidden_words):
+        self.counts = Counter(hidden_words)
+        self.aliases = {}
+        for word in self.counts:
+            self.aliases.setdefault(normalize_word(word), word)
+
+    @classmethod
+    def for_image(cls, image_data):
+        """Index of the words hidden in a round's image data (easy mode hides only some)"""
+        if not isinstance(image_data, dict):
+            return _index(())
+        hidden = image_data.get('easy_mode_hidden_words') or image_data.get('title_words')
+        if not isinstance(hidden, list):
+            return _index(())
+        # Rounds stored before next_round validated image_data may hold anything
+        return _index(tuple(word for word in hidden if isinstance(word, str)))
+
+    def __len__(self):
+        return len(self.counts)
+
+    def match(self, guess):
+        """Return the hidden title word a guess stands for, or None"""
+        if guess in self.counts:
+            return guess
+        return self.aliases.get(normalize_word(guess))
+
+    def remaining(self, revealed):
+        """How many distinct hidden words are not in `revealed` yet"""
+        return sum(1 for word in self.counts if word not in revealed)
+
+
+@functools.lru_cache(maxsize=1024)
+def _index(hidden_words):
+    # Rebuilt lobby states (reloads, shared backends) reuse the index of the round
+    return AnswerIndex(hidden_words)
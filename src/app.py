@@ -1,24 +1,43 @@
 import os
 import secrets
-import string
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
+from flask import Blueprint, Flask, render_template, request, redirect, url_for, session, jsonify, Response, g
 from dotenv import load_dotenv
-from .models import db, Lobby, LobbyParticipant
-import qrcode
-import io
-import base64
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.exc import StaleDataError
+from .database import configure_sqlite, engine_options, normalize_database_url
+from .models import db, ArchivedGame, Lobby, LobbyChange, LobbyParticipant, prepare_database
+from .lobby_state import DuplicateGuess, LobbyLocks, LobbyState, StaleLobbyState, write_guesses
+from .state_backends import create_state_backend
+from .image_pool import ImagePool
+from .image_proxy import MIMETYPES as IMAGE_MIMETYPES, ImageProxy, ImageProxyError
+from .shutterstock import ShutterstockClient, ShutterstockError
+from .tokenizer import extract_words
+from .lobby_codes import LobbyCodeExhausted, create_lobby
+from .lobby_reaper import LobbyReaper
+from .metrics import Metrics
+from .profiler import RequestProfiler, parse_rates
+from .qr_codes import MIMETYPES as QR_MIMETYPES, QRCodeCache
+from .assets import StaticAssets
+from .wire import COMPACT_MIMETYPE, ResponseCompressor, compact_body, wants_compact
+import functools
 import json
+import queue
 import random
-import requests
+import tempfile
+import time
+from datetime import timedelta
 
-# Load environment variables
+# Load environment variables; the settings below are read at import
 load_dotenv()
 
-app = Flask(__name__, 
-            template_folder='../templates', 
-            static_folder='../static',
-            static_url_path='/static')
-app.secret_key = os.getenv('SECRET_KEY', secrets.token_hex(16))
+# Pages and API endpoints; create_app() registers them under the name "game"
+bp = Blueprint('game', __name__)
+
+SECRET_KEY = os.getenv('SECRET_KEY', secrets.token_hex(16))
+
+# Static files are fingerprinted and gzip/brotli-compressed once at startup;
+# templates link them with asset_url() so they can be cached for good
+static_assets = StaticAssets()
 
 # Database configuration
 database_url = os.getenv('DATABASE_URL')
@@ -26,23 +45,96 @@ if not database_url:
     # Default to SQLite for local development
     db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'stock_photo_frenzy.db')
     database_url = f'sqlite:///{db_path}'
-elif database_url.startswith('postgres://'):
-    # Handle Render's postgres:// URL format (needs postgresql://)
-    database_url = database_url.replace('postgres://', 'postgresql://', 1)
-elif database_url.startswith('postgresql://'):
-    # Already correct format
-    pass
+else:
+    # Render's postgres:// and plain postgresql:// URLs both need the psycopg2 driver named
+    database_url = normalize_database_url(database_url)
+
+# Connection pool per worker process. DB_MAX_CONNECTIONS is shared out
+# between the WEB_CONCURRENCY gunicorn workers unless DB_POOL_SIZE and
+# DB_MAX_OVERFLOW are set explicitly.
+DATABASE_ENGINE_OPTIONS = engine_options(
+    database_url,
+    workers=int(os.getenv('WEB_CONCURRENCY', 1)),
+    max_connections=int(os.getenv('DB_MAX_CONNECTIONS', 20)),
+    pool_size=int(os.getenv('DB_POOL_SIZE')) if os.getenv('DB_POOL_SIZE') else None,
+    max_overflow=int(os.getenv('DB_MAX_OVERFLOW')) if os.getenv('DB_MAX_OVERFLOW') else None,
+    pool_timeout=float(os.getenv('DB_POOL_TIMEOUT', 10)),
+    pool_recycle=int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    pre_ping=os.getenv('DB_POOL_PRE_PING', 'true').lower() not in ('0', 'false', 'no'),
+    statement_timeout_ms=int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 5000))
+)
 
-app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Tables are created and upgraded when the app is built, unless
+# PREPARE_SCHEMA=false; gunicorn.conf.py does it once in the master with
+# `flask --app src.app prepare-db` and sets that for the workers
+PREPARE_SCHEMA = os.getenv('PREPARE_SCHEMA', 'true').lower() not in ('0', 'false', 'no')
 
-# Initialize database
-db.init_app(app)
+# Prometheus metrics on /metrics (METRICS_ENABLED=false turns them off). Set
+# PROMETHEUS_MULTIPROC_DIR when running several workers; gunicorn.conf.py
+# does that by default
+metrics = Metrics(enabled=os.getenv('METRICS_ENABLED', 'true').lower() not in ('0', 'false', 'no'))
+
+# Stack sampling of PROFILE_SAMPLE_RATE of requests (PROFILE_ROUTES sets
+# rates per endpoint, e.g. game.submit_word=0.2), written as .folded files to
+# PROFILE_DIR. Off by default; PROFILE_ADMIN_TOKEN enables /api/admin/profiler
+profiler = RequestProfiler(
+    os.getenv('PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'stock-photo-frenzy-profiles'),
+    sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', 0)),
+    route_rates=parse_rates(os.getenv('PROFILE_ROUTES')),
+    interval=float(os.getenv('PROFILE_INTERVAL_MS', 5)) / 1000
+)
+PROFILE_ADMIN_TOKEN = os.getenv('PROFILE_ADMIN_TOKEN', '')
 
 # Shutterstock API configuration
 SHUTTERSTOCK_BASE_URL = os.getenv('SHUTTERSTOCK_BASE_URL', 'https://api.shutterstock.com/v2')
 SHUTTERSTOCK_ACCESS_TOKEN = os.getenv('SHUTTERSTOCK_ACCESS_TOKEN', '')
 
+# One pooled, timeout-bounded client for every search; the circuit breaker
+# stops calls for a while after repeated failures
+shutterstock = ShutterstockClient(
+    SHUTTERSTOCK_BASE_URL,
+    SHUTTERSTOCK_ACCESS_TOKEN,
+    connect_timeout=float(os.getenv('SHUTTERSTOCK_CONNECT_TIMEOUT', 3.05)),
+    read_timeout=float(os.getenv('SHUTTERSTOCK_READ_TIMEOUT', 10)),
+    retries=int(os.getenv('SHUTTERSTOCK_RETRIES', 2)),
+    pool_size=int(os.getenv('SHUTTERSTOCK_POOL_SIZE', 10)),
+    max_concurrency=int(os.getenv('SHUTTERSTOCK_CONCURRENCY', 4)),
+    on_call=metrics.upstream_observer('search')
+)
+
+# Codes of finished lobbies become reusable after this long
+LOBBY_CODE_RECYCLE_AFTER = timedelta(hours=int(os.getenv('LOBBY_CODE_RECYCLE_HOURS', 6)))
+
+# Rendered join QR codes, in memory and optionally on disk (QR_CACHE_DIR,
+# up to QR_CACHE_MAX_MB)
+qr_codes = QRCodeCache(
+    max_entries=int(os.getenv('QR_CACHE_SIZE', 256)),
+    cache_dir=os.getenv('QR_CACHE_DIR') or None,
+    max_disk_bytes=int(os.getenv('QR_CACHE_MAX_MB', 64)) * 1024 * 1024
+)
+
+# Module sizes ?size= may ask for; each one is a separate cache entry
+QR_BOX_SIZES = (5, 10, 20)
+
+# QR images never change for a given lobby code and host
+QR_MAX_AGE = 365 * 24 * 3600
+
+# Resized stock images for /img, kept in IMAGE_CACHE_DIR up to
+# IMAGE_CACHE_MAX_MB; only hosts in IMAGE_PROXY_HOSTS are fetched
+image_proxy = ImageProxy(
+    os.getenv('IMAGE_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'stock-photo-frenzy-images'),
+    max_bytes=int(os.getenv('IMAGE_CACHE_MAX_MB', 512)) * 1024 * 1024,
+    allowed_hosts=[host.strip() for host in os.getenv('IMAGE_PROXY_HOSTS', 'shutterstock.com').split(',') if host.strip()],
+    timeout=float(os.getenv('IMAGE_PROXY_TIMEOUT', 10)),
+    on_fetch=metrics.upstream_observer('image')
+)
+
+# A variant URL always serves the same bytes
+IMAGE_MAX_AGE = 365 * 24 * 3600
+
+# Random-term image batches are spread over this many concurrent searches
+IMAGE_FETCH_TERMS = 4
+
 # Popular search terms for variety
 SEARCH_TERMS = [
     'nature', 'city', 'technology', 'business', 'people', 'food', 'travel',
@@ -56,55 +148,97 @@ PLAYER_COLORS = [
     '#F7DC6F', '#BB8FCE', '#85C1E2', '#F8B739', '#52BE80'
 ]
 
-def generate_lobby_code():
-    """Generate a short, unique lobby code"""
-    characters = string.ascii_uppercase + string.digits
-    while True:
-        code = ''.join(secrets.choice(characters) for _ in range(6))
-        # Check if code already exists
-        if not Lobby.query.filter_by(id=code).first():
-            return code
-
-def generate_qr_code(data):
-    """Generate QR code image as base64 string"""
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(data)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convert to base64
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
-    img_str = base64.b64encode(buffer.getvalue()).decode()
-    return f"data:image/png;base64,{img_str}"
-
-def extract_words(title):
-    """Extract guessable words from title"""
-    import re
-    common_words = {'the', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'from', 'up', 'about', 'into', 'through', 'during', 'before', 'after', 'above', 'below', 'between', 'among', 'under', 'over', 'around', 'near', 'far', 'here', 'there', 'where', 'when', 'why', 'how', 'what', 'who', 'which', 'that', 'this', 'these', 'those', 'some', 'any', 'all', 'both', 'each', 'every', 'other', 'another', 'such', 'same', 'different', 'new', 'old', 'good', 'bad', 'big', 'small', 'large', 'little', 'long', 'short', 'high', 'low', 'great', 'first', 'last', 'next', 'previous', 'main', 'major', 'minor', 'important', 'necessary', 'possible', 'available', 'present', 'current', 'recent', 'early', 'late', 'young', 'mature', 'fresh', 'clean', 'dirty', 'hot', 'cold', 'warm', 'cool', 'dry', 'wet', 'full', 'empty', 'open', 'closed', 'free', 'busy', 'ready', 'finished', 'complete', 'partial', 'total', 'whole', 'half', 'quarter', 'double', 'single', 'multiple', 'several', 'many', 'few', 'most', 'least', 'more', 'less', 'much', 'little', 'enough', 'too', 'very', 'quite', 'rather', 'pretty', 'fairly', 'almost', 'nearly', 'about', 'around', 'approximately', 'exactly', 'precisely', 'just', 'only', 'even', 'still', 'yet', 'already', 'soon', 'now', 'then', 'today', 'yesterday', 'tomorrow', 'always', 'never', 'sometimes', 'often', 'usually', 'rarely', 'hardly', 'barely', 'scarcely', 'extremely', 'highly', 'completely', 'totally', 'entirely', 'fully', 'partly', 'partially', 'mostly', 'mainly', 'primarily', 'especially', 'particularly', 'specifically', 'generally', 'normally', 'typically', 'commonly', 'frequently', 'regularly', 'occasionally', 'seldom', 'forever', 'permanently', 'temporarily', 'briefly', 'quickly', 'slowly', 'suddenly', 'gradually', 'immediately', 'instantly', 'eventually', 'finally', 'ultimately', 'initially', 'originally', 'previously', 'formerly', 'lately', 'presently', 'nowadays', 'tonight', 'whose', 'whom'}
-    
-    # Replace punctuation with spaces and split
-    words = re.sub(r'[^\w\s]', ' ', title.lower())
-    words = words.split()
-    
-    # Filter: length >= 3 and not common word
-    words = [w for w in words if len(w) >= 3 and w not in common_words]
-    
-    return words
-
-@app.route('/')
+# Seconds between keep-alive comments on idle lobby streams
+STREAM_KEEPALIVE_SECONDS = 15
+
+# Upper bound for ?wait= on long-polled status requests
+LONG_POLL_MAX_SECONDS = 30
+
+# Longest guess that can be stored (round_words/guesses word columns)
+MAX_WORD_LENGTH = 100
+
+# Most words accepted by one submit-words request
+MAX_GUESS_BATCH = 20
+
+# Attempts at a lobby write before giving up when other workers keep winning the race
+LOBBY_WRITE_ATTEMPTS = 5
+
+# Where decoded lobby state is cached and how changes reach other workers:
+# memory (single worker), sqlalchemy (no cache) or redis (multi worker/node)
+state_backend = create_state_backend(
+    os.getenv('STATE_BACKEND', 'memory'),
+    redis_url=os.getenv('REDIS_URL'),
+    max_entries=int(os.getenv('LOBBY_CACHE_SIZE', 512)),
+    idle_ttl=int(os.getenv('LOBBY_CACHE_TTL', 600))
+)
+
+lobby_locks = LobbyLocks()
+
+# brotli or gzip, whichever the client accepts, for JSON responses of at least
+# RESPONSE_COMPRESS_MIN_BYTES; 0 turns compression off
+response_compressor = ResponseCompressor(min_size=int(os.getenv('RESPONSE_COMPRESS_MIN_BYTES', 512)))
+
+# Abandoned lobbies are deleted after LOBBY_IDLE_HOURS without activity and
+# finished ones after LOBBY_ARCHIVE_HOURS, keeping final scores in
+# archived_games; LOBBY_REAPER_INTERVAL=0 turns the reaper off
+lobby_reaper = LobbyReaper(
+    idle_after=timedelta(hours=float(os.getenv('LOBBY_IDLE_HOURS', 2))),
+    closed_after=timedelta(hours=float(os.getenv('LOBBY_ARCHIVE_HOURS', 1))),
+    interval=int(os.getenv('LOBBY_REAPER_INTERVAL', 300)),
+    batch_size=int(os.getenv('LOBBY_REAPER_BATCH_SIZE', 100)),
+    on_removed=state_backend.invalidate
+)
+
+# Processed images kept ready per (query, difficulty) so rounds start without
+# waiting on Shutterstock; IMAGE_POOL_SIZE=0 turns prefetching off
+image_pool = ImagePool(
+    lambda query, difficulty, count: fetch_image_batch(query, difficulty, count),
+    target_size=int(os.getenv('IMAGE_POOL_SIZE', 8)),
+    max_age=int(os.getenv('IMAGE_POOL_MAX_AGE', 1800))
+)
+
+def lobby_writer(view):
+    """Run a lobby-mutating endpoint race-free.
+    
+    Writers to the same lobby queue up on a per-lobby lock in this process.
+    Across workers, every write is conditional on Lobby.state_version, and a
+    request that loses the race is rolled back and re-run from fresh state.
+    Re-runs lock the lobby row, so a worker with a warm cache can't keep
+    winning against one that has to reload.
+    """
+    @functools.wraps(view)
+    def wrapper(lobby_id, *args, **kwargs):
+        with lobby_locks(lobby_id):
+            for attempt in range(LOBBY_WRITE_ATTEMPTS):
+                try:
+                    return view(lobby_id, *args, **kwargs)
+                except (StaleLobbyState, StaleDataError):
+                    db.session.rollback()
+                    state_backend.invalidate(lobby_id)
+                    g.lock_lobby_row = True
+                    # Jittered backoff so competing workers don't collide again
+                    time.sleep(random.uniform(0, 0.005) * (attempt + 1))
+        return jsonify({'error': 'Lobby is busy, please try again'}), 409
+    return wrapper
+
+def get_lobby_for_write(lobby_id):
+    """Load a lobby inside lobby_writer, row-locked when retrying after a lost race"""
+    query = Lobby.query_with_state().filter_by(id=lobby_id)
+    if g.get('lock_lobby_row'):
+        query = query.with_for_update()
+    return query.first()
+
+@bp.route('/')
 def index():
     """Home page"""
     return render_template('index.html')
 
-@app.route('/join')
+@bp.route('/join')
 def join_page():
     """Join page with lobby code input"""
     return render_template('join_lobby.html', lobby=None, is_join_page=True)
 
-@app.route('/lobby', methods=['GET', 'POST'])
+@bp.route('/lobby', methods=['GET', 'POST'])
 def lobby():
     """Lobby page for multiplayer game"""
     lobby_id = session.get('lobby_id')
@@ -114,33 +248,31 @@ def lobby():
         game_mode = request.form.get('game_mode', 'free-for-all')
         difficulty = request.form.get('difficulty', 'hard')
         
-        lobby_code = generate_lobby_code()
-        new_lobby = Lobby(
-            id=lobby_code,
-            status='waiting',
-            game_mode=game_mode,
-            difficulty=difficulty
-        )
-        db.session.add(new_lobby)
-        db.session.commit()
+        try:
+            lobby_code = create_lobby(
+                status='waiting',
+                game_mode=game_mode,
+                difficulty=difficulty,
+                recycle_after=LOBBY_CODE_RECYCLE_AFTER
+            )
+        except LobbyCodeExhausted:
+            return jsonify({'error': 'Could not allocate a lobby code, please try again'}), 503
         
         lobby_id = lobby_code
         session['lobby_id'] = lobby_id
-        return redirect(url_for('lobby'))
+        return redirect(url_for('.lobby'))
     
     if not lobby_id:
         # Redirect to home if no lobby
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
     
     lobby_obj = Lobby.query.get(lobby_id)
     if not lobby_obj:
         session.pop('lobby_id', None)
-        return redirect(url_for('lobby'))
+        return redirect(url_for('.lobby'))
     
-    # Generate QR code for joining
-    base_url = request.host_url.rstrip('/')
-    join_url = f"{base_url}/join/{lobby_id}"
-    qr_code = generate_qr_code(join_url)
+    # QR code for joining is served separately by lobby_qr_code
+    join_url = lobby_join_url(lobby_id)
     
     # Get mode description
     mode_descriptions = {
@@ -151,12 +283,63 @@ def lobby():
     
     return render_template('lobby.html', 
                          lobby=lobby_obj, 
-                         qr_code=qr_code, 
                          join_url=join_url,
                          mode_description=mode_descriptions.get(lobby_obj.game_mode, ''))
 
-@app.route('/join')
-@app.route('/join/<lobby_id>')
+def lobby_join_url(lobby_id):
+    """Join page URL for the host the request came in on"""
+    return f"{request.host_url.rstrip('/')}/join/{lobby_id}"
+
+@bp.route('/qr/<lobby_id>.<any(png, svg):fmt>')
+def lobby_qr_code(lobby_id, fmt):
+    """QR code for joining a lobby, rendered once and cached"""
+    try:
+        box_size = int(request.args.get('size', 10))
+    except ValueError:
+        box_size = None
+    if box_size not in QR_BOX_SIZES:
+        return jsonify({'error': f'Invalid size, use one of {", ".join(map(str, QR_BOX_SIZES))}'}), 400
+    
+    join_url = lobby_join_url(lobby_id)
+    image = qr_codes.get(join_url, fmt, box_size)
+    if image is None:
+        if not Lobby.query.get(lobby_id):
+            return jsonify({'error': 'Lobby not found'}), 404
+        image = qr_codes.get_or_render(join_url, fmt, box_size)
+    
+    response = Response(image, mimetype=QR_MIMETYPES[fmt])
+    response.cache_control.public = True
+    response.cache_control.max_age = QR_MAX_AGE
+    response.cache_control.immutable = True
+    response.add_etag()
+    return response.make_conditional(request)
+
+@bp.route('/img/<any(host, mobile):variant>.<any(webp, jpg):fmt>')
+def proxied_image(variant, fmt):
+    """A stock image (?src=<url>) resized for the host screen or a phone, cached on disk"""
+    url = request.args.get('src', '')
+    if not image_proxy.allowed(url):
+        return jsonify({'error': 'Image URL not allowed'}), 400
+    
+    # Revalidations are answered without touching the cache
+    etag = image_proxy.name(url, variant, fmt)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        try:
+            image = image_proxy.get(url, variant, fmt)
+        except ImageProxyError as e:
+            print(f'Error proxying image: {str(e)}')
+            return jsonify({'error': 'Image not available'}), 502
+        response = Response(image, mimetype=IMAGE_MIMETYPES[fmt])
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = IMAGE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+@bp.route('/join')
+@bp.route('/join/<lobby_id>')
 def join_lobby(lobby_id=None):
     """Join lobby page - for mobile users scanning QR code or entering code"""
     if lobby_id:
@@ -172,7 +355,7 @@ def join_lobby(lobby_id=None):
         # Show lobby code input page
         return render_template('join_lobby.html', lobby=None)
 
-@app.route('/game')
+@bp.route('/game')
 def game():
     """Main game page"""
     lobby_id = request.args.get('lobby')
@@ -182,12 +365,22 @@ def game():
         # Multiplayer mode
         lobby = Lobby.query.get(lobby_id)
         if not lobby:
-            return redirect(url_for('index'))
+            # The reaper may have archived the game already
+            archived = ArchivedGame.query.filter_by(lobby_id=lobby_id).order_by(ArchivedGame.id.desc()).first()
+            if not archived:
+                return redirect(url_for('.index'))
+            return render_template('results.html',
+                                 is_multiplayer=True,
+                                 lobby_id=lobby_id,
+                                 leaderboard=archived.leaderboard(),
+                                 game_mode=archived.game_mode,
+                                 shared_score=archived.shared_score,
+                                 total_rounds=5)
         
         # Allow mobile users to access game page even when waiting (they'll see waiting screen)
         # But redirect host to lobby if waiting
         if lobby.status == 'waiting' and not is_mobile:
-            return redirect(url_for('lobby'))
+            return redirect(url_for('.lobby'))
         
         # Use mobile template for mobile devices in multiplayer
         if is_mobile:
@@ -202,7 +395,7 @@ def game():
         # Single player mode
         return render_template('game_single.html', is_multiplayer=False)
 
-@app.route('/api/get-image', methods=['GET'])
+@bp.route('/api/get-image', methods=['GET'])
 def get_image():
     """Get a random image from Shutterstock API"""
     try:
@@ -211,60 +404,40 @@ def get_image():
         difficulty = request.args.get('difficulty', 'hard')
         per_page = int(request.args.get('per_page', 1))  # For competitive round 5
         
+        # Usually served from images prefetched in the background
+        pooled_images = image_pool.take(query_phrase, difficulty, per_page)
+        if pooled_images:
+            if per_page > 1:
+                return jsonify({'success': True, 'images': pooled_images})
+            return jsonify({'success': True, 'image': pooled_images[0]})
+        
         # Use provided phrase or fall back to random
         if query_phrase:
-            search_query = query_phrase
+            searches = [(query_phrase, per_page)]
         else:
-            search_query = random.choice(SEARCH_TERMS)
+            searches = random_searches(per_page)
         
-        response = requests.get(
-            f"{SHUTTERSTOCK_BASE_URL}/images/search",
-            params={
-                'query': search_query,
-                'sort': 'random',
-                'per_page': per_page,
-                'view': 'full'
-            },
-            headers={
-                'Authorization': f'Bearer {SHUTTERSTOCK_ACCESS_TOKEN}',
-                'Content-Type': 'application/json'
-            }
-        )
-        
-        if not response.ok:
+        try:
+            processed_images = fetch_images(searches, difficulty, per_page)
+        except ShutterstockError as e:
+            print(f'Error searching images: {str(e)}')
             # Fall back to random search term
             return get_random_image_fallback(difficulty)
         
-        data = response.json()
-        
-        if not data.get('data') or len(data['data']) == 0:
+        if len(processed_images) == 0:
             # Fall back to random search term
             return get_random_image_fallback(difficulty, per_page)
         
         # If per_page > 1, return multiple images (for competitive round 5)
         if per_page > 1:
-            images = data['data'][:per_page]
-            processed_images = []
-            for img in images:
-                try:
-                    processed_images.append(process_image(img, difficulty))
-                except Exception as e:
-                    print(f'Error processing image: {str(e)}')
-                    continue  # Skip invalid images
-            
-            if len(processed_images) == 0:
-                # All images failed, fall back to random
-                return get_random_image_fallback(difficulty, 1)
-            
             return jsonify({
                 'success': True,
                 'images': processed_images
             })
         
-        image = data['data'][0]
         return jsonify({
             'success': True,
-            'image': process_image(image, difficulty)
+            'image': processed_images[0]
         })
     
     except Exception as e:
@@ -272,6 +445,66 @@ def get_image():
         # Fall back to random search term
         return get_random_image_fallback(difficulty)
 
+@bp.route('/api/get-image/stats', methods=['GET'])
+def get_image_stats():
+    """Image pool hit/miss counters, Shutterstock call latencies and image proxy cache counters"""
+    return jsonify(dict(image_pool.stats(), upstream=shutterstock.stats(), proxy=image_proxy.stats()))
+
+@bp.route('/api/admin/profiler', methods=['GET', 'POST'])
+def profiler_admin():
+    """Profiler rates and sample counts; ?endpoint= returns its collapsed stacks, POST changes the rates"""
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not PROFILE_ADMIN_TOKEN or not secrets.compare_digest(token, PROFILE_ADMIN_TOKEN):
+        return jsonify({'error': 'Not found'}), 404
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            profiler.configure(
+                sample_rate=float(data['sample_rate']) if 'sample_rate' in data else None,
+                route_rates={str(k): float(v) for k, v in data['route_rates'].items()} if 'route_rates' in data else None
+            )
+        except (TypeError, ValueError, AttributeError):
+            return jsonify({'error': 'sample_rate must be a number and route_rates an object of numbers'}), 400
+    elif request.args.get('endpoint'):
+        return Response(profiler.folded(request.args['endpoint']), mimetype='text/plain')
+    return jsonify(profiler.stats())
+
+def random_searches(count):
+    """Spread `count` images over several random search terms"""
+    terms = random.sample(SEARCH_TERMS, min(IMAGE_FETCH_TERMS, count))
+    return [(term, -(-count // len(terms))) for term in terms]
+
+def fetch_images(searches, difficulty, count, allow_cached=True):
+    """Run (query, per_page) searches concurrently and return the first `count` processed images.
+    
+    A batch costs about as long as its slowest search instead of the sum of
+    all of them. Re-raises the first search error if nothing was found.
+    """
+    processed_images = []
+    errors = []
+    for query, images, error in shutterstock.search_many(searches, allow_cached):
+        if error is not None:
+            errors.append(error)
+        for img in images:
+            try:
+                processed_images.append(process_image(img, difficulty))
+            except Exception as e:
+                print(f'Error processing image: {str(e)}')
+        if len(processed_images) >= count:
+            break
+    if not processed_images and errors:
+        raise errors[0]
+    return processed_images[:count]
+
+def fetch_image_batch(query, difficulty, count):
+    """Fetch and process a batch of images for the image pool"""
+    # Spread random batches over several terms so rounds don't repeat a theme
+    searches = [(query, count)] if query else random_searches(count)
+    # Never refill from the breaker's cache, the pool would hand out repeats
+    processed_images = fetch_images(searches, difficulty, count, allow_cached=False)
+    random.shuffle(processed_images)
+    return processed_images
+
 def process_image(image, difficulty='hard'):
     """Process a single image and return its data"""
     # Get best image URL
@@ -304,66 +537,196 @@ def process_image(image, difficulty='hard'):
     }
 
 def get_random_image_fallback(difficulty='hard', per_page=1):
-    """Fall back to random search term if custom query fails"""
+    """Fall back to random search terms if custom query fails"""
     try:
-        random_term = random.choice(SEARCH_TERMS)
-        response = requests.get(
-            f"{SHUTTERSTOCK_BASE_URL}/images/search",
-            params={
-                'query': random_term,
-                'sort': 'random',
-                'per_page': per_page,
-                'view': 'full'
-            },
-            headers={
-                'Authorization': f'Bearer {SHUTTERSTOCK_ACCESS_TOKEN}',
-                'Content-Type': 'application/json'
-            }
-        )
-        
-        if not response.ok:
-            return jsonify({'error': f'API request failed: {response.status_code}'}), 500
+        processed_images = fetch_images(random_searches(per_page), difficulty, per_page)
         
-        data = response.json()
-        
-        if not data.get('data') or len(data['data']) == 0:
+        if len(processed_images) == 0:
             return jsonify({'error': 'No images found'}), 404
         
         if per_page > 1:
-            images = data['data'][:per_page]
             return jsonify({
                 'success': True,
-                'images': [process_image(img, difficulty) for img in images]
+                'images': processed_images
             })
         
-        image = data['data'][0]
         return jsonify({
             'success': True,
-            'image': process_image(image, difficulty)
+            'image': processed_images[0]
         })
     except Exception as e:
         print(f'Error in fallback: {str(e)}')
         return jsonify({'error': str(e)}), 500
     
 
-@app.route('/api/lobby/<lobby_id>/status')
+def publish_lobby_state(state):
+    """Push the lobby state to connected stream clients (call after commit)"""
+    if state_backend.wants_events(state.lobby_id):
+        state_backend.publish(state.lobby_id, state.version, state.body())
+
+def commit_lobby_change(lobby, changes):
+    """Bump the lobby version, commit, then update the state backend and notify stream clients.
+    
+    `changes` is the list of change events for /changes (see lobby_changes).
+    The new state is built from the session right before the commit, while
+    everything it needs is still loaded, so nothing is read back afterwards.
+    Returns the new LobbyState; use it rather than the (expired) lobby for
+    the response.
+    """
+    lobby.bump_version()
+    db.session.flush()
+    LobbyChange.record(lobby.id, lobby.state_version, lobby.current_round or 0, changes)
+    state = LobbyState.from_lobby(lobby)
+    db.session.commit()
+    state_backend.store(state)
+    publish_lobby_state(state)
+    return state
+
+def lobby_etag(lobby_id, version, compact=False):
+    return f'{lobby_id}-{version}-compact' if compact else f'{lobby_id}-{version}'
+
+def lobby_status_response(body, etag, compact=False):
+    response = Response(body, mimetype=COMPACT_MIMETYPE if compact else 'application/json')
+    response.set_etag(etag)
+    # Let browsers keep the payload but revalidate it with If-None-Match every time
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept')
+    return response
+
+def not_modified_response(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept')
+    return response
+
+@bp.route('/api/lobby/<lobby_id>/status')
 def lobby_status(lobby_id):
-    """Get lobby status and participants"""
-    lobby = Lobby.query.get(lobby_id)
-    if not lobby:
+    """Get lobby status and participants (polling fallback for the stream).
+    
+    Answers 304 when the client's ETag matches the current state_version.
+    With ?wait=<seconds>&since=<version> the request blocks until the
+    version advances past `since` or the wait expires. Clients that accept
+    COMPACT_MIMETYPE (or pass ?view=compact) get only the fields phones use.
+    """
+    compact = wants_compact(request)
+    since = request.args.get('since', type=int)
+    wait = min(request.args.get('wait', 0, type=float), LONG_POLL_MAX_SECONDS)
+    long_poll = since is not None and wait > 0
+    
+    # Subscribe before reading the version so a change in between isn't missed
+    subscriber = state_backend.subscribe(lobby_id) if long_poll else None
+    try:
+        version = db.session.query(Lobby.state_version).filter_by(id=lobby_id).scalar()
+        if version is None:
+            return jsonify({'error': 'Lobby not found'}), 404
+        
+        if long_poll and version <= since:
+            db.session.close()
+            deadline = time.monotonic() + wait
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return not_modified_response(lobby_etag(lobby_id, version, compact))
+                try:
+                    version, body = subscriber.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+                if version > since:
+                    if compact:
+                        body = compact_body(body)
+                    return lobby_status_response(body, lobby_etag(lobby_id, version, compact), compact)
+    finally:
+        if subscriber is not None:
+            state_backend.unsubscribe(lobby_id, subscriber)
+    
+    etag = lobby_etag(lobby_id, version, compact)
+    if request.if_none_match.contains_weak(etag):
+        return not_modified_response(etag)
+    
+    state = state_backend.load(lobby_id, version)
+    if not state:
+        return jsonify({'error': 'Lobby not found'}), 404
+    return lobby_status_response(state.body(compact), lobby_etag(lobby_id, state.version, compact), compact)
+
+@bp.route('/api/lobby/<lobby_id>/stream')
+def lobby_stream(lobby_id):
+    """Server-Sent Events stream with one event per lobby state change (?view=compact for phones)"""
+    compact = wants_compact(request)
+    subscriber = state_backend.subscribe(lobby_id)
+    version = db.session.query(Lobby.state_version).filter_by(id=lobby_id).scalar()
+    if version is None:
+        state_backend.unsubscribe(lobby_id, subscriber)
         return jsonify({'error': 'Lobby not found'}), 404
     
-    participants = [p.to_dict() for p in lobby.participants]
+    # A reconnecting EventSource sends the last version it saw
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    initial = None
+    if last_event_id != version:
+        state = state_backend.load(lobby_id, version)
+        if not state:
+            # Deleted (ended, reaped or recycled) since the version query
+            state_backend.unsubscribe(lobby_id, subscriber)
+            return jsonify({'error': 'Lobby not found'}), 404
+        version = state.version
+        initial = state.body(compact)
+    # Don't hold a pooled DB connection for the lifetime of the stream
+    db.session.close()
+    
+    def generate():
+        try:
+            if initial is not None:
+                yield f"id: {version}\ndata: {initial}\n\n"
+            while True:
+                try:
+                    message_version, message = subscriber.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if compact:
+                    message = compact_body(message)
+                yield f"id: {message_version}\ndata: {message}\n\n"
+        finally:
+            state_backend.unsubscribe(lobby_id, subscriber)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@bp.route('/api/lobby/<lobby_id>/changes')
+def lobby_changes(lobby_id):
+    """Change events after state_version `since`, for clients that apply deltas.
+    
+    Returns {'version', 'changes': [...]}, each event tagged with the version
+    it produced. Event types: player_joined, teams, lobby (changed lobby
+    fields), round (new round or image; revealed words and guesses are
+    cleared), guessed, word_revealed and score. Only the current and the
+    previous round are kept, so a client further behind gets
+    {'version', 'reset': true} and should fetch /status instead.
+    """
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({'error': 'since is required'}), 400
+    version = db.session.query(Lobby.state_version).filter_by(id=lobby_id).scalar()
+    if version is None:
+        return jsonify({'error': 'Lobby not found'}), 404
+    if since == version:
+        return jsonify({'version': version, 'changes': []})
     
+    logged = LobbyChange.since(lobby_id, since) if since < version else None
+    if not logged:
+        return jsonify({'version': version, 'reset': True})
     return jsonify({
-        'lobby': lobby.to_dict(),
-        'participants': participants
+        'version': logged[-1][0],
+        'changes': [dict(change, version=change_version) for change_version, changes in logged for change in changes]
     })
 
-@app.route('/api/lobby/<lobby_id>/join', methods=['POST'])
+@bp.route('/api/lobby/<lobby_id>/join', methods=['POST'])
+@lobby_writer
 def api_join_lobby(lobby_id):
     """API endpoint to join a lobby"""
-    lobby = Lobby.query.get(lobby_id)
+    lobby = get_lobby_for_write(lobby_id)
     if not lobby:
         return jsonify({'error': 'Lobby not found'}), 404
     
@@ -375,7 +738,10 @@ def api_join_lobby(lobby_id):
     player_name = data.get('player_name', '').strip()
     if not player_name:
         return jsonify({'error': 'Player name is required'}), 400
-    
+    # Players are told apart by name (guesses, word owners, lobby state)
+    if any(p.player_name == player_name for p in lobby.participants):
+        return jsonify({'error': 'That name is already taken in this lobby'}), 409
+
     # Generate a unique session ID for this player
     player_id = secrets.token_hex(8)
     session[f'player_id_{lobby_id}'] = player_id
@@ -392,17 +758,21 @@ def api_join_lobby(lobby_id):
     participant = LobbyParticipant(
         lobby_id=lobby_id,
         player_name=player_name,
-        player_color=player_color
+        player_color=player_color,
+        guesses=[]
     )
-    db.session.add(participant)
-    db.session.commit()
+    lobby.participants.append(participant)
+    state = commit_lobby_change(lobby, [{'type': 'player_joined', 'participant': {
+        'player_name': player_name, 'score': 0, 'team': None, 'is_captain': False, 'player_color': player_color
+    }}])
     
-    return jsonify({'success': True, 'participant': participant.to_dict(), 'player_id': player_id})
+    return jsonify({'success': True, 'participant': state.participants[player_name].to_dict(), 'player_id': player_id})
 
-@app.route('/api/lobby/<lobby_id>/start', methods=['POST'])
+@bp.route('/api/lobby/<lobby_id>/start', methods=['POST'])
+@lobby_writer
 def start_lobby_game(lobby_id):
     """Start the game for a lobby"""
-    lobby = Lobby.query.get(lobby_id)
+    lobby = get_lobby_for_write(lobby_id)
     
     if not lobby:
         return jsonify({'error': 'Lobby not found'}), 404
@@ -428,15 +798,10 @@ def start_lobby_game(lobby_id):
         
         # Randomly select two captains
         captains = random.sample(participants, 2)
-        captains[0].is_captain = True
-        captains[0].team = 'red'
-        captains[1].is_captain = True
-        captains[1].team = 'blue'
         
         # Assign other players to teams (alternating)
-        other_players = [p for p in participants if not p.is_captain]
-        for i, player in enumerate(other_players):
-            player.team = 'red' if i % 2 == 0 else 'blue'
+        other_players = [p for p in participants if p not in captains]
+        lobby.assign_teams([captains[0]] + other_players[0::2], [captains[1]] + other_players[1::2])
         
         lobby.team_captains = json.dumps([c.player_name for c in captains])
         lobby.active_team = 'red'  # Start with red team
@@ -446,134 +811,238 @@ def start_lobby_game(lobby_id):
     lobby.status = 'active'
     lobby.started_at = datetime.utcnow()
     lobby.current_round = 0
-    lobby.revealed_words = json.dumps([])
-    lobby.word_owners = json.dumps({})
+    lobby.clear_round_words()
     lobby.shared_score = 0
-    db.session.commit()
+    changes = [{'type': 'lobby', 'status': 'active', 'shared_score': 0}]
+    if lobby.game_mode == 'competitive':
+        changes.append({'type': 'teams', 'teams': {
+            p.player_name: {'team': p.team, 'is_captain': p.is_captain} for p in participants
+        }})
+    changes.append({'type': 'round', 'current_round': 0, 'active_team': lobby.active_team})
+    state = commit_lobby_change(lobby, changes)
+    # Warm the pool while the host screen loads its first round
+    image_pool.prefetch(state.fields['game_phrase'], state.fields['difficulty'])
     
     return jsonify({
         'success': True, 
-        'lobby': lobby.to_dict()
+        'lobby': state.to_payload()['lobby']
     })
 
-@app.route('/api/lobby/<lobby_id>/submit-word', methods=['POST'])
+@bp.route('/api/lobby/<lobby_id>/submit-word', methods=['POST'])
+@lobby_writer
 def submit_word(lobby_id):
     """Submit a word guess from a participant"""
-    lobby = Lobby.query.get(lobby_id)
-    if not lobby:
-        return jsonify({'error': 'Lobby not found'}), 404
-    
-    if lobby.status != 'active':
-        return jsonify({'error': 'Game is not active'}), 400
-    
     data = request.json
     player_name = data.get('player_name')
     word = data.get('word', '').strip().lower()
     
-    if not word or len(word) < 3:
-        return jsonify({'error': 'Word must be at least 3 characters'}), 400
+    state = load_state_for_guess(lobby_id)
+    if not state:
+        return jsonify({'error': 'Lobby not found'}), 404
     
-    # Find participant
-    participant = LobbyParticipant.query.filter_by(lobby_id=lobby_id, player_name=player_name).first()
+    return apply_word_guess(state, player_name, word)
+
+@bp.route('/api/lobby/<lobby_id>/submit-words', methods=['POST'])
+@lobby_writer
+def submit_words(lobby_id):
+    """Submit several word guesses from one participant at once.
+    
+    Words are evaluated in order exactly as separate submit-word calls
+    would be, but written in one transaction. Returns one result per word
+    and the state after the last one.
+    """
+    data = request.json or {}
+    player_name = data.get('player_name')
+    words = data.get('words')
+    if not isinstance(words, list) or not words:
+        return jsonify({'error': 'words must be a non-empty list'}), 400
+    if len(words) > MAX_GUESS_BATCH:
+        return jsonify({'error': f'At most {MAX_GUESS_BATCH} words per request'}), 400
+    words = [word.strip().lower() if isinstance(word, str) else '' for word in words]
+    
+    state = load_state_for_guess(lobby_id)
+    if not state:
+        return jsonify({'error': 'Lobby not found'}), 404
+    
+    if state.status != 'active':
+        return jsonify({'error': 'Game is not active'}), 400
+    
+    participant = state.participants.get(player_name)
+    error = guesser_error(state, participant)
+    if error:
+        return jsonify({'error': error[0]}), error[1]
+    
+    results, guesses, score, shared_score = evaluate_guesses(state, participant, words)
+    if guesses:
+        try:
+            write_guesses(state, participant, guesses,
+                          score=score if score != participant.score else None,
+                          shared_score=shared_score if shared_score != state.shared_score else None)
+        except DuplicateGuess:
+            # Already checked against the cached state, so the cache is behind; start over
+            raise StaleLobbyState(lobby_id)
+        state_backend.store(state)
+        publish_lobby_state(state)
+    
+    tracks_owners = tracks_word_owners(state)
+    return jsonify({
+        'success': True,
+        'results': results,
+        'revealed_words': state.revealed_words,
+        'word_owners': state.word_owners if tracks_owners else {},
+        'score': participant.score if state.game_mode != 'cooperative' else state.shared_score,
+        'player_color': participant.player_color if tracks_owners else None
+    })
+
+def load_state_for_guess(lobby_id):
+    """Cached lobby state for a guess, reloaded under a row lock when lobby_writer retries"""
+    if g.get('lock_lobby_row'):
+        lobby = get_lobby_for_write(lobby_id)
+        return state_backend.refresh(lobby) if lobby else None
+    return state_backend.load(lobby_id)
+
+def word_error(word):
+    """Why a word can't be guessed at all, or None"""
+    if not word or len(word) < 3:
+        return 'Word must be at least 3 characters'
+    if len(word) > MAX_WORD_LENGTH:
+        return 'Word is too long'
+    return None
+
+def image_data_error(image_data):
+    """Why a host-supplied round image can't be stored, or None"""
+    if not isinstance(image_data, dict):
+        return 'image_data must be an object'
+    for key in ('title_words', 'easy_mode_hidden_words'):
+        words = image_data.get(key)
+        if words is not None and not (isinstance(words, list) and all(isinstance(word, str) for word in words)):
+            return f'image_data.{key} must be a list of words'
+    return None
+
+def guesser_error(state, participant):
+    """(message, status code) when this participant can't guess right now, or None"""
     if not participant:
-        return jsonify({'error': 'Participant not found'}), 404
+        return 'Participant not found', 404
     
     # For Competitive mode, check if player's team is active (except round 5)
-    if lobby.game_mode == 'competitive':
+    if state.game_mode == 'competitive':
         # Round 5 (index 4, 0-indexed) is free-for-all for both teams
         # But still only captains can submit
         if not participant.is_captain:
-            return jsonify({'error': 'Only team captains can submit words'}), 400
+            return 'Only team captains can submit words', 400
         
         # For rounds 1-4, check if it's the player's team's turn
-        if lobby.current_round < 4:
-            if participant.team != lobby.active_team:
-                return jsonify({'error': 'It is not your team\'s turn'}), 400
+        if state.current_round < 4:
+            if participant.team != state.active_team:
+                return 'It is not your team\'s turn', 400
         # Round 5: both teams can play (no team check needed)
     
     # Get current image data
-    if not lobby.current_image_data:
-        return jsonify({'error': 'No image loaded'}), 400
-    
-    image_data = json.loads(lobby.current_image_data)
-    title_words = image_data.get('title_words', [])
-    revealed_words = json.loads(lobby.revealed_words) if lobby.revealed_words else []
-    word_owners = json.loads(lobby.word_owners) if lobby.word_owners else {}
+    if not state.image_data:
+        return 'No image loaded', 400
+    return None
+
+def tracks_word_owners(state):
+    """Free-for-All and Competitive round 5 highlight who found each word"""
+    return state.game_mode == 'free-for-all' or (state.game_mode == 'competitive' and state.current_round >= 4)
+
+def evaluate_guesses(state, participant, words):
+    """Score words in order as if each were submitted on its own.
+    
+    Words earlier in the list count as guessed (and, if right, revealed) for
+    the ones after them. Nothing is written: returns a result per word, the
+    guesses to store as (word, is_correct, owner_name), and the
+    participant's score and shared score after all of them.
+    """
+    owner_name = participant.player_name if tracks_word_owners(state) else None
+    score = participant.score
+    shared_score = state.shared_score
+    remaining = state.remaining_words
+    guessed = set()
+    revealed = set()
+    results = []
+    guesses = []
+    for word in words:
+        error = word_error(word)
+        if error:
+            results.append({'word': word, 'error': error})
+            continue
+        
+        # The round's answer index maps the guess (or its singular/unaccented
+        # form) to a hidden title word; repeated title words score once per occurrence
+        answer = state.answers.match(word)
+        if answer is not None:
+            word = answer
+        if word in participant.guessed or word in guessed:
+            results.append({'word': word, 'error': 'You already guessed this word'})
+            continue
+        already_revealed = word in state.revealed or word in revealed
+        found_count = 0 if answer is None or already_revealed else state.answers.counts[answer]
+        is_correct = found_count > 0
+        
+        points = 0
+        if is_correct:
+            # Award points based on mode, plus a completion bonus for the last word
+            points = found_count * 10
+            bonus = 100 if remaining == 1 else 0
+            if state.game_mode == 'cooperative':
+                shared_score += points + bonus
+            else:
+                score += points + bonus
+            remaining -= 1
+            revealed.add(word)
+        guessed.add(word)
+        guesses.append((word, is_correct, owner_name))
+        results.append({'word': word, 'is_correct': is_correct, 'points': points})
+    return results, guesses, score, shared_score
+
+def apply_word_guess(state, player_name, word):
+    """Evaluate a guess against the cached lobby state and write it through"""
+    if state.status != 'active':
+        return jsonify({'error': 'Game is not active'}), 400
     
-    # Check if word is in title AND is actually hidden (not already visible)
-    # In easy mode, only words in easy_mode_hidden_words should be guessable
-    easy_mode_hidden_words = image_data.get('easy_mode_hidden_words', [])
-    words_to_hide = easy_mode_hidden_words if easy_mode_hidden_words else title_words
+    error = word_error(word)
+    if error:
+        return jsonify({'error': error}), 400
     
-    # Only allow guessing words that are actually hidden
-    found_words = [w for w in words_to_hide if w == word and w not in revealed_words]
-    is_correct = len(found_words) > 0
+    # Find participant
+    participant = state.participants.get(player_name)
+    error = guesser_error(state, participant)
+    if error:
+        return jsonify({'error': error[0]}), error[1]
     
-    # Get guessed words for this participant
-    guessed_words = json.loads(participant.guessed_words) if participant.guessed_words else []
+    results, guesses, score, shared_score = evaluate_guesses(state, participant, [word])
+    result = results[0]
+    if 'error' in result:
+        return jsonify({'error': result['error']}), 400
     
-    if word in guessed_words:
+    # Repeat guesses are also rejected by the guesses unique index
+    try:
+        write_guesses(state, participant, guesses,
+                      score=score if score != participant.score else None,
+                      shared_score=shared_score if shared_score != state.shared_score else None)
+    except DuplicateGuess:
         return jsonify({'error': 'You already guessed this word'}), 400
+    state_backend.store(state)
+    publish_lobby_state(state)
     
-    # Add to guessed words
-    guessed_words.append(word)
-    participant.guessed_words = json.dumps(guessed_words)
-    
-    if is_correct:
-        # Add to revealed words if not already revealed
-        if word not in revealed_words:
-            revealed_words.append(word)
-            lobby.revealed_words = json.dumps(revealed_words)
-            
-            # For Free-for-All, track who found each word
-            if lobby.game_mode == 'free-for-all':
-                word_owners[word] = player_name
-                lobby.word_owners = json.dumps(word_owners)
-        
-        # Award points based on mode
-        points = len(found_words) * 10
-        
-        if lobby.game_mode == 'cooperative':
-            # Add to shared score
-            lobby.shared_score += points
-            if len(revealed_words) == len(title_words):
-                lobby.shared_score += 100  # Completion bonus
-        elif lobby.game_mode == 'competitive' and lobby.current_round >= 4:
-            # Round 5: Free-for-all, track word owners for highlighting
-            if word not in word_owners:
-                word_owners[word] = player_name
-                lobby.word_owners = json.dumps(word_owners)
-            # Individual scoring
-            participant.score += points
-            if len(revealed_words) == len(title_words):
-                participant.score += 100  # Completion bonus
-        else:
-            # Individual scoring (Free-for-All or Competitive rounds 1-4)
-            if lobby.game_mode == 'free-for-all':
-                # Track word owners for highlighting
-                if word not in word_owners:
-                    word_owners[word] = player_name
-                    lobby.word_owners = json.dumps(word_owners)
-            participant.score += points
-            if len(revealed_words) == len(title_words):
-                participant.score += 100  # Completion bonus
-    
-    db.session.commit()
-    
+    tracks_owners = tracks_word_owners(state)
     return jsonify({
         'success': True,
-        'is_correct': is_correct,
-        'points': len(found_words) * 10 if is_correct else 0,
-        'revealed_words': revealed_words,
-        'word_owners': word_owners if (lobby.game_mode == 'free-for-all' or (lobby.game_mode == 'competitive' and lobby.current_round >= 4)) else {},
-        'score': participant.score if lobby.game_mode != 'cooperative' else lobby.shared_score,
-        'player_color': participant.player_color if (lobby.game_mode == 'free-for-all' or (lobby.game_mode == 'competitive' and lobby.current_round >= 4)) else None
+        'is_correct': result['is_correct'],
+        'word': result['word'],
+        'points': result['points'],
+        'revealed_words': state.revealed_words,
+        'word_owners': state.word_owners if tracks_owners else {},
+        'score': participant.score if state.game_mode != 'cooperative' else state.shared_score,
+        'player_color': participant.player_color if tracks_owners else None
     })
 
-@app.route('/api/lobby/<lobby_id>/next-round', methods=['POST'])
+@bp.route('/api/lobby/<lobby_id>/next-round', methods=['POST'])
+@lobby_writer
 def next_round(lobby_id):
     """Move to next round (host only)"""
-    lobby = Lobby.query.get(lobby_id)
+    lobby = get_lobby_for_write(lobby_id)
     if not lobby:
         return jsonify({'error': 'Lobby not found'}), 404
     
@@ -585,18 +1054,21 @@ def next_round(lobby_id):
     
     # If image_data is provided, store it (for starting a round)
     if 'image_data' in data:
+        # Every status, stream and guess decodes it for the rest of the round
+        error = image_data_error(data['image_data'])
+        if error:
+            return jsonify({'error': error}), 400
         lobby.current_image_data = json.dumps(data['image_data'])
-        lobby.revealed_words = json.dumps([])
-        lobby.word_owners = json.dumps({})
         
-        # Reset participant guessed words
-        for participant in lobby.participants:
-            participant.guessed_words = json.dumps([])
+        # Reset revealed words and participant guessed words
+        lobby.clear_round_words()
         
-        db.session.commit()
+        state = commit_lobby_change(lobby, [
+            {'type': 'round', 'current_round': lobby.current_round, 'active_team': lobby.active_team}
+        ])
         return jsonify({
             'success': True,
-            'current_round': lobby.current_round,
+            'current_round': state.current_round,
             'game_finished': False
         })
     
@@ -607,17 +1079,15 @@ def next_round(lobby_id):
     # After round 5, current_round would be 4, so we check if >= 4 (which means we've completed round 5)
     if lobby.current_round >= max_rounds - 1:  # 0-indexed: rounds 0-4 (5 rounds total)
         lobby.status = 'finished'
-        db.session.commit()
+        state = commit_lobby_change(lobby, [{'type': 'lobby', 'status': 'finished'}])
         return jsonify({
             'success': True,
             'game_finished': True,
-            'final_scores': [p.to_dict() for p in lobby.participants] if lobby.game_mode != 'cooperative' else {'shared_score': lobby.shared_score}
+            'final_scores': [p.to_dict() for p in state.participants.values()] if state.game_mode != 'cooperative' else {'shared_score': state.shared_score}
         })
     
     # Move to next round
     lobby.current_round += 1
-    lobby.revealed_words = json.dumps([])
-    lobby.word_owners = json.dumps({})
     lobby.current_image_data = None
     
     # For Competitive mode, switch active team
@@ -634,37 +1104,43 @@ def next_round(lobby_id):
             # Round 5 (index 4): Free-for-all, both teams can play
             lobby.active_team = None
     
-    # Reset participant guessed words
-    for participant in lobby.participants:
-        participant.guessed_words = json.dumps([])
+    # Reset revealed words and participant guessed words
+    lobby.clear_round_words()
+    # The change log keeps this round and the one before, so a client that
+    # missed the end of the last round can still catch up
+    LobbyChange.trim(lobby_id, lobby.current_round - 1)
     
-    db.session.commit()
+    state = commit_lobby_change(lobby, [
+        {'type': 'round', 'current_round': lobby.current_round, 'active_team': lobby.active_team}
+    ])
     
     return jsonify({
         'success': True,
-        'current_round': lobby.current_round,
+        'current_round': state.current_round,
         'game_finished': False,
-        'active_team': lobby.active_team if (lobby.game_mode == 'competitive' and lobby.current_round < 4) else None,
-        'is_free_for_all': lobby.game_mode == 'competitive' and lobby.current_round == 4
+        'active_team': state.active_team if (state.game_mode == 'competitive' and state.current_round < 4) else None,
+        'is_free_for_all': state.game_mode == 'competitive' and state.current_round == 4
     })
 
-@app.route('/api/lobby/<lobby_id>/end', methods=['POST'])
+@bp.route('/api/lobby/<lobby_id>/end', methods=['POST'])
+@lobby_writer
 def end_lobby(lobby_id):
     """End the lobby (host only) - kicks all players"""
-    lobby = Lobby.query.get(lobby_id)
+    lobby = get_lobby_for_write(lobby_id)
     if not lobby:
         return jsonify({'error': 'Lobby not found'}), 404
     
     # Set lobby status to ended
     lobby.status = 'ended'
-    db.session.commit()
+    commit_lobby_change(lobby, [{'type': 'lobby', 'status': 'ended'}])
     
     return jsonify({'success': True})
 
-@app.route('/api/lobby/<lobby_id>/forfeit', methods=['POST'])
+@bp.route('/api/lobby/<lobby_id>/forfeit', methods=['POST'])
+@lobby_writer
 def forfeit_round(lobby_id):
     """Forfeit the current round (reveal all words)"""
-    lobby = Lobby.query.get(lobby_id)
+    lobby = get_lobby_for_write(lobby_id)
     if not lobby:
         return jsonify({'error': 'Lobby not found'}), 404
     
@@ -683,15 +1159,20 @@ def forfeit_round(lobby_id):
     
     # Reveal all words
     revealed_words = list(words_to_reveal)
-    lobby.revealed_words = json.dumps(revealed_words)
-    db.session.commit()
+    new_words = lobby.reveal_words(revealed_words)
+    commit_lobby_change(lobby, revealed_changes(new_words))
     
     return jsonify({'success': True, 'revealed_words': revealed_words})
 
-@app.route('/api/lobby/<lobby_id>/reveal-all', methods=['POST'])
+def revealed_changes(words):
+    """Change events for words revealed without an owner (forfeit/timer)"""
+    return [{'type': 'word_revealed', 'word': word, 'owner': None} for word in words]
+
+@bp.route('/api/lobby/<lobby_id>/reveal-all', methods=['POST'])
+@lobby_writer
 def reveal_all_words(lobby_id):
     """Reveal all words (for forfeit/timer)"""
-    lobby = Lobby.query.get(lobby_id)
+    lobby = get_lobby_for_write(lobby_id)
     if not lobby:
         return jsonify({'error': 'Lobby not found'}), 404
     
@@ -711,22 +1192,22 @@ def reveal_all_words(lobby_id):
             if word not in revealed_words:
                 revealed_words.append(word)
         
-        lobby.revealed_words = json.dumps(revealed_words)
-        db.session.commit()
+        new_words = lobby.reveal_words([w for w in revealed_words if isinstance(w, str) and len(w) <= MAX_WORD_LENGTH])
+        commit_lobby_change(lobby, revealed_changes(new_words))
     
     return jsonify({'success': True, 'revealed_words': revealed_words})
 
-@app.route('/api/lobby/<lobby_id>/leaderboard')
+@bp.route('/api/lobby/<lobby_id>/leaderboard')
 def get_leaderboard(lobby_id):
     """Get current leaderboard"""
-    participants = LobbyParticipant.query.filter_by(lobby_id=lobby_id).order_by(
-        LobbyParticipant.score.desc()
-    ).all()
+    participants = LobbyParticipant.query.options(selectinload(LobbyParticipant.guesses)).filter_by(
+        lobby_id=lobby_id
+    ).order_by(LobbyParticipant.score.desc()).all()
     
     leaderboard = [p.to_dict() for p in participants]
     return jsonify({'leaderboard': leaderboard})
 
-@app.route('/results')
+@bp.route('/results')
 def results():
     """Display game results"""
     lobby_id = request.args.get('lobby')
@@ -735,11 +1216,21 @@ def results():
         # Multiplayer results
         lobby = Lobby.query.get(lobby_id)
         if not lobby:
-            return redirect(url_for('index'))
+            # The reaper may have archived the game already
+            archived = ArchivedGame.query.filter_by(lobby_id=lobby_id).order_by(ArchivedGame.id.desc()).first()
+            if not archived:
+                return redirect(url_for('.index'))
+            return render_template('results.html',
+                                 is_multiplayer=True,
+                                 lobby_id=lobby_id,
+                                 leaderboard=archived.leaderboard(),
+                                 game_mode=archived.game_mode,
+                                 shared_score=archived.shared_score,
+                                 total_rounds=5)
         
-        participants = LobbyParticipant.query.filter_by(lobby_id=lobby_id).order_by(
-            LobbyParticipant.score.desc()
-        ).all()
+        participants = LobbyParticipant.query.options(selectinload(LobbyParticipant.guesses)).filter_by(
+            lobby_id=lobby_id
+        ).order_by(LobbyParticipant.score.desc()).all()
         
         leaderboard = [p.to_dict() for p in participants]
         max_rounds = 5  # All modes use 5 rounds
@@ -767,26 +1258,58 @@ def results():
                              final_score=final_score,
                              total_rounds=5)
 
-# Set correct MIME types for static files
-@app.after_request
-def set_static_mime_types(response):
-    """Set correct MIME types for static files"""
-    if request.path.startswith('/static/'):
-        if request.path.endswith('.css'):
-            response.headers['Content-Type'] = 'text/css; charset=utf-8'
-        elif request.path.endswith('.js'):
-            response.headers['Content-Type'] = 'application/javascript; charset=utf-8'
-        elif request.path.endswith('.png'):
-            response.headers['Content-Type'] = 'image/png'
-        elif request.path.endswith('.jpg') or request.path.endswith('.jpeg'):
-            response.headers['Content-Type'] = 'image/jpeg'
-        elif request.path.endswith('.svg'):
-            response.headers['Content-Type'] = 'image/svg+xml'
+@bp.after_app_request
+def compress_response(response):
+    """Compress JSON API responses for clients that accept it"""
+    if response_compressor.min_size > 0:
+        response_compressor.apply(request, response)
     return response
 
-# Create database tables
-with app.app_context():
-    db.create_all()
+def create_app(prepare_schema=None):
+    """Build the app: configuration, extensions, routes and (unless turned off) the schema.
+
+    `prepare_schema` defaults to PREPARE_SCHEMA. Importing this module builds
+    the app gunicorn serves as src.app:app.
+    """
+    app = Flask(__name__,
+                template_folder='../templates',
+                static_folder='../static',
+                static_url_path='/static')
+    app.secret_key = SECRET_KEY
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = DATABASE_ENGINE_OPTIONS
+
+    static_assets.init_app(app)
+    # Before the blueprint, so its after_request (compression) runs first and
+    # metrics see the final response
+    metrics.init_app(app)
+    profiler.init_app(app)
+
+    db.init_app(app)
+    with app.app_context():
+        configure_sqlite(db.engine, busy_timeout_ms=int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)))
+        metrics.instrument_engine(db.engine)
+
+    app.register_blueprint(bp)
+
+    @app.cli.command('prepare-db')
+    def prepare_db_command():
+        """Create missing tables and run the schema upgrades"""
+        prepare_database()
+        print('Database schema is up to date')
+
+    if prepare_schema is None:
+        prepare_schema = PREPARE_SCHEMA
+    if prepare_schema:
+        with app.app_context():
+            prepare_database()
+
+    lobby_reaper.init_app(app)
+    lobby_reaper.start()
+    return app
+
+app = create_app()
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,159 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+from flask import Response, abort, current_app, request, url_for
+
+try:
+    import brotli
+except ImportError:  # in requirements.txt; without it assets are gzip only
+    brotli = None
+
+# Set explicitly: some hosts' mimetypes tables map .js to text/plain
+MIMETYPES = {
+    '.css': 'text/css',
+    '.js': 'application/javascript',
+    '.json': 'application/json',
+    '.svg': 'image/svg+xml',
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.webp': 'image/webp',
+    '.ico': 'image/x-icon',
+    '.woff2': 'font/woff2',
+}
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# style.3f2a1b9c0d1e.css -> style.css, for hashes from before a deploy
+HASHED_NAME = re.compile(r'^(?P<stem>.+)\.[0-9a-f]{12}(?P<ext>\.[^./]+)$')
+
+
+class _Asset:
+    __slots__ = ('name', 'hashed_name', 'mimetype', 'etag', 'bodies', 'mtime')
+
+    def __init__(self, name, hashed_name, mimetype, etag, bodies, mtime):
+        self.name = name
+        self.hashed_name = hashed_name
+        self.mimetype = mimetype
+        self.etag = etag
+        self.bodies = bodies
+        self.mtime = mtime
+
+
+def hashed_name(name, digest):
+    """css/style.css -> css/style.<digest>.css"""
+    stem, ext = os.path.splitext(name)
+    return f'{stem}.{digest}{ext}'
+
+
+def load_asset(directory, name):
+    path = os.path.join(directory, name)
+    with open(path, 'rb') as f:
+        data = f.read()
+    ext = os.path.splitext(name)[1].lower()
+    mimetype = MIMETYPES.get(ext) or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    bodies = {'identity': data}
+    if mimetype.startswith(COMPRESSIBLE):
+        candidates = {'gzip': gzip.compress(data, 9, mtime=0)}
+        if brotli is not None:
+            candidates['br'] = brotli.compress(data, quality=11)
+        bodies.update((encoding, body) for encoding, body in candidates.items() if len(body) < len(data))
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    return _Asset(name, hashed_name(name, digest), mimetype, digest, bodies, os.path.getmtime(path))
+
+
+class StaticAssets:
+    """Fingerprinted, precompressed copies of everything under the static folder.
+
+    At startup every file is read once, named after its content hash and
+    compressed with brotli and gzip. Templates link to
+    asset_url('css/style.css'), which is /static/css/style.<hash>.css, and
+    that URL is served from memory with Cache-Control: immutable in the
+    encoding the client accepts. The plain name still works, revalidated
+    with the same ETag every time, and so do hashes from before a deploy.
+    In debug mode a changed file is picked up on the next page render.
+    Without `directory`, init_app() uses the app's static folder.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._assets = {}
+        self._by_hash = {}
+        if directory is not None:
+            self.build()
+
+    def build(self):
+        assets = {}
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                name = os.path.relpath(os.path.join(root, filename), self.directory).replace(os.sep, '/')
+                try:
+                    assets[name] = load_asset(self.directory, name)
+                except OSError as e:
+                    print(f'Error reading static asset {name}: {str(e)}')
+        with self._lock:
+            self._assets = assets
+            self._by_hash = {asset.hashed_name: asset for asset in assets.values()}
+
+    def init_app(self, app):
+        """Serve /static/ from here and add asset_url() to templates"""
+        if self.directory is None:
+            self.directory = app.static_folder
+            self.build()
+        app.view_functions['static'] = self.send
+        app.jinja_env.globals['asset_url'] = self.url
+
+    def url(self, filename):
+        """URL of the fingerprinted copy of `filename` (relative to the static folder)"""
+        if current_app.debug:
+            self._reload_changed()
+        asset = self._assets.get(filename)
+        return url_for('static', filename=asset.hashed_name if asset else filename)
+
+    def send(self, filename):
+        asset = self._by_hash.get(filename)
+        immutable = asset is not None
+        if asset is None:
+            asset = self._assets.get(filename)
+        if asset is None:
+            match = HASHED_NAME.match(filename)
+            asset = self._assets.get(match.group('stem') + match.group('ext')) if match else None
+        if asset is None:
+            abort(404)
+
+        encoding = 'identity'
+        for candidate in ('br', 'gzip'):
+            if candidate in asset.bodies and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+        etag = asset.etag if encoding == 'identity' else f'{asset.etag}-{encoding}'
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = Response(asset.bodies[encoding], mimetype=asset.mimetype)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        if len(asset.bodies) > 1:
+            response.vary.add('Accept-Encoding')
+        if immutable:
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response
+
+    def _reload_changed(self):
+        for name, asset in list(self._assets.items()):
+            try:
+                changed = os.path.getmtime(os.path.join(self.directory, name)) != asset.mtime
+            except OSError:
+                changed = True
+            if changed:
+                self.build()
+                return
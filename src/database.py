@@ -0,0 +1,62 @@
+from sqlalchemy import event
+
+
+def normalize_database_url(database_url):
+    """Map Render/Heroku style URLs onto the psycopg2 driver we ship with.
+
+    SQLAlchemy 2.1 treats a bare postgresql:// as psycopg 3, which isn't in
+    requirements.txt.
+    """
+    for prefix in ('postgres://', 'postgresql://'):
+        if database_url.startswith(prefix):
+            return 'postgresql+psycopg2://' + database_url[len(prefix):]
+    return database_url
+
+
+def engine_options(database_url, workers=1, max_connections=20, pool_size=None, max_overflow=None,
+                   pool_timeout=10, pool_recycle=1800, pre_ping=True, statement_timeout_ms=5000):
+    """SQLALCHEMY_ENGINE_OPTIONS for a worker process.
+
+    Every gunicorn worker has its own pool, so by default each one gets an
+    equal share of `max_connections`: two thirds kept open, the rest as
+    overflow for bursts.
+    """
+    if database_url.startswith('sqlite') and (database_url == 'sqlite://' or ':memory:' in database_url):
+        return {}  # one shared in-memory connection, nothing to tune
+    share = max(1, max_connections // max(1, workers))
+    if pool_size is None:
+        pool_size = max(1, share * 2 // 3)
+    if max_overflow is None:
+        max_overflow = max(0, share - pool_size)
+    options = {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'pool_recycle': pool_recycle,
+        # Checks a connection with a cheap round trip before handing it out, so
+        # connections the server or a proxy closed while idle are replaced
+        # instead of failing the first requests after a quiet period
+        'pool_pre_ping': pre_ping,
+    }
+    if database_url.startswith('postgresql') and statement_timeout_ms:
+        options['connect_args'] = {'options': f'-c statement_timeout={int(statement_timeout_ms)}'}
+    return options
+
+
+def configure_sqlite(engine, busy_timeout_ms=5000):
+    """WAL mode and a busy timeout for every new SQLite connection.
+
+    WAL lets readers carry on while a write is in progress, and the busy
+    timeout makes a writer wait for the lock instead of failing with
+    "database is locked".
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'PRAGMA busy_timeout = {int(busy_timeout_ms)}')
+        cursor.execute('PRAGMA journal_mode = WAL')
+        cursor.execute('PRAGMA synchronous = NORMAL')
+        cursor.close()
@@ -0,0 +1,50 @@
+import queue
+import threading
+from collections import defaultdict
+
+
+class LobbyEventBroker:
+    """In-process fan-out of lobby state changes to stream subscribers"""
+
+    def __init__(self, max_queue_size=16):
+        self.max_queue_size = max_queue_size
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, lobby_id):
+        """Register a new subscriber and return the queue it should read from"""
+        subscriber = queue.Queue(maxsize=self.max_queue_size)
+        with self._lock:
+            self._subscribers[lobby_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, lobby_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(lobby_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[lobby_id]
+
+    def has_subscribers(self, lobby_id):
+        return bool(self._subscribers.get(lobby_id))
+
+    def publish(self, lobby_id, message):
+        """Deliver a message to every subscriber of a lobby"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(lobby_id, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # Slow client: drop the oldest message, every message is a full snapshot
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    subscriber.put_nowait(message)
+                except queue.Full:
+                    pass
+
@@ -0,0 +1,106 @@
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class ImagePool:
+    """Already-processed images per (query, difficulty), refilled in the background.
+
+    `fetch(query, difficulty, count)` must return a list of process_image()
+    results; query is None for random search terms. Images are handed out
+    once and dropped after `max_age` seconds so asset URLs stay fresh.
+    """
+
+    def __init__(self, fetch, target_size=8, max_pools=32, max_age=1800):
+        self.fetch = fetch
+        self.target_size = target_size
+        self.max_pools = max_pools
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.refill_errors = 0
+        self._lock = threading.Lock()
+        self._pools = OrderedDict()
+        self._pending = set()
+        self._queue = queue.Queue()
+        self._worker = None
+
+    @property
+    def enabled(self):
+        return self.target_size > 0
+
+    def take(self, query, difficulty, count=1):
+        """Return `count` pooled images, or an empty list on a miss"""
+        if not self.enabled:
+            return []
+        key = (query or None, difficulty)
+        images = []
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is not None:
+                self._pools.move_to_end(key)
+                self._drop_expired(pool)
+                if len(pool) >= count:
+                    images = [pool.popleft()[1] for _ in range(count)]
+            if images:
+                self.hits += 1
+            else:
+                self.misses += 1
+        self.prefetch(query, difficulty)
+        return images
+
+    def prefetch(self, query, difficulty):
+        """Queue a background refill if the pool has dropped below half its target"""
+        if not self.enabled:
+            return
+        key = (query or None, difficulty)
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = self._pools[key] = deque()
+                while len(self._pools) > self.max_pools:
+                    self._pools.popitem(last=False)
+            if len(pool) * 2 >= self.target_size or key in self._pending:
+                return
+            self._pending.add(key)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='image-pool', daemon=True)
+                self._worker.start()
+        self._queue.put(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'refills': self.refills,
+                'refill_errors': self.refill_errors,
+                'pools': len(self._pools),
+                'pooled_images': sum(len(pool) for pool in self._pools.values())
+            }
+
+    def _drop_expired(self, pool):
+        cutoff = time.monotonic() - self.max_age
+        while pool and pool[0][0] < cutoff:
+            pool.popleft()
+
+    def _run(self):
+        while True:
+            key = self._queue.get()
+            try:
+                images = self.fetch(key[0], key[1], self.target_size)
+            except Exception as e:
+                print(f'Error refilling image pool: {str(e)}')
+                images = None
+            with self._lock:
+                self._pending.discard(key)
+                if images is None:
+                    self.refill_errors += 1
+                    continue
+                self.refills += 1
+                pool = self._pools.get(key)
+                if pool is not None:
+                    fetched_at = time.monotonic()
+                    pool.extend((fetched_at, image) for image in images)
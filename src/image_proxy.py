@@ -0,0 +1,261 @@
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from urllib.parse import urljoin, urlparse
+
+# Longest side in pixels of each variant: the host's TV/laptop screen, or a
+# phone showing the image about 400 CSS pixels wide at 2x
+VARIANTS = {'host': 1600, 'mobile': 800}
+FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+MIMETYPES = {'webp': 'image/webp', 'jpg': 'image/jpeg'}
+
+
+class ImageProxyError(Exception):
+    """Raised when a source image can't be fetched or decoded"""
+
+
+def render_variant(source, max_side, fmt, quality=80):
+    """Downscale image bytes so neither side exceeds `max_side` and encode them as `fmt`"""
+    # Imported here so workers that never render a variant don't load Pillow
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(io.BytesIO(source)) as image:
+            # JPEG sources can be decoded at a fraction of their size directly
+            image.draft('RGB', (max_side, max_side))
+            image = ImageOps.exif_transpose(image).convert('RGB')
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+            buffer = io.BytesIO()
+            if fmt == 'jpg':
+                image.save(buffer, format='JPEG', quality=quality, optimize=True, progressive=True)
+            else:
+                image.save(buffer, format=FORMATS[fmt], quality=quality, method=4)
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ImageProxyError(f'Could not decode image: {str(e)}')
+    return buffer.getvalue()
+
+
+def run_off_hub(function, *args):
+    """Call `function` in a real thread when gevent has patched threading, else directly.
+
+    Pillow releases the GIL while it decodes, resizes and encodes, so under
+    the gevent worker a render in the hub's thread pool no longer stops every
+    other request and stream for its duration.
+    """
+    monkey = sys.modules.get('gevent.monkey')
+    if monkey is not None and monkey.is_module_patched('threading'):
+        import gevent
+        result, error = gevent.get_hub().threadpool.apply(_capture, (function, args))
+        if error is not None:
+            raise error
+        return result
+    return function(*args)
+
+
+def _capture(function, args):
+    # Raised in the caller instead; the thread pool would print every exception as unhandled
+    try:
+        return function(*args), None
+    except Exception as e:
+        return None, e
+
+
+class DiskLRU:
+    """Files in a directory, least recently used removed first once they exceed `max_bytes`.
+
+    The order is rebuilt from modification times at startup, and reads touch
+    the file, so it survives restarts. Processes sharing the directory keep
+    their own index; a file another one removed is just a miss.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and not entry.name.startswith('tmp'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        with self._lock:
+            for _, name, size in sorted(files):
+                self._entries[name] = size
+                self.size += size
+            self._evict()
+
+    def get(self, name):
+        """Return the file's bytes, or None"""
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                self.size -= self._entries.pop(name, 0)
+            return None
+        with self._lock:
+            if name not in self._entries:
+                # Written by another process
+                self._entries[name] = len(data)
+                self.size += len(data)
+            self._entries.move_to_end(name)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, name, data):
+        try:
+            # Write then rename, so readers never see a half-written file
+            handle, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='tmp')
+            with os.fdopen(handle, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, os.path.join(self.directory, name))
+        except OSError as e:
+            print(f'Error writing image cache: {str(e)}')
+            return
+        with self._lock:
+            self.size -= self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+            self.size += len(data)
+            self._evict()
+
+    def _evict(self):
+        # Keep at least the newest file, even if it alone is over the limit
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+
+class ImageProxy:
+    """Resized variants of upstream images, fetched once and kept in a DiskLRU.
+
+    The fetched original is cached next to its variants, so a second variant
+    of the same image is rendered without going upstream again. Only URLs on
+    `allowed_hosts` (or their subdomains) are fetched. `on_fetch(outcome, seconds)`
+    is told about every upstream fetch, like ShutterstockClient's on_call.
+    """
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024, allowed_hosts=('shutterstock.com',),
+                 timeout=10, max_source_bytes=25 * 1024 * 1024, quality=80, on_fetch=None):
+        self.cache = DiskLRU(cache_dir, max_bytes)
+        self.allowed_hosts = [host.lower() for host in allowed_hosts]
+        self.timeout = timeout
+        self.max_source_bytes = max_source_bytes
+        self.quality = quality
+        self.on_fetch = on_fetch
+        self._session = None
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self._lock = threading.Lock()
+        self._url_locks = weakref.WeakValueDictionary()
+
+    def allowed(self, url):
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+            return False
+        host = parsed.hostname.lower()
+        return any(host == allowed or host.endswith('.' + allowed) for allowed in self.allowed_hosts)
+
+    def name(self, url, variant, fmt):
+        """Cache file name of a variant; it doubles as a strong ETag"""
+        digest = hashlib.sha256(url.encode()).hexdigest()
+        return f'{digest}-{variant}-q{self.quality}.{fmt}'
+
+    def get(self, url, variant, fmt):
+        """Bytes of `url` resized for `variant` and encoded as `fmt`, rendering them on a miss"""
+        name = self.name(url, variant, fmt)
+        image = self.cache.get(name)
+        if image is not None:
+            with self._lock:
+                self.hits += 1
+            return image
+        # One fetch per image, however many clients ask for it at once
+        with self._lock_for(url):
+            image = self.cache.get(name)
+            if image is not None:
+                with self._lock:
+                    self.hits += 1
+                return image
+            with self._lock:
+                self.misses += 1
+            source_name = f'{hashlib.sha256(url.encode()).hexdigest()}-source'
+            source = self.cache.get(source_name)
+            if source is None:
+                source = self._fetch(url)
+                self.cache.put(source_name, source)
+            image = run_off_hub(render_variant, source, VARIANTS[variant], fmt, self.quality)
+            self.cache.put(name, image)
+            return image
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'fetches': self.fetches,
+                'cached_bytes': self.cache.size, 'max_bytes': self.cache.max_bytes}
+
+    def _lock_for(self, url):
+        with self._lock:
+            lock = self._url_locks.get(url)
+            if lock is None:
+                lock = threading.Lock()
+                self._url_locks[url] = lock
+            return lock
+
+    def _get_session(self):
+        # Created on the first fetch, which is also when requests gets imported
+        with self._lock:
+            if self._session is None:
+                import requests
+                self._session = requests.Session()
+            return self._session
+
+    def _fetch(self, url):
+        import requests
+
+        session = self._get_session()
+        with self._lock:
+            self.fetches += 1
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            # Redirects are followed by hand so they can't leave the allowed hosts
+            for _ in range(3):
+                with session.get(url, timeout=self.timeout, stream=True, allow_redirects=False) as response:
+                    if response.is_redirect:
+                        url = urljoin(url, response.headers['Location'])
+                        if not self.allowed(url):
+                            raise ImageProxyError(f'Redirected to a host that is not allowed: {url}')
+                        continue
+                    outcome = str(response.status_code)
+                    response.raise_for_status()
+                    chunks = []
+                    size = 0
+                    for chunk in response.iter_content(64 * 1024):
+                        size += len(chunk)
+                        if size > self.max_source_bytes:
+                            raise ImageProxyError('Image is too large')
+                        chunks.append(chunk)
+                    return b''.join(chunks)
+        except requests.Timeout as e:
+            outcome = 'timeout'
+            raise ImageProxyError(f'Could not fetch image: {str(e)}')
+        except requests.RequestException as e:
+            raise ImageProxyError(f'Could not fetch image: {str(e)}')
+        finally:
+            if self.on_fetch:
+                self.on_fetch(outcome, time.perf_counter() - started)
+        raise ImageProxyError('Too many redirects')
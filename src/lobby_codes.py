@@ -0,0 +1,121 @@
+import json
+import secrets
+import string
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from .models import db, ArchivedGame, Guess, Lobby, LobbyChange, LobbyParticipant, RoundWord
+
+CODE_CHARACTERS = string.ascii_uppercase + string.digits
+CODE_LENGTH = 6
+
+# Lobby statuses whose codes may be handed out again
+CLOSED_STATUSES = ('finished', 'ended')
+
+# Lobby columns archive_games() needs
+ARCHIVE_COLUMNS = (Lobby.id, Lobby.status, Lobby.game_mode, Lobby.difficulty, Lobby.current_round,
+                   Lobby.shared_score, Lobby.started_at, Lobby.last_activity_at)
+
+
+class LobbyCodeExhausted(Exception):
+    """Raised when no free lobby code was found within the allowed attempts"""
+
+
+def generate_lobby_code():
+    """Generate a short random lobby code (not checked for uniqueness)"""
+    return ''.join(secrets.choice(CODE_CHARACTERS) for _ in range(CODE_LENGTH))
+
+
+def create_lobby(attempts=10, recycle_after=timedelta(hours=6), **fields):
+    """Insert a new lobby under a fresh random code and return the code.
+
+    There is no existence check up front: the INSERT itself claims the code,
+    and a primary-key conflict just means trying another one, so two
+    creators can never end up with the same code. When the conflicting code
+    belongs to a closed lobby with no activity for `recycle_after`, that
+    lobby is archived and deleted and its code reused. The new lobby's
+    state_version carries on from the old one's, so ETags, Last-Event-ID
+    and ?since= never mean two different states under the same code.
+    """
+    for _ in range(attempts):
+        code = generate_lobby_code()
+        if _insert_lobby(code, fields):
+            return code
+        version = recycle_lobby_code(code, recycle_after)
+        if version is not None and _insert_lobby(code, dict(fields, state_version=version + 1)):
+            return code
+    raise LobbyCodeExhausted()
+
+
+def recycle_lobby_code(code, older_than):
+    """Archive and delete the closed lobby holding `code` if it has been idle long enough.
+
+    Returns the deleted lobby's state_version, or None if nothing was recycled.
+    """
+    now = datetime.utcnow()
+    recyclable = db.and_(Lobby.id == code, Lobby.status.in_(CLOSED_STATUSES),
+                         Lobby.last_activity_at < now - older_than)
+    lobbies = db.session.execute(
+        db.select(*ARCHIVE_COLUMNS, Lobby.state_version).where(recyclable).with_for_update()).all()
+    if not lobbies:
+        db.session.rollback()
+        return None
+    archive_games(lobbies, now)
+    # Every delete re-checks the lobby is closed, in case a new lobby took the code meanwhile
+    closed_lobby = db.select(Lobby.id).where(recyclable)
+    for model in (Guess, RoundWord, LobbyChange, LobbyParticipant):
+        db.session.execute(db.delete(model).where(model.lobby_id.in_(closed_lobby)))
+    result = db.session.execute(db.delete(Lobby).where(recyclable))
+    if result.rowcount != 1:
+        db.session.rollback()
+        return None
+    db.session.commit()
+    return lobbies[0].state_version or 0
+
+
+def archive_games(lobbies, now):
+    """Copy the final scores of the lobbies (rows of ARCHIVE_COLUMNS) that got started into archived_games.
+
+    Runs in the caller's transaction. Returns how many were archived.
+    """
+    played = {lobby.id: lobby for lobby in lobbies if lobby.started_at is not None}
+    if not played:
+        return 0
+    scores = {lobby_id: [] for lobby_id in played}
+    participants = db.session.execute(
+        db.select(LobbyParticipant.lobby_id, LobbyParticipant.player_name, LobbyParticipant.score,
+                  LobbyParticipant.player_color, LobbyParticipant.team)
+        .where(LobbyParticipant.lobby_id.in_(list(played)))
+        .order_by(LobbyParticipant.score.desc())
+    ).all()
+    for participant in participants:
+        scores[participant.lobby_id].append({
+            'player_name': participant.player_name,
+            'score': participant.score or 0,
+            'player_color': participant.player_color,
+            'team': participant.team
+        })
+    db.session.execute(db.insert(ArchivedGame), [{
+        'lobby_id': lobby.id,
+        'status': lobby.status if lobby.status in CLOSED_STATUSES else 'abandoned',
+        'game_mode': lobby.game_mode,
+        'difficulty': lobby.difficulty,
+        'rounds_played': min(5, (lobby.current_round or 0) + 1),
+        'shared_score': lobby.shared_score or 0,
+        'started_at': lobby.started_at,
+        'ended_at': lobby.last_activity_at,
+        'archived_at': now,
+        'scores': json.dumps(scores[lobby.id])
+    } for lobby in played.values()])
+    return len(played)
+
+
+def _insert_lobby(code, fields):
+    db.session.add(Lobby(id=code, **fields))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
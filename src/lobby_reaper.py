@@ -0,0 +1,131 @@
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .lobby_codes import ARCHIVE_COLUMNS, CLOSED_STATUSES, archive_games
+from .models import db, Guess, Lobby, LobbyChange, LobbyParticipant, RoundWord
+
+
+class LobbyReaper:
+    """Deletes lobbies nobody uses anymore, keeping the final scores of played games.
+
+    A lobby is reaped once its last activity is older than `closed_after`
+    (finished or ended games) or `idle_after` (waiting or active lobbies that
+    were abandoned). Games that got started are first copied to
+    archived_games. Work is done in batches of `batch_size` lobbies, each in
+    its own short transaction, so live games are never blocked for long.
+    """
+
+    def __init__(self, app=None, idle_after=timedelta(hours=2), closed_after=timedelta(hours=1),
+                 interval=300, batch_size=100, pause=0.05, on_removed=None):
+        self.app = app
+        self.idle_after = idle_after
+        self.closed_after = closed_after
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.on_removed = on_removed
+        self.runs = 0
+        self.last_report = None
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def init_app(self, app):
+        """Reap through `app`'s database; for reapers created before the app"""
+        self.app = app
+
+    @property
+    def enabled(self):
+        return self.interval > 0
+
+    def start(self):
+        """Run the reaper every `interval` seconds in a daemon thread"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='lobby-reaper', daemon=True)
+                self._worker.start()
+
+    def run_once(self, now=None):
+        """Reap everything that is due and return how many rows were reclaimed per table"""
+        now = now or datetime.utcnow()
+        report = {'lobbies': 0, 'archived': 0, 'lobby_participants': 0, 'guesses': 0,
+                  'round_words': 0, 'lobby_changes': 0, 'batches': 0, 'conflicts': 0}
+        started = time.perf_counter()
+        with self.app.app_context():
+            while True:
+                reaped = self._reap_batch(now)
+                if reaped is None:
+                    report['conflicts'] += 1
+                    if report['conflicts'] > 3:
+                        break
+                    continue
+                if not reaped['lobbies']:
+                    break
+                report['batches'] += 1
+                for key, count in reaped.items():
+                    report[key] += count
+                if reaped['lobbies'] < self.batch_size:
+                    break
+                time.sleep(self.pause)
+        report['seconds'] = round(time.perf_counter() - started, 3)
+        self.runs += 1
+        self.last_report = report
+        return report
+
+    def _expired(self, now):
+        return db.or_(
+            db.and_(Lobby.status.in_(CLOSED_STATUSES), Lobby.last_activity_at < now - self.closed_after),
+            db.and_(Lobby.status.notin_(CLOSED_STATUSES), Lobby.last_activity_at < now - self.idle_after)
+        )
+
+    def _reap_batch(self, now):
+        """Archive and delete one batch. Returns None if a lobby came back to life meanwhile."""
+        expired = self._expired(now)
+        # Other workers' reapers skip the rows this one holds (PostgreSQL; SQLite has one writer anyway)
+        lobbies = db.session.execute(
+            db.select(*ARCHIVE_COLUMNS)
+            .where(expired)
+            .order_by(Lobby.last_activity_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not lobbies:
+            db.session.rollback()
+            return {'lobbies': 0}
+        lobby_ids = [lobby.id for lobby in lobbies]
+        archived = archive_games(lobbies, now)
+
+        # Every delete re-checks the lobby is still expired, like recycle_lobby_code
+        still_expired = db.select(Lobby.id).where(Lobby.id.in_(lobby_ids), expired)
+        reaped = {'lobbies': len(lobby_ids), 'archived': archived}
+        for model in (Guess, RoundWord, LobbyChange, LobbyParticipant):
+            result = db.session.execute(db.delete(model).where(model.lobby_id.in_(still_expired)))
+            reaped[model.__tablename__] = result.rowcount
+        result = db.session.execute(db.delete(Lobby).where(Lobby.id.in_(lobby_ids), expired))
+        if result.rowcount != len(lobby_ids):
+            # One of them had a state change between the SELECT and here; the next batch skips it
+            db.session.rollback()
+            return None
+        db.session.commit()
+        if self.on_removed:
+            for lobby_id in lobby_ids:
+                self.on_removed(lobby_id)
+        return reaped
+
+    def _run(self):
+        while True:
+            # Spread workers out so they don't all reap at the same moment
+            time.sleep(self.interval * random.uniform(0.5, 1.5))
+            try:
+                report = self.run_once()
+            except Exception as e:
+                print(f'Error reaping lobbies: {str(e)}')
+                continue
+            if report['lobbies']:
+                print(f"Reaped {report['lobbies']} lobbies ({report['archived']} archived, "
+                      f"{report['lobby_participants']} participants, {report['guesses']} guesses, "
+                      f"{report['round_words']} round words, {report['lobby_changes']} changes) "
+                      f"in {report['batches']} batches, {report['seconds']}s")
@@ -0,0 +1,244 @@
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from .answers import AnswerIndex
+from .models import db, Guess, Lobby, LobbyChange, LobbyParticipant, RoundWord
+from .wire import compact_payload, encode_json
+
+
+class StaleLobbyState(Exception):
+    """Raised when a write-through finds the lobby row changed underneath the cache"""
+
+
+class DuplicateGuess(Exception):
+    """Raised when a participant already guessed the word this round"""
+
+
+class ParticipantState:
+    """Decoded per-participant state for the current round"""
+
+    def __init__(self, fields):
+        self.fields = fields  # LobbyParticipant.to_dict() output
+        self.id = fields['id']
+        self.player_name = fields['player_name']
+        self.team = fields['team']
+        self.is_captain = fields['is_captain']
+        self.player_color = fields['player_color']
+        self.score = fields['score'] or 0
+        self.guessed_words = list(fields['guessed_words'])
+        self.guessed = set(self.guessed_words)
+
+    def to_dict(self):
+        return dict(self.fields, score=self.score, guessed_words=list(self.guessed_words))
+
+
+class LobbyState:
+    """Already-decoded lobby state, so hot paths skip the JSON columns"""
+
+    def __init__(self, fields, participants):
+        self.fields = fields  # Lobby.to_dict() output
+        self.lobby_id = fields['id']
+        self.version = fields['state_version']
+        self.status = fields['status']
+        self.game_mode = fields['game_mode']
+        self.current_round = fields['current_round'] or 0
+        self.active_team = fields['active_team']
+        self.shared_score = fields['shared_score'] or 0
+        self.image_data = fields['current_image_data']
+        self.revealed_words = list(fields['revealed_words'])
+        self.revealed = set(self.revealed_words)
+        self.answers = AnswerIndex.for_image(self.image_data)
+        self.remaining_words = self.answers.remaining(self.revealed)
+        self.word_owners = dict(fields['word_owners'])
+        self.participants = {p.player_name: p for p in participants}
+        self.touched_at = time.monotonic()
+        self._bodies = {}
+
+    @classmethod
+    def from_lobby(cls, lobby):
+        participants = [ParticipantState(p.to_dict()) for p in lobby.participants]
+        return cls(lobby.to_dict(), participants)
+
+    @classmethod
+    def from_payload(cls, payload):
+        """Rebuild a state from to_payload() output (used by shared backends)"""
+        participants = [ParticipantState(p) for p in payload['participants']]
+        return cls(payload['lobby'], participants)
+
+    @property
+    def is_closed(self):
+        return self.status in ('finished', 'ended')
+
+    def to_payload(self):
+        """Same shape as the /status response"""
+        lobby = dict(self.fields,
+                     revealed_words=list(self.revealed_words),
+                     word_owners=dict(self.word_owners),
+                     shared_score=self.shared_score,
+                     state_version=self.version)
+        return {
+            'lobby': lobby,
+            'participants': [p.to_dict() for p in self.participants.values()]
+        }
+
+    def body(self, compact=False):
+        """JSON for /status and the stream, encoded once per version (and view)"""
+        key = (self.version, compact)
+        body = self._bodies.get(key)
+        if body is None:
+            payload = self.to_payload()
+            body = encode_json(compact_payload(payload) if compact else payload)
+            # Writes bump the version in place, so older encodings are never needed again
+            self._bodies = {k: v for k, v in self._bodies.items() if k[0] == self.version}
+            self._bodies[key] = body
+        return body
+
+
+class LobbyStateCache:
+    """LRU + idle-TTL cache of LobbyState keyed by lobby id"""
+
+    def __init__(self, max_entries=512, idle_ttl=600):
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, lobby_id):
+        with self._lock:
+            state = self._entries.get(lobby_id)
+            if state is None:
+                return None
+            now = time.monotonic()
+            if now - state.touched_at > self.idle_ttl:
+                del self._entries[lobby_id]
+                return None
+            state.touched_at = now
+            self._entries.move_to_end(lobby_id)
+            return state
+
+    def put(self, state):
+        with self._lock:
+            state.touched_at = time.monotonic()
+            self._entries[state.lobby_id] = state
+            self._entries.move_to_end(state.lobby_id)
+            self._evict(state.touched_at)
+        return state
+
+    def invalidate(self, lobby_id):
+        with self._lock:
+            self._entries.pop(lobby_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self, now):
+        # Oldest entries sit at the front, so expired ones are found first
+        while self._entries:
+            lobby_id, oldest = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_entries and now - oldest.touched_at <= self.idle_ttl:
+                break
+            del self._entries[lobby_id]
+
+
+class LobbyLocks:
+    """Per-lobby mutexes, so writers to one lobby queue up instead of racing.
+
+    Only requests for the same lobby serialize; other lobbies are unaffected.
+    Locks disappear once no request holds a reference to them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = weakref.WeakValueDictionary()
+
+    def __call__(self, lobby_id):
+        with self._lock:
+            lock = self._locks.get(lobby_id)
+            if lock is None:
+                lock = threading.Lock()
+                self._locks[lobby_id] = lock
+            return lock
+
+
+def write_guesses(state, participant, guesses, score=None, shared_score=None):
+    """Write a participant's guesses through in one transaction and apply them to the cached state.
+
+    `guesses` is a list of (word, is_correct, owner_name) in the order they
+    were made; `score`/`shared_score` are the totals after all of them (None
+    when unchanged). The guesses go in with one INSERT into guesses, whose
+    unique index rejects repeats (DuplicateGuess). The lobby UPDATE is
+    conditional on the cached state_version, so a cache that fell behind
+    another worker raises StaleLobbyState instead of writing on top of newer
+    rows. The guesses, revealed words and scores are also added to the
+    lobby's change log. Callers hand the updated state back to their state
+    backend afterwards.
+    """
+    round_number = state.current_round
+    try:
+        db.session.execute(db.insert(Guess), [
+            {'participant_id': participant.id, 'lobby_id': state.lobby_id,
+             'round': round_number, 'word': word, 'is_correct': is_correct}
+            for word, is_correct, _ in guesses
+        ])
+    except IntegrityError:
+        db.session.rollback()
+        raise DuplicateGuess(guesses[0][0])
+
+    lobby_values = {'state_version': state.version + 1, 'last_activity_at': datetime.utcnow()}
+    if shared_score is not None:
+        lobby_values['shared_score'] = shared_score
+    result = db.session.execute(
+        db.update(Lobby)
+        .where(Lobby.id == state.lobby_id, Lobby.state_version == state.version)
+        .values(**lobby_values)
+    )
+    if result.rowcount != 1:
+        db.session.rollback()
+        raise StaleLobbyState(state.lobby_id)
+
+    found = [(word, owner_name) for word, is_correct, owner_name in guesses if is_correct]
+    changes = [{'type': 'guessed', 'player_name': participant.player_name, 'word': word, 'is_correct': is_correct}
+               for word, is_correct, _ in guesses]
+    changes += [{'type': 'word_revealed', 'word': word, 'owner': owner_name} for word, owner_name in found]
+    if score is not None:
+        changes.append({'type': 'score', 'player_name': participant.player_name, 'score': score})
+    if shared_score is not None:
+        changes.append({'type': 'lobby', 'shared_score': shared_score})
+    LobbyChange.record(state.lobby_id, state.version + 1, round_number, changes)
+    if found:
+        try:
+            db.session.execute(db.insert(RoundWord), [
+                {'lobby_id': state.lobby_id, 'round': round_number, 'word': word, 'owner_name': owner_name}
+                for word, owner_name in found
+            ])
+        except IntegrityError:
+            db.session.rollback()
+            raise StaleLobbyState(state.lobby_id)
+    if score is not None:
+        db.session.execute(
+            db.update(LobbyParticipant)
+            .where(LobbyParticipant.id == participant.id)
+            .values(score=score)
+        )
+    db.session.commit()
+
+    state.version += 1
+    for word, _, _ in guesses:
+        participant.guessed_words.append(word)
+        participant.guessed.add(word)
+    if score is not None:
+        participant.score = score
+    for word, owner_name in found:
+        state.revealed_words.append(word)
+        state.revealed.add(word)
+        state.remaining_words -= 1
+        if owner_name is not None:
+            state.word_owners[word] = owner_name
+    if shared_score is not None:
+        state.shared_score = shared_score
@@ -0,0 +1,173 @@
+import contextvars
+import os
+import time
+
+from flask import Response, g, request
+
+# Request latency buckets, up to long-polls (?wait=) and slow upstream searches
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 20, 50)
+DB_TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+# Endpoint of the request being handled; background threads see None
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class _RequestStats:
+    __slots__ = ('endpoint', 'started', 'statements', 'db_seconds')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db_seconds = 0.0
+
+
+def current_endpoint():
+    """Flask endpoint of the request being handled, or 'background'"""
+    stats = _current.get()
+    return stats.endpoint if stats is not None else 'background'
+
+
+class Metrics:
+    """Prometheus metrics per Flask endpoint: requests, latency, SQL and upstream calls.
+
+    prometheus_client is imported here rather than at module level because
+    it picks single or multiprocess mode from PROMETHEUS_MULTIPROC_DIR when
+    it is first imported, and .env has to be loaded before that. In
+    multiprocess mode every gunicorn worker writes its values to that
+    directory and /metrics adds them up, whichever worker answers.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._children = {}
+        self.multiprocess_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR') or os.getenv('prometheus_multiproc_dir')
+        if not enabled:
+            return
+        from prometheus_client import CollectorRegistry, Counter, Histogram, disable_created_metrics
+        # The *_created series only say when a label set was first seen
+        disable_created_metrics()
+        if self.multiprocess_dir:
+            os.makedirs(self.multiprocess_dir, exist_ok=True)
+        self.registry = CollectorRegistry()
+        self.requests = Counter(
+            'spf_http_requests', 'HTTP requests handled',
+            ['endpoint', 'method', 'status'], registry=self.registry)
+        self.latency = Histogram(
+            'spf_http_request_duration_seconds', 'Time to build the response',
+            ['endpoint'], buckets=LATENCY_BUCKETS, registry=self.registry)
+        self.statements = Histogram(
+            'spf_db_statements_per_request', 'SQL statements executed per request',
+            ['endpoint'], buckets=STATEMENT_BUCKETS, registry=self.registry)
+        self.db_time = Histogram(
+            'spf_db_seconds_per_request', 'Time spent in SQL statements per request',
+            ['endpoint'], buckets=DB_TIME_BUCKETS, registry=self.registry)
+        self.background_statements = Counter(
+            'spf_db_background_statements', 'SQL statements run outside requests (reaper, image pool)',
+            registry=self.registry)
+        self.background_db_time = Counter(
+            'spf_db_background_seconds', 'Time spent in SQL statements outside requests',
+            registry=self.registry)
+        self.upstream_requests = Counter(
+            'spf_upstream_requests', 'Calls to Shutterstock by outcome (HTTP status, timeout, error, circuit_open)',
+            ['upstream', 'endpoint', 'outcome'], registry=self.registry)
+        self.upstream_latency = Histogram(
+            'spf_upstream_request_duration_seconds', 'Shutterstock call latency',
+            ['upstream', 'endpoint'], buckets=LATENCY_BUCKETS, registry=self.registry)
+
+    def init_app(self, app):
+        """Time every request and add the /metrics endpoint.
+
+        Setting `enabled` to False later stops recording but keeps the hooks.
+        """
+        if not self.enabled:
+            return
+        # after_request hooks run in reverse order, so registering this one
+        # first makes it run last and include compression time
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule('/metrics', 'metrics', self.exposition)
+
+    def instrument_engine(self, engine):
+        """Count and time the statements `engine` runs"""
+        if not self.enabled:
+            return
+        from sqlalchemy import event
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            context._metrics_started = time.perf_counter()
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            seconds = time.perf_counter() - context._metrics_started
+            stats = _current.get()
+            if stats is None:
+                self.background_statements.inc()
+                self.background_db_time.inc(seconds)
+            else:
+                stats.statements += 1
+                stats.db_seconds += seconds
+
+    def upstream_observer(self, upstream):
+        """Callback for ShutterstockClient(on_call=) and ImageProxy(on_fetch=)"""
+        def observe(outcome, seconds):
+            if not self.enabled:
+                return
+            endpoint = current_endpoint()
+            self.upstream_requests.labels(upstream, endpoint, outcome).inc()
+            if seconds is not None:
+                self.upstream_latency.labels(upstream, endpoint).observe(seconds)
+        return observe
+
+    def exposition(self):
+        from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest
+        if self.multiprocess_dir:
+            from prometheus_client import multiprocess
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry, path=self.multiprocess_dir)
+        else:
+            registry = self.registry
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+    def _before_request(self):
+        if not self.enabled:
+            return
+        stats = _RequestStats(request.endpoint or 'unmatched')
+        g._metrics_token = _current.set(stats)
+
+    def _after_request(self, response):
+        stats = _current.get()
+        if stats is not None:
+            seconds = time.perf_counter() - stats.started
+            latency, statements, db_time, requests = self._children_for(stats.endpoint)
+            key = (request.method, response.status_code)
+            counter = requests.get(key)
+            if counter is None:
+                counter = requests[key] = self.requests.labels(stats.endpoint, key[0], str(key[1]))
+            counter.inc()
+            latency.observe(seconds)
+            statements.observe(stats.statements)
+            db_time.observe(stats.db_seconds)
+        return response
+
+    def _children_for(self, endpoint):
+        # labels() takes a lock and builds a tuple on every call; endpoints are few
+        children = self._children.get(endpoint)
+        if children is None:
+            children = self._children[endpoint] = (
+                self.latency.labels(endpoint), self.statements.labels(endpoint),
+                self.db_time.labels(endpoint), {})
+        return children
+
+    def _teardown_request(self, exc):
+        token = g.pop('_metrics_token', None)
+        if token is not None:
+            try:
+                _current.reset(token)
+            except ValueError:
+                # Set in another context (streamed responses finish elsewhere)
+                _current.set(None)
+
@@ -1,4 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 from datetime import datetime
 import json
 
@@ -14,8 +16,8 @@ class Lobby(db.Model):
     started_at = db.Column(db.DateTime, nullable=True)
     current_round = db.Column(db.Integer, default=0)  # Current round
     current_image_data = db.Column(db.Text)  # JSON of current image info
-    revealed_words = db.Column(db.Text)  # JSON array of revealed words
-    word_owners = db.Column(db.Text)  # JSON dict: word -> player_name (for Free-for-All colors)
+    revealed_words = db.Column(db.Text)  # Deprecated - migrated to round_words
+    word_owners = db.Column(db.Text)  # Deprecated - migrated to round_words.owner_name
     game_mode = db.Column(db.String(20), default='free-for-all')  # free-for-all, competitive, cooperative
     difficulty = db.Column(db.String(10), default='hard')  # easy, hard
     team_captains = db.Column(db.Text)  # JSON array of two player names for competitive mode
@@ -25,9 +27,86 @@ class Lobby(db.Model):
     red_team_phrase = db.Column(db.String(100), nullable=True)  # Deprecated - kept for backwards compatibility
     blue_team_phrase = db.Column(db.String(100), nullable=True)  # Deprecated - kept for backwards compatibility
     round5_team = db.Column(db.String(10), nullable=True)  # Deprecated - kept for backwards compatibility
+    state_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bumped on every state change
+    last_activity_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # Last state change, for the reaper
     
     # Relationships
     participants = db.relationship('LobbyParticipant', backref='lobby', lazy=True, cascade='all, delete-orphan')
+    round_words = db.relationship('RoundWord', lazy=True, cascade='all, delete-orphan', order_by='RoundWord.id')
+    
+    # ORM updates only apply if state_version is unchanged since the row was
+    # loaded (StaleDataError otherwise); bump_version() supplies the new value
+    __mapper_args__ = {
+        'version_id_col': state_version,
+        'version_id_generator': False
+    }
+    
+    @classmethod
+    def query_with_state(cls):
+        """Lobby query that also loads everything to_dict() and LobbyState need.
+        
+        Participants, their guesses and the round's words come in one extra
+        SELECT each, however many players the lobby has.
+        """
+        return cls.query.options(
+            selectinload(cls.participants).selectinload(LobbyParticipant.guesses),
+            selectinload(cls.round_words)
+        )
+    
+    def bump_version(self):
+        """Mark the lobby state as changed so clients can tell it apart from cached copies"""
+        self.state_version = (self.state_version or 0) + 1
+        self.last_activity_at = datetime.utcnow()
+    
+    def clear_round_words(self):
+        """Forget the revealed words and every participant's guesses for the round"""
+        # Pending lobby changes are flushed once, with the version check, not before these
+        with db.session.no_autoflush:
+            RoundWord.query.filter_by(lobby_id=self.id).delete(synchronize_session=False)
+            Guess.query.filter_by(lobby_id=self.id).delete(synchronize_session=False)
+        # Both bulk deletes emptied these collections, no need to load them again
+        set_committed_value(self, 'round_words', [])
+        for participant in self.participants:
+            set_committed_value(participant, 'guesses', [])
+    
+    def reveal_words(self, words):
+        """Reveal words nobody has found yet, without an owner (one INSERT for all of them).
+        
+        Returns the words that were actually new.
+        """
+        revealed = {round_word.word for round_word in self.round_words}
+        new_words = []
+        for word in words:
+            if word not in revealed:
+                revealed.add(word)
+                new_words.append(word)
+        if not new_words:
+            return new_words
+        round_number = self.current_round or 0
+        db.session.execute(db.insert(RoundWord), [
+            {'lobby_id': self.id, 'round': round_number, 'word': word} for word in new_words
+        ])
+        # Show them in round_words without reading the table back
+        set_committed_value(self, 'round_words', list(self.round_words) + [
+            RoundWord(lobby_id=self.id, round=round_number, word=word) for word in new_words
+        ])
+        return new_words
+    
+    def assign_teams(self, red_team, blue_team):
+        """Put every participant on a team in one UPDATE; each list starts with its captain"""
+        red_ids = [p.id for p in red_team]
+        captain_ids = [red_team[0].id, blue_team[0].id]
+        db.session.execute(
+            db.update(LobbyParticipant)
+            .where(LobbyParticipant.lobby_id == self.id)
+            .values(team=db.case((LobbyParticipant.id.in_(red_ids), 'red'), else_='blue'),
+                    is_captain=LobbyParticipant.id.in_(captain_ids))
+            .execution_options(synchronize_session=False)
+        )
+        for team, members in (('red', red_team), ('blue', blue_team)):
+            for participant in members:
+                set_committed_value(participant, 'team', team)
+                set_committed_value(participant, 'is_captain', participant.id in captain_ids)
     
     def to_dict(self):
         image_data = None
@@ -36,18 +115,8 @@ class Lobby(db.Model):
                 image_data = json.loads(self.current_image_data)
             except:
                 pass
-        revealed = []
-        if self.revealed_words:
-            try:
-                revealed = json.loads(self.revealed_words)
-            except:
-                pass
-        word_owners_dict = {}
-        if self.word_owners:
-            try:
-                word_owners_dict = json.loads(self.word_owners)
-            except:
-                pass
+        revealed = [round_word.word for round_word in self.round_words]
+        word_owners_dict = {rw.word: rw.owner_name for rw in self.round_words if rw.owner_name}
         
         team_captains_list = []
         if self.team_captains:
@@ -74,7 +143,8 @@ class Lobby(db.Model):
             'game_phrase': self.game_phrase,
             'red_team_phrase': self.red_team_phrase,
             'blue_team_phrase': self.blue_team_phrase,
-            'round5_team': self.round5_team
+            'round5_team': self.round5_team,
+            'state_version': self.state_version or 0
         }
 
 
@@ -87,18 +157,16 @@ class LobbyParticipant(db.Model):
     player_name = db.Column(db.String(100), nullable=False)  # Display name for the game
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
     score = db.Column(db.Integer, default=0)  # Total score across all rounds
-    guessed_words = db.Column(db.Text)  # JSON array of words guessed this round
+    guessed_words = db.Column(db.Text)  # Deprecated - migrated to guesses
     player_color = db.Column(db.String(20), nullable=True)  # Color for Free-for-All mode
     team = db.Column(db.String(10), nullable=True)  # 'red' or 'blue' for Competitive mode
     is_captain = db.Column(db.Boolean, default=False)  # True if team captain in Competitive mode
     
+    # Relationships
+    guesses = db.relationship('Guess', lazy=True, cascade='all, delete-orphan', order_by='Guess.id')
+    
     def to_dict(self):
-        guessed = []
-        if self.guessed_words:
-            try:
-                guessed = json.loads(self.guessed_words)
-            except:
-                pass
+        guessed = [guess.word for guess in self.guesses]
         return {
             'id': self.id,
             'lobby_id': self.lobby_id,
@@ -111,3 +179,179 @@ class LobbyParticipant(db.Model):
             'is_captain': self.is_captain
         }
 
+
+class RoundWord(db.Model):
+    """A title word revealed in the current round of a lobby"""
+    __tablename__ = 'round_words'
+    __table_args__ = (
+        db.UniqueConstraint('lobby_id', 'round', 'word', name='uq_round_words_lobby_round_word'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    lobby_id = db.Column(db.String(10), db.ForeignKey('lobbies.id'), nullable=False)
+    round = db.Column(db.Integer, nullable=False)
+    word = db.Column(db.String(100), nullable=False)
+    owner_name = db.Column(db.String(100), nullable=True)  # Player who found it (None when revealed by forfeit/timer)
+
+
+class Guess(db.Model):
+    """A word a participant guessed in the current round"""
+    __tablename__ = 'guesses'
+    __table_args__ = (
+        db.UniqueConstraint('participant_id', 'round', 'word', name='uq_guesses_participant_round_word'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    participant_id = db.Column(db.Integer, db.ForeignKey('lobby_participants.id'), nullable=False)
+    lobby_id = db.Column(db.String(10), db.ForeignKey('lobbies.id'), nullable=False, index=True)
+    round = db.Column(db.Integer, nullable=False)
+    word = db.Column(db.String(100), nullable=False)
+    is_correct = db.Column(db.Boolean, default=False)
+
+
+class LobbyChange(db.Model):
+    """What changed in a lobby at one state_version, for clients applying deltas.
+    
+    Every version bump writes exactly one row, so a gap in the versions means
+    the client has to fetch the full state again. Rows from older rounds
+    are trimmed when a new round starts.
+    """
+    __tablename__ = 'lobby_changes'
+    __table_args__ = (
+        db.UniqueConstraint('lobby_id', 'version', name='uq_lobby_changes_lobby_version'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    lobby_id = db.Column(db.String(10), db.ForeignKey('lobbies.id'), nullable=False)
+    version = db.Column(db.Integer, nullable=False)  # Lobby.state_version after the change
+    round = db.Column(db.Integer, nullable=False)
+    changes = db.Column(db.Text, nullable=False)  # JSON list of change events
+    
+    @classmethod
+    def record(cls, lobby_id, version, round_number, changes):
+        """Add the change events of one write (in the writer's transaction)"""
+        db.session.execute(db.insert(cls).values(
+            lobby_id=lobby_id, version=version, round=round_number, changes=json.dumps(changes)))
+    
+    @classmethod
+    def trim(cls, lobby_id, before_round):
+        """Drop the rows of rounds before `before_round`"""
+        # Like clear_round_words, don't flush pending lobby changes ahead of the version check
+        with db.session.no_autoflush:
+            db.session.execute(
+                db.delete(cls)
+                .where(cls.lobby_id == lobby_id, cls.round < before_round)
+                .execution_options(synchronize_session=False)
+            )
+    
+    @classmethod
+    def since(cls, lobby_id, version):
+        """(version, events) pairs after `version`, oldest first, or None if some were trimmed"""
+        rows = db.session.execute(
+            db.select(cls.version, cls.changes)
+            .where(cls.lobby_id == lobby_id, cls.version > version)
+            .order_by(cls.version)
+        ).all()
+        if any(row.version != version + offset for offset, row in enumerate(rows, 1)):
+            return None
+        return [(row.version, json.loads(row.changes)) for row in rows]
+
+
+class ArchivedGame(db.Model):
+    """Final scores of a played game, kept after the reaper deletes its lobby"""
+    __tablename__ = 'archived_games'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    lobby_id = db.Column(db.String(10), nullable=False, index=True)  # Codes get reused, so not unique
+    status = db.Column(db.String(20))  # finished, ended or abandoned
+    game_mode = db.Column(db.String(20))
+    difficulty = db.Column(db.String(10))
+    rounds_played = db.Column(db.Integer, default=0)
+    shared_score = db.Column(db.Integer, default=0)
+    started_at = db.Column(db.DateTime)
+    ended_at = db.Column(db.DateTime)  # Last activity in the lobby
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    scores = db.Column(db.Text)  # JSON list of {player_name, score, player_color, team}, best first
+    
+    def leaderboard(self):
+        return json.loads(self.scores) if self.scores else []
+
+
+def migrate_round_words():
+    """Move revealed words, owners and guesses out of the old JSON columns.
+    
+    Rows are created for the lobby's current round and the JSON columns are
+    cleared afterwards, so running it again is a no-op.
+    """
+    participants = LobbyParticipant.query.filter(LobbyParticipant.guessed_words.isnot(None)).all()
+    for participant in participants:
+        guessed = json.loads(participant.guessed_words)
+        lobby = participant.lobby
+        owners = json.loads(lobby.word_owners) if lobby.word_owners else {}
+        for word in dict.fromkeys(guessed):
+            db.session.add(Guess(participant_id=participant.id, lobby_id=lobby.id,
+                                 round=lobby.current_round or 0, word=word,
+                                 is_correct=owners.get(word) == participant.player_name))
+        participant.guessed_words = None
+    
+    lobbies = Lobby.query.filter(db.or_(Lobby.revealed_words.isnot(None),
+                                        Lobby.word_owners.isnot(None))).all()
+    for lobby in lobbies:
+        revealed = json.loads(lobby.revealed_words) if lobby.revealed_words else []
+        owners = json.loads(lobby.word_owners) if lobby.word_owners else {}
+        for word in dict.fromkeys(revealed):
+            db.session.add(RoundWord(lobby_id=lobby.id, round=lobby.current_round or 0,
+                                     word=word, owner_name=owners.get(word)))
+        lobby.revealed_words = None
+        lobby.word_owners = None
+    
+    db.session.commit()
+
+
+def backfill_last_activity():
+    """Give lobbies from before last_activity_at existed their most recent known timestamp"""
+    db.session.execute(
+        db.update(Lobby)
+        .where(Lobby.last_activity_at.is_(None))
+        .values(last_activity_at=db.func.coalesce(Lobby.started_at, Lobby.created_at))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def upgrade_schema():
+    """Add columns and indexes that were introduced after a table was first created.
+
+    db.create_all() only creates missing tables, so existing deployments need
+    new nullable/defaulted columns added in place.
+    """
+    inspector = db.inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                if column.server_default is not None:
+                    ddl += f" DEFAULT '{column.server_default.arg}'"
+                conn.execute(db.text(ddl))
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(conn)
+
+
+def prepare_database():
+    """Create missing tables and bring existing ones up to date; safe to run on every start.
+
+    Needs an app context. gunicorn.conf.py runs it once through
+    `flask --app src.app prepare-db` before the workers start.
+    """
+    db.create_all()
+    upgrade_schema()
+    migrate_round_words()
+    backfill_last_activity()
@@ -0,0 +1,181 @@
+import atexit
+import contextvars
+import os
+import random
+import re
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+# The sampled request running right now, as seen from the signal handler
+_profiled = contextvars.ContextVar('profiled_request', default=None)
+
+
+def frame_name(code, module):
+    return f'{module}:{getattr(code, "co_qualname", code.co_name)}'
+
+
+def collapse(frame):
+    """`frame`'s stack, outermost call first, in the collapsed format flamegraph tools read"""
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame.f_code, frame.f_globals.get('__name__', '?')))
+        frame = frame.f_back
+    names.reverse()
+    return ';'.join(names)
+
+
+def parse_rates(spec):
+    """'game.submit_word=0.2,game.lobby_status=0.05' -> {'game.submit_word': 0.2, 'game.lobby_status': 0.05}"""
+    rates = {}
+    for item in (spec or '').split(','):
+        if '=' in item:
+            endpoint, rate = item.split('=', 1)
+            rates[endpoint.strip()] = float(rate)
+    return rates
+
+
+class RequestProfiler:
+    """Stack sampling of a fraction of requests, aggregated per Flask endpoint.
+
+    A sampled request is marked in a context variable. Once the first one
+    starts, a SIGPROF timer fires every `interval` seconds of CPU time until
+    the profiler is turned off again. The handler records the interrupted
+    stack if it belongs to a sampled request; under gevent that is whichever
+    greenlet was running, so concurrent requests don't mix. Only requests
+    handled in the main thread are sampled (the gevent and sync gunicorn
+    workers; not threaded servers).
+
+    Stacks go to <directory>/<endpoint>.<pid>.folded every `dump_interval`
+    seconds and at exit, ready for flamegraph.pl or speedscope. Files from
+    several workers can simply be concatenated. While `sample_rate` is 0
+    and no endpoint has a rate of its own, there is no timer and requests
+    pay one attribute check.
+    """
+
+    def __init__(self, directory, sample_rate=0.0, route_rates=None, interval=0.005, dump_interval=60):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.route_rates = dict(route_rates or {})
+        self.interval = interval
+        self.dump_interval = dump_interval
+        self.stacks = {}
+        self.requests = Counter()
+        self.supported = hasattr(signal, 'setitimer')
+        self._lock = threading.Lock()
+        self._last_dump = time.monotonic()
+        self._handler_installed = False
+        self._timer_running = False
+        self._any_thread = False
+        atexit.register(self.dump)
+
+    @property
+    def enabled(self):
+        return self.supported and (self.sample_rate > 0 or any(self.route_rates.values()))
+
+    def configure(self, sample_rate=None, route_rates=None):
+        """Change the rates at runtime (the admin toggle)"""
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if route_rates is not None:
+            self.route_rates = dict(route_rates)
+        if not self.enabled and self._timer_running:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            self._timer_running = False
+
+    def init_app(self, app):
+        # Under gevent every greenlet, whatever threading says, runs in the main thread
+        self._any_thread = _in_gevent()
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def stats(self):
+        # _sample adds endpoints without the lock; list() copies in one step it can't interrupt
+        routes = list(self.stacks.items())
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'sample_rate': self.sample_rate,
+                'route_rates': self.route_rates,
+                'directory': self.directory,
+                'routes': {endpoint: {'requests': self.requests[endpoint], 'samples': sum(stacks.values())}
+                           for endpoint, stacks in routes}
+            }
+
+    def folded(self, endpoint):
+        """Collapsed stacks sampled so far for `endpoint`"""
+        with self._lock:
+            stacks = dict(self.stacks.get(endpoint, {}))
+        return ''.join(f'{stack} {count}\n' for stack, count in sorted(stacks.items()))
+
+    def dump(self):
+        """Write every endpoint's stacks to its .folded file"""
+        with self._lock:
+            endpoints = list(self.stacks)
+            self._last_dump = time.monotonic()
+        if not endpoints:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for endpoint in endpoints:
+                name = re.sub(r'[^A-Za-z0-9_.-]', '_', endpoint)
+                path = os.path.join(self.directory, f'{name}.{os.getpid()}.folded')
+                with open(path + '.tmp', 'w') as f:
+                    f.write(self.folded(endpoint))
+                os.replace(path + '.tmp', path)
+        except OSError as e:
+            print(f'Error writing profiles: {str(e)}')
+
+    def _before_request(self):
+        if not self.enabled:
+            return
+        endpoint = request.endpoint or 'unmatched'
+        if random.random() >= self.route_rates.get(endpoint, self.sample_rate):
+            return
+        if not self._any_thread and threading.current_thread() is not threading.main_thread():
+            return
+        g._profile_token = _profiled.set(endpoint)
+        with self._lock:
+            self.requests[endpoint] += 1
+            if not self._timer_running:
+                self._start_timer()
+
+    def _teardown_request(self, exc):
+        token = g.pop('_profile_token', None)
+        if token is None:
+            return
+        try:
+            _profiled.reset(token)
+        except ValueError:
+            _profiled.set(None)
+        if time.monotonic() - self._last_dump >= self.dump_interval:
+            self.dump()
+
+    def _start_timer(self):
+        if not self._handler_installed:
+            signal.signal(signal.SIGPROF, self._sample)
+            self._handler_installed = True
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        self._timer_running = True
+
+    def _sample(self, signum, frame):
+        endpoint = _profiled.get()
+        if endpoint is None or frame is None:
+            return
+        stack = collapse(frame)
+        # No lock: a signal handler must not wait on one the interrupted code may hold
+        stacks = self.stacks.get(endpoint)
+        if stacks is None:
+            stacks = self.stacks[endpoint] = Counter()
+        stacks[stack] += 1
+
+
+def _in_gevent():
+    """True when threading is gevent-patched, so every greenlet runs in the main thread"""
+    # Only an already imported gevent can have patched anything; importing it costs ~20 ms
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
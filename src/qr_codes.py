@@ -0,0 +1,96 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+from .image_proxy import DiskLRU
+
+MIMETYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+
+def render_qr_code(data, fmt='png', box_size=10):
+    """Render a QR code as PNG or SVG bytes"""
+    # Imported on first use: qrcode pulls in PIL, which workers only need once
+    # a lobby's QR code isn't cached yet
+    import qrcode
+    import qrcode.image.svg
+
+    factory = qrcode.image.svg.SvgPathFillImage if fmt == 'svg' else None
+    qr = qrcode.QRCode(version=1, box_size=box_size, border=5, image_factory=factory)
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    buffer = io.BytesIO()
+    if fmt == 'svg':
+        qr.make_image().save(buffer)
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
+        img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class QRCodeCache:
+    """Rendered QR codes keyed by (data, format, box size).
+
+    Kept in a bounded in-memory LRU and, when `cache_dir` is set, also on
+    disk (least recently used files removed past `max_disk_bytes`) so
+    restarts and other workers on the same machine can reuse them.
+    """
+
+    def __init__(self, max_entries=256, cache_dir=None, max_disk_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._files = DiskLRU(cache_dir, max_disk_bytes) if cache_dir else None
+
+    def get(self, data, fmt='png', box_size=10):
+        """Return the cached image bytes, or None"""
+        key = (data, fmt, box_size)
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return image
+        image = self._read_file(key)
+        if image is not None:
+            self._remember(key, image)
+            with self._lock:
+                self.hits += 1
+        return image
+
+    def get_or_render(self, data, fmt='png', box_size=10):
+        image = self.get(data, fmt, box_size)
+        if image is not None:
+            return image
+        with self._lock:
+            self.misses += 1
+        image = render_qr_code(data, fmt, box_size)
+        key = (data, fmt, box_size)
+        self._remember(key, image)
+        self._write_file(key, image)
+        return image
+
+    def _remember(self, key, image):
+        with self._lock:
+            self._entries[key] = image
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _file_name(self, key):
+        data, fmt, box_size = key
+        digest = hashlib.sha256(f'{box_size}:{data}'.encode()).hexdigest()
+        return f'{digest}.{fmt}'
+
+    def _read_file(self, key):
+        if self._files is None:
+            return None
+        return self._files.get(self._file_name(key))
+
+    def _write_file(self, key, image):
+        if self._files is not None:
+            self._files.put(self._file_name(key), image)
@@ -0,0 +1,285 @@
+import contextvars
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Upstream answers worth retrying; other 4xx won't change on a second try
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ShutterstockError(Exception):
+    """Raised when a search can't be answered by the API or the cache"""
+
+
+class CircuitOpen(ShutterstockError):
+    """Raised instead of calling the API while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Stops calls to a failing upstream for a while.
+
+    After `failure_threshold` consecutive failed calls the circuit opens and
+    calls are refused for `reset_timeout` seconds. Then a single trial call is
+    let through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        """Whether a call may go to the upstream right now"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class ShutterstockClient:
+    """Shared Shutterstock search client.
+
+    One keep-alive connection pool for every request, connect/read timeouts,
+    a few retries with jittered exponential backoff, and a circuit breaker.
+    Recent results are remembered per query so searches can still be
+    answered from them while the circuit is open. search_many() runs several
+    searches at once, at most `max_concurrency` across the whole process.
+    `on_call(outcome, seconds)` is told about every HTTP call (outcome is the
+    status code, 'timeout' or 'error') and every short-circuited search
+    ('circuit_open', seconds None).
+    """
+
+    def __init__(self, base_url, access_token, connect_timeout=3.05, read_timeout=10,
+                 retries=2, backoff=0.2, pool_size=10, failure_threshold=5, reset_timeout=30,
+                 cached_queries=64, cached_images_per_query=50, max_concurrency=4, on_call=None):
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.on_call = on_call
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.cached_queries = cached_queries
+        self.cached_images_per_query = cached_images_per_query
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.access_token = access_token
+        self.pool_size = pool_size
+        self.calls = 0
+        self.failures = 0
+        self.retried = 0
+        self.short_circuited = 0
+        self.served_from_cache = 0
+        self._latencies = deque(maxlen=500)
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._session = None
+
+    def search(self, query, per_page=1, allow_cached=True):
+        """Return the raw `data` list of an image search.
+
+        While the circuit is open the answer comes from recently seen images
+        (for this query if possible), unless `allow_cached` is False.
+        """
+        if not self.breaker.allow():
+            with self._lock:
+                self.short_circuited += 1
+            if self.on_call:
+                self.on_call('circuit_open', None)
+            if allow_cached:
+                cached = self._cached_images(query, per_page)
+                if cached:
+                    return cached
+            raise CircuitOpen('Shutterstock is unavailable, try again shortly')
+
+        import requests
+
+        # Every call the breaker let through must end in record_success() or
+        # record_failure(), or a half-open trial would keep the circuit shut
+        healthy = False
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    with self._lock:
+                        self.retried += 1
+                    time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+                try:
+                    response = self._get(query, per_page)
+                except requests.RequestException as e:
+                    error = ShutterstockError(f'API request failed: {str(e)}')
+                    continue
+                if response.status_code in RETRY_STATUSES:
+                    error = ShutterstockError(f'API request failed: {response.status_code}')
+                    continue
+                if not response.ok:
+                    # Our request is wrong (bad token, bad query); not an outage
+                    healthy = True
+                    raise ShutterstockError(f'API request failed: {response.status_code}')
+                try:
+                    images = response.json().get('data') or []
+                except (ValueError, AttributeError):
+                    # e.g. a 200 HTML maintenance page from a proxy in front of the API
+                    error = ShutterstockError('API request failed: response is not a search result')
+                    continue
+                healthy = True
+                self._remember(query, images)
+                return images
+
+            with self._lock:
+                self.failures += 1
+            raise error
+        finally:
+            if healthy:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+    def search_many(self, searches, allow_cached=True):
+        """Run (query, per_page) searches concurrently.
+
+        Yields (query, images, error) as each search finishes, fastest first;
+        error is None on success. Searches not started yet are cancelled once
+        the caller stops iterating.
+        """
+        executor = self._get_executor()
+        # Each search runs in a copy of the caller's context, so on_call sees its request
+        futures = {executor.submit(contextvars.copy_context().run, self.search, query, per_page, allow_cached): query
+                   for query, per_page in searches}
+        try:
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], [], e
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                'calls': self.calls,
+                'failures': self.failures,
+                'retries': self.retried,
+                'short_circuited': self.short_circuited,
+                'served_from_cache': self.served_from_cache,
+                'circuit': self.breaker.state,
+                'latency_ms': {
+                    'p50': _percentile(latencies, 50) * 1000,
+                    'p95': _percentile(latencies, 95) * 1000,
+                    'p99': _percentile(latencies, 99) * 1000,
+                    'max': (latencies[-1] if latencies else 0.0) * 1000
+                }
+            }
+
+    def _get_executor(self):
+        # Created on first use so forked workers each start their own threads
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                    thread_name_prefix='shutterstock')
+            return self._executor
+
+    def _get_session(self):
+        # Created on the first search, which is also when requests gets imported
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                session.headers.update({
+                    'Authorization': f'Bearer {self.access_token}',
+                    'Content-Type': 'application/json'
+                })
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session = session
+            return self._session
+
+    def _get(self, query, per_page):
+        import requests
+
+        session = self._get_session()
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            response = session.get(
+                f'{self.base_url}/images/search',
+                params={
+                    'query': query,
+                    'sort': 'random',
+                    'per_page': per_page,
+                    'view': 'full'
+                },
+                timeout=self.timeout
+            )
+            outcome = str(response.status_code)
+            return response
+        except requests.Timeout:
+            outcome = 'timeout'
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            with self._lock:
+                self.calls += 1
+                self._latencies.append(seconds)
+            if self.on_call:
+                self.on_call(outcome, seconds)
+
+    def _remember(self, query, images):
+        if not images:
+            return
+        with self._lock:
+            cached = self._recent.pop(query, [])
+            cached = (images + cached)[:self.cached_images_per_query]
+            self._recent[query] = cached
+            while len(self._recent) > self.cached_queries:
+                self._recent.popitem(last=False)
+
+    def _cached_images(self, query, per_page):
+        with self._lock:
+            candidates = self._recent.get(query)
+            if not candidates:
+                candidates = [image for images in self._recent.values() for image in images]
+            if not candidates:
+                return []
+            self.served_from_cache += 1
+            return random.sample(candidates, min(per_page, len(candidates)))
+
+
+def _percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
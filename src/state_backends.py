@@ -0,0 +1,176 @@
+import json
+import threading
+
+from .events import LobbyEventBroker
+from .lobby_state import LobbyState, LobbyStateCache
+from .models import Lobby
+
+
+class StateBackend:
+    """Where decoded lobby state lives between requests and how changes are announced.
+
+    The database stays the source of truth; a backend only decides what can
+    be reused without reloading the rows, and how stream/long-poll clients
+    in this process hear about changes made by any process.
+    """
+
+    name = None
+
+    def __init__(self):
+        self.broker = LobbyEventBroker()
+
+    def get(self, lobby_id):
+        return None
+
+    def put(self, state):
+        pass
+
+    def invalidate(self, lobby_id):
+        pass
+
+    def subscribe(self, lobby_id):
+        return self.broker.subscribe(lobby_id)
+
+    def unsubscribe(self, lobby_id, subscriber):
+        self.broker.unsubscribe(lobby_id, subscriber)
+
+    def wants_events(self, lobby_id):
+        """Whether anyone could be listening, so payloads are only built when needed"""
+        return self.broker.has_subscribers(lobby_id)
+
+    def publish(self, lobby_id, version, body):
+        self.broker.publish(lobby_id, (version, body))
+
+    def load(self, lobby_id, version=None):
+        """Return the lobby state, loading it from the database on a miss.
+
+        When `version` is given, a stored entry with a different version is
+        treated as stale and reloaded.
+        """
+        state = self.get(lobby_id)
+        if state is not None and (version is None or state.version == version):
+            return state
+        lobby = Lobby.query_with_state().filter_by(id=lobby_id).first()
+        if not lobby:
+            self.invalidate(lobby_id)
+            return None
+        return self.refresh(lobby)
+
+    def refresh(self, lobby):
+        """Rebuild the stored state from a committed Lobby row"""
+        state = LobbyState.from_lobby(lobby)
+        self.store(state)
+        return state
+
+    def store(self, state):
+        """Keep a state after a change, dropping it once the game is over"""
+        if state.is_closed:
+            self.invalidate(state.lobby_id)
+        else:
+            self.put(state)
+
+
+class SQLAlchemyStateBackend(StateBackend):
+    """No caching: every request decodes the lobby from its rows.
+
+    Change notifications only reach clients served by the same process.
+    """
+
+    name = 'sqlalchemy'
+
+
+class MemoryStateBackend(StateBackend):
+    """Per-process LRU cache of decoded lobbies (single worker deployments)"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries=512, idle_ttl=600):
+        super().__init__()
+        self.cache = LobbyStateCache(max_entries=max_entries, idle_ttl=idle_ttl)
+
+    def get(self, lobby_id):
+        return self.cache.get(lobby_id)
+
+    def put(self, state):
+        self.cache.put(state)
+
+    def invalidate(self, lobby_id):
+        self.cache.invalidate(lobby_id)
+
+
+class RedisStateBackend(StateBackend):
+    """Decoded lobbies and change notifications shared through Redis.
+
+    Every worker and node pointing at the same Redis sees the same cached
+    state and receives every lobby change over pub/sub, so host and phones
+    don't need to land on the same process.
+    """
+
+    name = 'redis'
+    state_prefix = 'lobby-state:'
+    channel_prefix = 'lobby-events:'
+
+    def __init__(self, redis_url=None, client=None, idle_ttl=600):
+        super().__init__()
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(redis_url)
+        self.client = client
+        self.idle_ttl = idle_ttl
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def get(self, lobby_id):
+        raw = self.client.get(self.state_prefix + lobby_id)
+        if raw is None:
+            return None
+        return LobbyState.from_payload(json.loads(raw))
+
+    def put(self, state):
+        self.client.set(self.state_prefix + state.lobby_id, json.dumps(state.to_payload()), ex=self.idle_ttl)
+
+    def invalidate(self, lobby_id):
+        self.client.delete(self.state_prefix + lobby_id)
+
+    def subscribe(self, lobby_id):
+        self._start_listener()
+        return super().subscribe(lobby_id)
+
+    def wants_events(self, lobby_id):
+        # Subscribers may be connected to any worker
+        return True
+
+    def publish(self, lobby_id, version, body):
+        # Delivered back to this process by the listener like everyone else's
+        self.client.publish(self.channel_prefix + lobby_id, f'{version}:{body}')
+
+    def _start_listener(self):
+        with self._listener_lock:
+            if self._listener is not None:
+                return
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            pubsub.psubscribe(**{self.channel_prefix + '*': self._dispatch})
+            self._listener = pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def _dispatch(self, message):
+        channel = message['channel']
+        data = message['data']
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        if isinstance(data, bytes):
+            data = data.decode()
+        version, body = data.split(':', 1)
+        self.broker.publish(channel[len(self.channel_prefix):], (int(version), body))
+
+
+def create_state_backend(name, redis_url=None, max_entries=512, idle_ttl=600):
+    """Build the backend selected by STATE_BACKEND"""
+    if name == 'memory':
+        return MemoryStateBackend(max_entries=max_entries, idle_ttl=idle_ttl)
+    if name == 'sqlalchemy':
+        return SQLAlchemyStateBackend()
+    if name == 'redis':
+        if not redis_url:
+            raise ValueError('REDIS_URL is required for the redis state backend')
+        return RedisStateBackend(redis_url=redis_url, idle_ttl=idle_ttl)
+    raise ValueError(f'Unknown state backend: {name}')
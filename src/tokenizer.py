@@ -0,0 +1,63 @@
+import functools
+import re
+import unicodedata
+
+# Words too common to be worth guessing
+STOP_WORDS = frozenset({
+    'the', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'from', 'up',
+    'about', 'into', 'through', 'during', 'before', 'after', 'above', 'below', 'between', 'among',
+    'under', 'over', 'around', 'near', 'far', 'here', 'there', 'where', 'when', 'why', 'how',
+    'what', 'who', 'which', 'that', 'this', 'these', 'those', 'some', 'any', 'all', 'both', 'each',
+    'every', 'other', 'another', 'such', 'same', 'different', 'new', 'old', 'good', 'bad', 'big',
+    'small', 'large', 'little', 'long', 'short', 'high', 'low', 'great', 'first', 'last', 'next',
+    'previous', 'main', 'major', 'minor', 'important', 'necessary', 'possible', 'available',
+    'present', 'current', 'recent', 'early', 'late', 'young', 'mature', 'fresh', 'clean', 'dirty',
+    'hot', 'cold', 'warm', 'cool', 'dry', 'wet', 'full', 'empty', 'open', 'closed', 'free', 'busy',
+    'ready', 'finished', 'complete', 'partial', 'total', 'whole', 'half', 'quarter', 'double',
+    'single', 'multiple', 'several', 'many', 'few', 'most', 'least', 'more', 'less', 'much',
+    'little', 'enough', 'too', 'very', 'quite', 'rather', 'pretty', 'fairly', 'almost', 'nearly',
+    'about', 'around', 'approximately', 'exactly', 'precisely', 'just', 'only', 'even', 'still',
+    'yet', 'already', 'soon', 'now', 'then', 'today', 'yesterday', 'tomorrow', 'always', 'never',
+    'sometimes', 'often', 'usually', 'rarely', 'hardly', 'barely', 'scarcely', 'extremely',
+    'highly', 'completely', 'totally', 'entirely', 'fully', 'partly', 'partially', 'mostly',
+    'mainly', 'primarily', 'especially', 'particularly', 'specifically', 'generally', 'normally',
+    'typically', 'commonly', 'frequently', 'regularly', 'occasionally', 'seldom', 'forever',
+    'permanently', 'temporarily', 'briefly', 'quickly', 'slowly', 'suddenly', 'gradually',
+    'immediately', 'instantly', 'eventually', 'finally', 'ultimately', 'initially', 'originally',
+    'previously', 'formerly', 'lately', 'presently', 'nowadays', 'tonight', 'whose', 'whom'
+})
+
+_PUNCTUATION = re.compile(r'[^\w\s]')
+
+
+def extract_words(title):
+    """Extract guessable words from title"""
+    return list(_tokenize(title))
+
+
+def extract_words_batch(titles):
+    """extract_words() for a list of titles"""
+    return [list(_tokenize(title)) for title in titles]
+
+
+@functools.lru_cache(maxsize=4096)
+def _tokenize(title):
+    # Replace punctuation with spaces and split
+    words = _PUNCTUATION.sub(' ', title.lower()).split()
+    # Filter: length >= 3 and not common word
+    return tuple(w for w in words if len(w) >= 3 and w not in STOP_WORDS)
+
+
+@functools.lru_cache(maxsize=8192)
+def normalize_word(word):
+    """Fold a word to the form guesses are matched on: no case, no accents, singular"""
+    word = unicodedata.normalize('NFKD', word.casefold())
+    word = ''.join(c for c in word if not unicodedata.combining(c))
+    # Plurals: puppies -> puppy, boxes -> box, trees -> tree (glass, bus, iris stay)
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith(('sses', 'shes', 'ches', 'xes', 'zes')):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
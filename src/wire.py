@@ -0,0 +1,129 @@
+import functools
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # in requirements.txt; without it responses are gzip only
+    brotli = None
+
+# Media type phones ask for to get the compact lobby payload
+COMPACT_MIMETYPE = 'application/vnd.stockphotofrenzy.compact+json'
+
+# What players' phones read from a lobby payload; everything else
+# (deprecated phrase columns, timestamps, the image and its title, guessed
+# words) is only needed by the host screen
+COMPACT_LOBBY_FIELDS = ('id', 'status', 'game_mode', 'difficulty', 'current_round', 'active_team',
+                        'shared_score', 'state_version')
+COMPACT_PARTICIPANT_FIELDS = ('player_name', 'score', 'team', 'is_captain', 'player_color')
+
+
+def wants_compact(request):
+    """Whether the client negotiated the compact payload (Accept header, or ?view=compact for EventSource)"""
+    if request.args.get('view') == 'compact':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', COMPACT_MIMETYPE]) == COMPACT_MIMETYPE
+
+
+def compact_payload(payload):
+    """The /status payload trimmed to the fields phones use, under the same keys"""
+    lobby = payload['lobby']
+    return {
+        'lobby': {key: lobby[key] for key in COMPACT_LOBBY_FIELDS},
+        'participants': [{key: p[key] for key in COMPACT_PARTICIPANT_FIELDS} for p in payload['participants']]
+    }
+
+
+@functools.lru_cache(maxsize=256)
+def compact_body(full_body):
+    """Compact JSON for a full payload body, e.g. one received from the event broker.
+
+    Every phone streaming a lobby gets the same message, so it is only
+    converted once.
+    """
+    return encode_json(compact_payload(json.loads(full_body)))
+
+
+def encode_json(payload):
+    return json.dumps(payload, separators=(',', ':'))
+
+
+def is_json(mimetype):
+    return mimetype == 'application/json' or mimetype.endswith('+json')
+
+
+class ResponseCompressor:
+    """Brotli/gzip for JSON responses, negotiated through Accept-Encoding.
+
+    Bodies that carry an ETag (lobby status) are identical for every client
+    polling the same lobby version, so their compressed form is kept in a
+    small LRU and compressed only once. Entries are keyed by a digest of the
+    body itself, so a cached copy can never stand in for different bytes.
+    """
+
+    def __init__(self, min_size=512, max_entries=512, gzip_level=6, brotli_quality=5):
+        self.min_size = min_size
+        self.max_entries = max_entries
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @property
+    def encodings(self):
+        return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def choose_encoding(self, accept_encodings):
+        for encoding in self.encodings:
+            if accept_encodings[encoding]:
+                return encoding
+        return None
+
+    def compress(self, body, encoding):
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    def apply(self, request, response):
+        """Compress `response` in place if the client and the response allow it"""
+        if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+                or response.status_code in (204, 304) or 'Content-Encoding' in response.headers
+                or not is_json(response.mimetype)):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        body = response.get_data()
+        if len(body) < self.min_size:
+            return response
+
+        etag, weak = response.get_etag()
+        key = (hashlib.blake2b(body, digest_size=16).digest(), encoding) if etag else None
+        compressed = self._get(key) if key else None
+        if compressed is None:
+            compressed = self.compress(body, encoding)
+            if key:
+                self._put(key, compressed)
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            # Same representation, different bytes: the validator can only stay weakly equal
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _get(self, key):
+        with self._lock:
+            compressed = self._entries.get(key)
+            if compressed is not None:
+                self._entries.move_to_end(key)
+            return compressed
+
+    def _put(self, key, compressed):
+        with self._lock:
+            self._entries[key] = compressed
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
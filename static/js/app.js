@@ -3,3 +3,19 @@
 
 // Add any shared JavaScript functions here
 
+const supportsWebp = document.createElement('canvas').toDataURL('image/webp').startsWith('data:image/webp');
+
+// Resized copy of a stock image for this viewport, served by /img
+function imageVariantUrl(url) {
+    const variant = window.innerWidth <= 768 ? 'mobile' : 'host';
+    return `/img/${variant}.${supportsWebp ? 'webp' : 'jpg'}?src=${encodeURIComponent(url)}`;
+}
+
+// Show a stock image through the proxy, falling back to the original URL
+function showStockImage(img, url) {
+    img.onerror = () => {
+        img.onerror = null;
+        img.src = url;
+    };
+    img.src = imageVariantUrl(url);
+}